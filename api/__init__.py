@@ -0,0 +1 @@
+# API package initializer
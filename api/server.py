@@ -0,0 +1,568 @@
+"""HTTP JSON API for the service workflow.
+
+Field tablets run the workflow steps here instead of through Streamlit
+reruns. Every step calls the same functions as the pages
+(database/workflow.py), so the rollups, machine registry, search index,
+event log and shared cache stay in step whichever way a change comes in.
+Customer and service report writes go through the write journal. The
+response says whether the write had reached the database within
+WRITE_WAIT_SECONDS: 201/200 if it had, 202 if it is still queued on this
+server.
+
+Routes (JSON bodies; dates as ISO 8601 strings):
+    GET   /api/customers?limit=50&after=<id>&step=<status>&done=true
+          Keyset pages in _id order; "next" is the `after` of the next page
+    POST  /api/customers                            {name, contact_name, contact_phone, machine_count}
+    GET   /api/customers/<id>
+    PATCH /api/customers/<id>                       any of the fields above
+    POST  /api/customers/<id>/vendor-registration   {"done": true}
+    POST  /api/customers/<id>/mrn                   MRN form fields
+    PUT   /api/customers/<id>/service-report        report fields (as stored)
+    PUT   /api/customers/<id>/telecontroller?filename=x.pdf   raw PDF body
+    GET   /api/dashboard
+    POST  /api/bulk                                 {"operations": [{"op", "customer_id", "body"}]}
+    GET   /api/sync?token=<token>&limit=1000        Changes since the token (database/sync.py)
+    POST  /api/sync                                 {"edits": [...]} made offline
+    GET   /metrics
+
+GET responses carry an ETag and answer If-None-Match with 304. Customer
+list pages are cached with the customers write version in the shared cache
+(utils/shared_cache.py), together with their gzipped form, so a repeated
+page costs neither a query nor a compression. Other responses over 1 KB are
+gzipped when the client accepts it. Request bodies may be gzipped
+(Content-Encoding: gzip), which is how sync clients send their edits.
+
+Blocking database calls run on a thread pool. With --processes 0 the server
+forks one process per CPU, all sharing the listening socket.
+
+Usage:
+    python -m api.server [--port 8600] [--address 0.0.0.0] [--processes 1]
+"""
+import argparse
+import asyncio
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.httpserver
+import tornado.netutil
+import tornado.process
+import tornado.web
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+
+from database import sync, workflow, writeback
+from database.connection import customers, mrns, service_reports
+from utils import metrics, shared_cache
+
+API_PORT = int(os.environ.get("API_PORT", "8600"))
+
+# Bearer token clients must send; empty disables the check (e.g. behind an authenticating proxy)
+API_TOKEN = os.environ.get("API_TOKEN", "")
+
+# Threads running database calls, per process
+API_THREADS = int(os.environ.get("API_THREADS", "32"))
+
+# Seconds a write request waits for its journaled write to reach the database
+WRITE_WAIT_SECONDS = float(os.environ.get("API_WRITE_WAIT_SECONDS", "2.0"))
+
+# Customers per list page (default and maximum)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Operations per bulk request
+BULK_LIMIT = 100
+
+# Seconds a process reuses its dashboard response (tablets poll it; the rollups change constantly)
+DASHBOARD_SECONDS = 1.0
+
+# Smallest body worth gzipping
+GZIP_MIN_BYTES = 1024
+
+# Customer fields returned by the list
+LIST_FIELDS = {"name": 1, "contact_name": 1, "contact_phone": 1, "machine_count": 1, "status": 1,
+               "created_at": 1, "mrn_code": 1, "sr_code": 1}
+
+# Workflow steps the list can filter on
+STEPS = tuple(workflow.new_customer_status())
+
+# Report fields set by the server only
+REPORT_SERVER_FIELDS = ("_id", "customer_id", "sr_code", "code", "created_at", "updated_at")
+
+_executor = ThreadPoolExecutor(max_workers=API_THREADS, thread_name_prefix="api")
+_dashboard = (0.0, None)    # (expires at, response value)
+
+
+class ApiError(tornado.web.HTTPError):
+    """A client error answered with {"error": message}."""
+
+    def __init__(self, status, message):
+        super().__init__(status, reason=None)
+        self.message = message
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    """Compact JSON bytes; ObjectIds as strings and dates as ISO 8601."""
+    return json.dumps(value, default=_json_default, separators=(",", ":")).encode()
+
+
+def _object_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ApiError(404, "customer not found")
+
+
+def _find_customer(customer_id, projection=None):
+    """The customer, after the writes this server has journaled are applied."""
+    from database.temporary import not_temporary
+
+    query = not_temporary({"_id": _object_id(customer_id)})
+    customer = customers.find_one(query, projection)
+    if customer is None and writeback.flush(timeout=WRITE_WAIT_SECONDS):
+        # It may have been created by a write that was still queued
+        customer = customers.find_one(query, projection)
+    if customer is None:
+        raise ApiError(404, "customer not found")
+    return customer
+
+
+def _customer_fields(body, new):
+    """Validated CUSTOMER_FIELDS of a request body."""
+    fields = {}
+    for field in workflow.CUSTOMER_FIELDS:
+        if field not in body:
+            continue
+        value = body[field]
+        if field == "machine_count":
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ApiError(400, "machine_count must be a whole number of at least 0")
+        elif not isinstance(value, str):
+            raise ApiError(400, f"{field} must be a string")
+        else:
+            value = value.strip()
+        fields[field] = value
+    # An update may leave required fields out, but not blank them
+    required = [field for field in workflow.REQUIRED_CUSTOMER_FIELDS if new or field in fields]
+    missing = [field for field in required if not fields.get(field)]
+    if missing:
+        raise ApiError(400, f"Fill in the {', '.join(missing)}")
+    if not fields:
+        raise ApiError(400, "no customer fields given")
+    return fields
+
+
+def _written(status, seq, value):
+    """Response to a journaled write: `status` if it was applied in time, else 202."""
+    applied = writeback.flush(seq, timeout=WRITE_WAIT_SECONDS)
+    return (status if applied else 202), dict(value, applied=applied)
+
+
+# Workflow operations, shared by the routes and /api/bulk. Each takes the
+# customer id (None to create one) and the JSON body, and returns
+# (HTTP status, response value). They block, so they run on the thread pool.
+
+def create_customer(customer_id, body):
+    customer_id, seq = workflow.save_customer(_customer_fields(body, new=True))
+    return _written(201, seq, {"id": customer_id})
+
+
+def update_customer(customer_id, body):
+    fields = _customer_fields(body, new=False)
+    # The search grams are built from all the fields, so the save sends all of them like the page
+    customer = _find_customer(customer_id, {field: 1 for field in workflow.CUSTOMER_FIELDS})
+    customer.pop("_id")
+    customer_id, seq = workflow.save_customer(dict(customer, **fields), customer_id)
+    return _written(200, seq, {"id": customer_id})
+
+
+def register_vendor(customer_id, body):
+    done = body.get("done", True)
+    if not isinstance(done, bool):
+        raise ApiError(400, "done must be true or false")
+    _find_customer(customer_id, {"_id": 1})
+    if workflow.set_vendor_registered(customer_id, done) is None:
+        raise ApiError(404, "customer not found")
+    return 200, {"id": customer_id, "vendor_registered": done}
+
+
+def generate_mrn(customer_id, body):
+    _find_customer(customer_id, {"_id": 1})
+    existing = mrns.find_one({"customer_id": customer_id}, {"mrn_code": 1})
+    if existing:
+        raise ApiError(409, f"MRN already generated: {existing['mrn_code']}")
+    form_data = {field: value for field, value in body.items() if field not in ("_id", "customer_id", "code")}
+    mrn = workflow.create_mrn(customer_id, form_data)
+    return 201, {"id": customer_id, "mrn_code": mrn["mrn_code"]}
+
+
+def save_report(customer_id, body):
+    _find_customer(customer_id, {"_id": 1})
+    try:
+        report = workflow.parse_report_dates({field: value for field, value in body.items()
+                                              if field not in REPORT_SERVER_FIELDS})
+    except ValueError as error:
+        raise ApiError(400, str(error))
+    # One report per customer, as on the service report page
+    existing = service_reports.find_one({"customer_id": customer_id}, {"_id": 1})
+    report_id, seq = workflow.save_service_report(customer_id, report, existing["_id"] if existing else None)
+    status, value = _written(200 if existing else 201, seq, {"id": customer_id, "report_id": report_id})
+    if value["applied"]:
+        saved = service_reports.find_one({"_id": report_id}, {"sr_code": 1})
+        value["sr_code"] = saved.get("sr_code") if saved else None
+    return status, value
+
+
+OPERATIONS = {
+    "create_customer": create_customer,
+    "update_customer": update_customer,
+    "vendor_registration": register_vendor,
+    "mrn": generate_mrn,
+    "service_report": save_report,
+}
+
+
+def run_bulk(body):
+    """Run a list of operations in order; "$<n>" as customer_id is the id created by operation n."""
+    operations = body.get("operations")
+    if not isinstance(operations, list) or not operations:
+        raise ApiError(400, "operations must be a non-empty list")
+    if len(operations) > BULK_LIMIT:
+        raise ApiError(400, f"at most {BULK_LIMIT} operations per request")
+    results = []
+    for operation in operations:
+        try:
+            if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+                raise ApiError(400, f"op must be one of {', '.join(OPERATIONS)}")
+            customer_id = operation.get("customer_id")
+            if isinstance(customer_id, str) and customer_id.startswith("$"):
+                reference = customer_id[1:]
+                if not reference.isdigit() or int(reference) >= len(results) or "id" not in results[int(reference)]["body"]:
+                    raise ApiError(400, f"{customer_id} does not name an earlier operation that returned an id")
+                customer_id = results[int(reference)]["body"]["id"]
+            operation_body = operation.get("body") or {}
+            if not isinstance(operation_body, dict):
+                raise ApiError(400, "body must be an object")
+            status, value = OPERATIONS[operation["op"]](customer_id, operation_body)
+        except ApiError as error:
+            status, value = error.status_code, {"error": error.message}
+        results.append({"status": status, "body": value})
+    return 200, {"results": results}
+
+
+def customer_page(after, limit, step, done):
+    """One list page: (JSON bytes, gzipped bytes or None)."""
+    from database.temporary import not_temporary
+
+    query = {}
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except InvalidId:
+            raise ApiError(400, "after must be a customer id")
+    if step:
+        query[f"status.{step}"] = True if done else {"$ne": True}
+    rows = list(customers.find(not_temporary(query), LIST_FIELDS).sort("_id", 1).limit(limit + 1))
+    next_after = rows[limit - 1]["_id"] if len(rows) > limit else None
+    body = dumps({"items": rows[:limit], "next": next_after})
+    return body, gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+
+
+def customer_document(customer_id):
+    customer = _find_customer(customer_id, {"search_grams": 0, writeback.WRITES: 0})
+    customer.pop("telecontroller_file_info", None)
+    return customer
+
+
+def dashboard():
+    global _dashboard
+    expires, value = _dashboard
+    if time.monotonic() < expires:
+        return value
+    statistics = workflow.overview()
+    if statistics is None:
+        value = {"customers": None, "machines": None, "completion": None}
+    else:
+        total_customers, total_machines, completion = statistics
+        value = {"customers": total_customers, "machines": total_machines, "completion": completion}
+    _dashboard = (time.monotonic() + DASHBOARD_SECONDS, value)
+    return value
+
+
+def _log_request(handler):
+    # Every request is in api_request_seconds; only failures are logged
+    if handler.get_status() >= 500:
+        import logging
+        logging.getLogger("tornado.access").error("%d %s %.2fms", handler.get_status(),
+                                                  handler._request_summary(), 1000 * handler.request.request_time())
+
+
+class ApiHandler(tornado.web.RequestHandler):
+    """JSON responses and errors, the token check, and the thread pool."""
+
+    route = None
+
+    def prepare(self):
+        if API_TOKEN and self.request.headers.get("Authorization") != f"Bearer {API_TOKEN}":
+            raise ApiError(401, "missing or wrong API token")
+
+    async def call(self, function, *args):
+        """Run a blocking function on the thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(_executor, function, *args)
+
+    def json_body(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise ApiError(400, "body is not valid JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "body must be a JSON object")
+        return body
+
+    def send(self, status, value):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(dumps(value))
+
+    async def run_operation(self, name, customer_id=None):
+        body = self.json_body()
+        status, value = await self.call(OPERATIONS[name], customer_id, body)
+        self.send(status, value)
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None))[1]
+        message = error.message if isinstance(error, ApiError) else self._reason
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(dumps({"error": message}))
+
+    def log_exception(self, typ, value, tb):
+        # Client errors are answered, not logged
+        if not isinstance(value, ApiError):
+            super().log_exception(typ, value, tb)
+
+    def on_finish(self):
+        metrics.api_request_seconds.observe(self.request.request_time(),
+                                            route=self.route or type(self).__name__,
+                                            status=str(self.get_status()))
+
+
+class CustomersHandler(ApiHandler):
+    route = "customers"
+
+    async def get(self):
+        try:
+            limit = int(self.get_query_argument("limit", str(PAGE_SIZE)))
+        except ValueError:
+            raise ApiError(400, "limit must be a number")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        after = self.get_query_argument("after", "")
+        step = self.get_query_argument("step", "")
+        if step and step not in STEPS:
+            raise ApiError(400, f"step must be one of {', '.join(STEPS)}")
+        done = self.get_query_argument("done", "true").lower() not in ("false", "0", "no")
+
+        # Pages stay valid until a customer is written, so the ETag is known before any query
+        key = f"{after}/{limit}/{step}/{done}"
+        version = shared_cache.version(shared_cache.CUSTOMERS)
+        self.set_header("Etag", f'"c{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"')
+        if self.check_etag_header():
+            self.set_status(304)
+            return self.finish()
+
+        body, compressed = shared_cache.get_or_compute(
+            "api", f"customers/{key}",
+            lambda: customer_page(after, limit, step, done), version=version)
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.set_header("Vary", "Accept-Encoding")
+        if compressed is not None and "gzip" in self.request.headers.get("Accept-Encoding", ""):
+            self.set_header("Content-Encoding", "gzip")
+            body = compressed
+        self.finish(body)
+
+    async def post(self):
+        await self.run_operation("create_customer")
+
+
+class CustomerHandler(ApiHandler):
+    route = "customer"
+
+    async def get(self, customer_id):
+        # Tornado adds an ETag of the body and answers If-None-Match itself
+        self.send(200, await self.call(customer_document, customer_id))
+
+    async def patch(self, customer_id):
+        await self.run_operation("update_customer", customer_id)
+
+
+class VendorRegistrationHandler(ApiHandler):
+    route = "vendor_registration"
+
+    async def post(self, customer_id):
+        await self.run_operation("vendor_registration", customer_id)
+
+
+class MrnHandler(ApiHandler):
+    route = "mrn"
+
+    async def post(self, customer_id):
+        await self.run_operation("mrn", customer_id)
+
+
+class ServiceReportHandler(ApiHandler):
+    route = "service_report"
+
+    async def put(self, customer_id):
+        await self.run_operation("service_report", customer_id)
+
+
+class TelecontrollerHandler(ApiHandler):
+    route = "telecontroller"
+
+    async def put(self, customer_id):
+        filename = self.get_query_argument("filename", "telecontroller.pdf")
+        content_type = self.request.headers.get("Content-Type", "").split(";")[0].strip()
+        if content_type != "application/pdf" or not self.request.body.startswith(b"%PDF"):
+            raise ApiError(415, "body must be a PDF (Content-Type: application/pdf)")
+
+        def attach():
+            _find_customer(customer_id, {"_id": 1})
+            return workflow.attach_telecontroller(customer_id, filename, self.request.body)
+
+        file_info = await self.call(attach)
+        if file_info is None:
+            raise ApiError(404, "customer not found")
+        self.send(200, {"id": customer_id, "filename": filename, "size": file_info["size"],
+                        "file_id": file_info["file_id"]})
+
+
+class DashboardHandler(ApiHandler):
+    route = "dashboard"
+
+    async def get(self):
+        self.send(200, await self.call(dashboard))
+
+
+class BulkHandler(ApiHandler):
+    route = "bulk"
+
+    async def post(self):
+        body = self.json_body()
+        status, value = await self.call(run_bulk, body)
+        self.send(status, value)
+
+
+class SyncHandler(ApiHandler):
+    route = "sync"
+
+    async def get(self):
+        token = self.get_query_argument("token", "") or None
+        try:
+            limit = int(self.get_query_argument("limit", str(sync.PAGE_SIZE)))
+        except ValueError:
+            raise ApiError(400, "limit must be a number")
+
+        def pull():
+            try:
+                return sync.pull(token, limit)
+            except ValueError as error:
+                raise ApiError(400, str(error))
+
+        self.send(200, await self.call(pull))
+
+    async def post(self):
+        edits = self.json_body().get("edits")
+        if not isinstance(edits, list):
+            raise ApiError(400, "edits must be a list")
+
+        def push():
+            try:
+                return sync.push(edits)
+            except ValueError as error:
+                raise ApiError(400, str(error))
+
+        self.send(200, {"results": await self.call(push)})
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """This process's metrics in the Prometheus text format."""
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(metrics.REGISTRY.render_prometheus())
+
+
+def make_app():
+    """The tornado application with every route."""
+    customer = r"/api/customers/([0-9a-fA-F]{24})"
+    return tornado.web.Application([
+        (r"/api/customers", CustomersHandler),
+        (customer, CustomerHandler),
+        (customer + r"/vendor-registration", VendorRegistrationHandler),
+        (customer + r"/mrn", MrnHandler),
+        (customer + r"/service-report", ServiceReportHandler),
+        (customer + r"/telecontroller", TelecontrollerHandler),
+        (r"/api/dashboard", DashboardHandler),
+        (r"/api/bulk", BulkHandler),
+        (r"/api/sync", SyncHandler),
+        (r"/metrics", MetricsHandler),
+    ], compress_response=True, log_function=_log_request)
+
+
+async def _serve(sockets, ready=None):
+    server = tornado.httpserver.HTTPServer(make_app(), xheaders=True, decompress_request=True)
+    server.add_sockets(sockets)
+    if ready is not None:
+        ready()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.stop()
+        writeback.close()
+
+
+def start(port=API_PORT, address="", processes=1, ready=None, reuse_port=False):
+    """Listen on `port` and serve forever.
+
+    Args:
+        port: TCP port (0 picks a free one; see `ready`)
+        address: Interface to bind, "" for all
+        processes: Server processes sharing the socket; 0 is one per CPU
+        ready: Called with the bound port once each process is serving
+        reuse_port: Let separately started servers bind the same port (SO_REUSEPORT)
+    """
+    sockets = tornado.netutil.bind_sockets(port, address, reuse_port=reuse_port)
+    bound_port = sockets[0].getsockname()[1]
+    if processes != 1:
+        # Each child opens its own database client, journal slot and cache connection on first use
+        tornado.process.fork_processes(processes)
+    asyncio.run(_serve(sockets, (lambda: ready(bound_port)) if ready else None))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the workflow HTTP JSON API")
+    parser.add_argument("--port", type=int, default=API_PORT, help="Port to listen on")
+    parser.add_argument("--address", default="", help="Interface to bind (default: all)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Server processes sharing the port; 0 starts one per CPU")
+    args = parser.parse_args(argv)
+
+    start(args.port, args.address, args.processes,
+          ready=lambda port: print(f"API listening on port {port} (pid {os.getpid()})", flush=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Micro-benchmark for the metrics registry in utils/metrics.py.
+
+Measures the per-call cost of counter increments and histogram observations,
+single-threaded and with several threads recording at once, and checks that
+the metrics recorded on one rerun stay under a fixed budget.
+
+Usage:
+    python -m benchmarks.bench_metrics [--iterations 200000] [--threads 8]
+"""
+import argparse
+import sys
+import threading
+import time
+
+from utils.metrics import MetricsRegistry
+
+# Metrics recorded on a typical rerun: one rerun histogram, a few pool
+# checkouts and cache lookups, one autosave counter
+CALLS_PER_RERUN = 10
+
+# Budget for all metrics recorded on one rerun, in microseconds
+RERUN_BUDGET_US = 20.0
+
+
+def _ns_per_call(function, iterations):
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter_ns() - started) / iterations
+
+
+def _contended_ns_per_call(function, iterations, threads):
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(iterations):
+            function()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter_ns()
+    for w in workers:
+        w.join()
+    return (time.perf_counter_ns() - started) / (iterations * threads)
+
+
+def run(iterations, threads):
+    """Run the benchmark and return {case: ns per call}."""
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_counter_total", "bench", ("cache", "result"))
+    histogram = registry.histogram("bench_seconds", "bench", ("page",))
+
+    def noop():
+        pass
+
+    bound_counter = counter.labels(cache="dashboard", result="hit")
+    bound_histogram = histogram.labels(page="service_report")
+
+    cases = {
+        "baseline (empty call)": noop,
+        "counter.inc (2 labels)": lambda: counter.inc(cache="dashboard", result="hit"),
+        "counter.labels(...).inc": bound_counter.inc,
+        "histogram.observe (1 label)": lambda: histogram.observe(0.042, page="service_report"),
+        "histogram.labels(...).observe": lambda: bound_histogram.observe(0.042),
+    }
+
+    results = {}
+    for name, function in cases.items():
+        _ns_per_call(function, iterations // 10)  # warmup
+        results[name] = _ns_per_call(function, iterations)
+        results[f"{name}, {threads} threads"] = _contended_ns_per_call(function, iterations // threads, threads)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Metrics registry micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    results = run(args.iterations, args.threads)
+    for name, ns in results.items():
+        print(f"{name:<45} {ns:>9.1f} ns/call")
+
+    # The slowest recording path decides the per-rerun cost
+    worst = max(ns for name, ns in results.items() if not name.startswith("baseline"))
+    per_rerun_us = worst * CALLS_PER_RERUN / 1000.0
+    print(f"\nWorst case per rerun ({CALLS_PER_RERUN} calls): {per_rerun_us:.2f} us (budget {RERUN_BUDGET_US:.0f} us)")
+    if per_rerun_us > RERUN_BUDGET_US:
+        print("FAIL: metrics overhead exceeds the per-rerun budget")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Benchmarks for helper functions and page-level data paths.
+
+Each scale gets a freshly seeded dataset (tools/seed_data.py) and these cases:
+sequential code generation (alone and with concurrent callers), workflow
+progress over every customer, the dashboard row build, printable document
+rendering, the service report payload build, serial number search,
+revenue and cycle-time aggregations, full-text search, fuzzy customer
+search and document history on a long version chain.
+
+Runs against the embedded backend by default. With --mongo-uri the
+generated collections of the service_workflow database are dropped and
+reseeded, so point it at a scratch server.
+
+Usage:
+    python -m benchmarks.bench_paths [--scales 1000,10000] [--repetitions 20] [--warmup 3]
+                                     [--output bench_paths.json] [--compare bench_paths.json]
+"""
+import argparse
+import datetime
+import os
+import sys
+import threading
+
+from bson.objectid import ObjectId
+
+from benchmarks import harness
+
+# Threads calling generate_sequential_code at once in the contention case
+CONTENTION_THREADS = 8
+
+# Versions in the long-history case (capped per scale)
+MAX_HISTORY = 5000
+
+
+def _configure(mongo_uri):
+    # Must run before anything imports database.connection
+    os.environ["MONGO_CONNECTION_STRING"] = mongo_uri or "mongomock://"
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("QUERY_STATS_PATH", "")
+
+
+def _seed(db, scale, seed, mongo_uri):
+    from tools.seed_data import seed_database
+    real = mongo_uri and not mongo_uri.startswith("mongomock://")
+    seed_database(db, scale, seed=seed, drop=True, mongo_uri=mongo_uri if real else None)
+
+
+def _seed_history(db, document_id, length):
+    """Insert a version chain for one document, as create_document_version would."""
+    db.document_versions.delete_many({"_original_id": str(document_id)})
+    started = datetime.datetime(2024, 1, 1)
+    db.document_versions.insert_many([
+        {"_original_id": str(document_id), "_collection": "service_reports", "revision": i,
+         "problem_diagnosis": f"Revision {i}", "_version_date": started + datetime.timedelta(minutes=i)}
+        for i in range(length)
+    ])
+
+
+def _form_values(report):
+    """Form values as the service report page holds them (dates as datetime.date)."""
+    values = dict(report)
+    for field in ("service_date", "service_advisor_date", "customer_rep_date"):
+        values[field] = report[field].date()
+    values["follow_up_date"] = report["follow_up_date"].date() if report.get("follow_up_date") else None
+    return values
+
+
+def _staff_list(report):
+    """Staff entries with date/time objects, as the page widgets produce them."""
+    staff = []
+    for entry in report["staff_assigned"]:
+        entry = dict(entry)
+        entry["service_date"] = datetime.datetime.strptime(entry["service_date"], "%Y-%m-%d").date()
+        entry["job_start"] = datetime.datetime.strptime(entry["job_start"], "%H:%M").time()
+        entry["job_end"] = datetime.datetime.strptime(entry["job_end"], "%H:%M").time()
+        staff.append(entry)
+    return staff
+
+
+def _concurrently(function, threads):
+    """Call `function` once from each of `threads` threads started together."""
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        function()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+
+def run_scale(scale, seed, warmup, repetitions, mongo_uri):
+    """Seed one scale and time every case; returns {case: summary}."""
+    from database.connection import db, customers, mrns, service_reports
+    from utils.helpers import (generate_sequential_code, calculate_workflow_progress, build_dashboard_rows,
+                               find_customer_ids_by_serial, get_document_history)
+    from pages.customer_view import generate_printable_document
+    from pages.service_report import build_report_data
+    from utils.costs import aggregate_revenue
+    from database import rollups, cycle_times, search, customer_search
+    from pages.dashboard import _scan_statistics
+
+    _seed(db, scale, seed, mongo_uri)
+
+    # Inputs fetched once so the timed cases measure only their own work
+    all_customers = list(customers.find({}).sort("name", 1))
+    statuses = [c.get("status", {}) for c in all_customers]
+    report = service_reports.find_one({}, sort=[("created_at", 1)])
+    customer = customers.find_one({"_id": ObjectId(report["customer_id"])})
+    mrn = mrns.find_one({"mrn_code": report["mrn_code"]})
+    sections = ["Customer Information", "Vendor Registration", "MRN Details", "Service Report", "Telecontroller Data"]
+    values = _form_values(report)
+    staff_list = _staff_list(report)
+    serial_prefix = mrn["serial_no"][:6]
+    history_length = min(max(scale // 10, 10), MAX_HISTORY)
+    _seed_history(db, report["_id"], history_length)
+    # Build the in-process search indexes (embedded backend) before timing queries
+    search.search("fan")
+    customer_search.find_customers("acme")
+    # A misspelt word of the first customer's name
+    typo = customer["name"].split()[0][:-1] + "x"
+
+    cases = {
+        "generate_sequential_code": (lambda: generate_sequential_code("MRN"), 1),
+        f"generate_sequential_code x{CONTENTION_THREADS} threads":
+            (lambda: _concurrently(lambda: generate_sequential_code("MRN"), CONTENTION_THREADS), 1),
+        "calculate_workflow_progress (all customers)":
+            (lambda: [calculate_workflow_progress(status) for status in statuses], 1),
+        "build_dashboard_rows (all customers)": (lambda: build_dashboard_rows(all_customers), 1),
+        "dashboard query + rows": (lambda: build_dashboard_rows(customers.find({}).sort("name", 1)), 1),
+        "dashboard statistics (scan)": (_scan_statistics, 1),
+        "dashboard statistics (rollups)": (lambda: rollups.summarize(rollups.load_workflow_rollups()), 1),
+        "generate_printable_document (all sections)":
+            (lambda: generate_printable_document(customer, mrn, report, sections), 20),
+        "build_report_data": (lambda: build_report_data(report["customer_id"], report["mrn_code"], values,
+                                                        staff_list, report["inspection_checklist"],
+                                                        report["parts_list"], report["labor_costs"]), 50),
+        "find_customer_ids_by_serial (prefix)": (lambda: find_customer_ids_by_serial(serial_prefix), 1),
+        "find_customer_ids_by_serial (substring)": (lambda: find_customer_ids_by_serial("12"), 1),
+        "aggregate_revenue (all reports)": (aggregate_revenue, 1),
+        "stage_durations (all customers)": (cycle_times.stage_durations, 1),
+        "full-text search (page 2)": (lambda: search.search("fan noise", page=2), 1),
+        "customer search (typo)": (lambda: customer_search.find_customers(typo), 1),
+        "customer search (phone digits)": (lambda: customer_search.find_customers(customer["contact_phone"][-5:]), 1),
+        f"get_document_history ({history_length} versions)":
+            (lambda: get_document_history("service_reports", report["_id"]), 1),
+    }
+
+    results = {}
+    for name, (function, number) in cases.items():
+        results[name] = harness.measure(function, warmup=warmup, repetitions=repetitions, number=number)
+        print(f"  {name:<44} {results[name]['median_ms']:>11.4f} ms", flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Helper and page data path benchmarks")
+    parser.add_argument("--scales", default="1000,10000", help="Comma-separated customer counts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--mongo-uri", default=None,
+                        help="MongoDB connection string (drops and reseeds service_workflow collections)")
+    parser.add_argument("--output", metavar="PATH", help="Write results to a JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="Compare medians against a results JSON")
+    args = parser.parse_args(argv)
+
+    _configure(args.mongo_uri)
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+
+    results = {}
+    for scale in scales:
+        print(f"Scale {scale} customers", flush=True)
+        results[str(scale)] = run_scale(scale, args.seed, args.warmup, args.repetitions, args.mongo_uri)
+
+    print()
+    harness.print_results(results)
+
+    status = 0
+    if args.compare:
+        print(f"\nComparison with {args.compare}")
+        rows = harness.compare_results(results, harness.load_results(args.compare))
+        if harness.print_comparison(rows):
+            status = 1
+    if args.output:
+        config = {"scales": scales, "seed": args.seed, "warmup": args.warmup, "repetitions": args.repetitions,
+                  "backend": "mongodb" if args.mongo_uri and not args.mongo_uri.startswith("mongomock://") else "embedded"}
+        harness.save_results(args.output, results, config)
+        print(f"\nResults saved to {args.output}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
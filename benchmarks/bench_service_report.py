@@ -0,0 +1,125 @@
+"""Element count and rerun time of the service report page for a large report.
+
+Seeds one customer with an MRN and a saved service report (20 parts, 10
+labour rows and 5 staff entries by default) on the embedded backend, then
+drives pages/service_report.py with AppTest. For each form section it
+reports the number of elements and widgets the rerun emits and the rerun
+time.
+
+Usage:
+    python -m benchmarks.bench_service_report [--parts 20] [--labor 10] [--staff 5] [--repetitions 10]
+"""
+import argparse
+import datetime
+import os
+import sys
+
+from benchmarks import harness
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+
+def _configure():
+    # Must run before anything imports database.connection
+    os.environ["MONGO_CONNECTION_STRING"] = "mongomock://"
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("QUERY_STATS_PATH", "")
+
+
+def seed_report(parts, labor, staff):
+    """Insert a customer, MRN and saved report; returns (customer_id, mrn_code)."""
+    from database.connection import customers, mrns, service_reports
+    from utils.costs import report_costs
+
+    now = datetime.datetime.now()
+    customer_id = str(customers.insert_one({
+        "name": "Benchmark Fabrication", "contact_name": "Bench", "contact_phone": "+1 555 0100",
+        "machine_count": 3, "created_at": now,
+        "status": {"vendor_registered": True, "mrn_created": True,
+                   "service_report_created": True, "telecontroller_done": False},
+    }).inserted_id)
+    mrn_code = f"MRN-{now.strftime('%Y%m%d')}-9999"
+    mrns.insert_one({"customer_id": customer_id, "mrn_code": mrn_code, "code": mrn_code, "model": "MIG 350",
+                     "machine_type": "Welding Machine", "serial_no": "SN-BENCH-1", "created_at": now})
+    parts_list, labor_costs, totals = report_costs(
+        [{"part_number": f"P-{i:03d}", "description": f"Part {i}", "make": "Generic", "status": "Used",
+          "quantity": 2, "unit_price": 12.5, "remark": ""} for i in range(parts)],
+        [{"description": f"Labour {i}", "type": "Standard Labor", "hours": 2.0, "rate": 45.0, "notes": ""}
+         for i in range(labor)])
+    service_reports.insert_one({
+        "customer_id": customer_id, "mrn_code": mrn_code, "service_date": now, "sr_code": "SR-BENCH",
+        "staff_assigned": [{"name": f"Tech {i}", "service_date": now.strftime("%Y-%m-%d"), "travel_time": "1",
+                            "job_start": "09:00", "job_end": "17:00", "job_status": "Completed",
+                            "job_type": "Repair"} for i in range(staff)],
+        "parts_list": parts_list, "labor_costs": labor_costs, **totals,
+        "created_at": now, "updated_at": now,
+    })
+    return customer_id, mrn_code
+
+
+def count_elements(node):
+    """Return (elements, widgets) below an AppTest tree node."""
+    from streamlit.testing.v1.element_tree import Widget
+
+    children = getattr(node, "children", None)
+    if children is None:
+        return 1, int(isinstance(node, Widget))
+    elements = widgets = 0
+    for child in children.values():
+        e, w = count_elements(child)
+        elements += e
+        widgets += w
+    return elements, widgets
+
+
+def run(parts, labor, staff, warmup, repetitions):
+    """Measure every section; returns {section: stats}."""
+    from streamlit.testing.v1 import AppTest
+    from pages.service_report import SECTIONS
+
+    customer_id, mrn_code = seed_report(parts, labor, staff)
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.session_state["page"] = "service_report"
+    at.session_state["customer_id"] = customer_id
+    at.session_state["mrn_code"] = mrn_code
+    at.run()
+
+    results = {}
+    for section in SECTIONS:
+        at.radio(key="sr_section").set_value(section)
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"{section}: {at.exception[0].value}")
+        elements, widgets = count_elements(at._tree)
+        stats = harness.measure(at.run, warmup=warmup, repetitions=repetitions)
+        results[section] = dict(stats, elements=elements, widgets=widgets)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service report page element count and rerun time")
+    parser.add_argument("--parts", type=int, default=20)
+    parser.add_argument("--labor", type=int, default=10)
+    parser.add_argument("--staff", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repetitions", type=int, default=10)
+    parser.add_argument("--output", metavar="PATH", help="Write results to a JSON file")
+    args = parser.parse_args(argv)
+
+    _configure()
+    results = run(args.parts, args.labor, args.staff, args.warmup, args.repetitions)
+
+    print(f"Service report with {args.parts} parts, {args.labor} labour rows, {args.staff} staff\n")
+    print(f"{'section':<22} {'elements':>9} {'widgets':>8} {'median ms':>10} {'p95 ms':>9}")
+    for section, r in results.items():
+        print(f"{section:<22} {r['elements']:>9} {r['widgets']:>8} {r['median_ms']:>10.1f} {r['p95_ms']:>9.1f}")
+
+    if args.output:
+        config = {"parts": args.parts, "labor": args.labor, "staff": args.staff, "repetitions": args.repetitions}
+        harness.save_results(args.output, {"service_report": results}, config)
+        print(f"\nResults saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# Shared benchmark harness: timing with warmup and repetitions, summaries, JSON results
+import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+
+# A case is reported as a regression when its median grows by more than this
+REGRESSION_THRESHOLD = 0.10
+
+
+def measure(function, warmup=3, repetitions=20, number=1):
+    """Time a function and summarize the per-call durations.
+
+    Args:
+        function: Zero-argument callable to time
+        warmup: Untimed calls made first (caches, connection, JIT-like effects)
+        repetitions: Timed samples
+        number: Calls per sample, for functions too fast to time singly
+
+    Returns:
+        Dict of summary statistics in milliseconds per call
+    """
+    for _ in range(warmup):
+        function()
+
+    samples = []
+    for _ in range(repetitions):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter() - started) / number)
+    return summarize(samples)
+
+
+def summarize(samples):
+    """Summary statistics of durations in seconds, reported in ms."""
+    ordered = sorted(samples)
+    p95_index = max(0, -(-95 * len(ordered) // 100) - 1)
+    return {
+        "repetitions": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "median_ms": round(statistics.median(ordered) * 1000, 4),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 4),
+        "stdev_ms": round(statistics.stdev(ordered) * 1000, 4) if len(ordered) > 1 else 0.0,
+        "p95_ms": round(ordered[p95_index] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def environment():
+    """Interpreter and host details stored alongside results."""
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def save_results(path, results, config):
+    """Write results ({scale: {case: summary}}) to a JSON file."""
+    with open(path, "w") as f:
+        json.dump({
+            "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "environment": environment(),
+            "config": config,
+            "results": results,
+        }, f, indent=2)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Compare medians against a baseline file's results.
+
+    Returns:
+        List of (scale, case, old_ms, new_ms, change) for every case in both,
+        with change as a fraction (0.25 = 25% slower)
+    """
+    rows = []
+    for scale, cases in results.items():
+        old_cases = baseline.get("results", {}).get(scale, {})
+        for case, summary in cases.items():
+            if case in old_cases and old_cases[case]["median_ms"]:
+                old, new = old_cases[case]["median_ms"], summary["median_ms"]
+                rows.append((scale, case, old, new, (new - old) / old))
+    return rows
+
+
+def print_results(results):
+    header = f"{'scale':>9}  {'case':<44} {'median ms':>11} {'p95 ms':>10} {'stdev':>9}"
+    print(header)
+    print("-" * len(header))
+    for scale, cases in results.items():
+        for case, s in cases.items():
+            print(f"{scale:>9}  {case:<44} {s['median_ms']:>11.4f} {s['p95_ms']:>10.4f} {s['stdev_ms']:>9.4f}")
+
+
+def print_comparison(rows, threshold=REGRESSION_THRESHOLD):
+    """Print a comparison table; returns the number of regressions."""
+    regressions = 0
+    for scale, case, old, new, change in rows:
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  improved"
+        print(f"{scale:>9}  {case:<44} {old:>11.4f} -> {new:>11.4f}  ({change * 100:+.1f}%){flag}")
+    return regressions
@@ -0,0 +1,179 @@
+# Prefix autocomplete over customer names and phone numbers
+#
+# A sorted list of (key, customer id) pairs answers a prefix with one
+# bisect and a short scan. Each customer has a key for every word of its
+# name (so "silver" finds "Orion Silver Marine") plus its phone digits with
+# and without the country code. The list is loaded on first use (from the
+# shared cache, utils/shared_cache.py, when another worker process built it
+# since the last customer write). Write paths call update_customer() after
+# saving name or phone, so this process's own writes show up at once and its
+# own bump of the customers write version is not taken for a foreign write.
+# Writes made by other processes (other workers, the API, sync pushes) move
+# the version too; the next lookup then re-keys only the customers and
+# customer tombstones whose sync change number (`_seq`, database/sync.py) is
+# past the last settled one it saw, instead of reloading the list.
+import bisect
+import datetime
+import threading
+
+from database.connection import customers, db
+from database.customer_search import normalize, normalize_phone
+from database import sync, temporary
+from utils import shared_cache
+
+# Suggestions returned per lookup
+DEFAULT_LIMIT = 8
+
+# Digits of a national phone number (keys also drop the country code)
+NATIONAL_DIGITS = 10
+
+# Shortest prefix that is looked up
+MIN_PREFIX = 2
+
+_lock = threading.Lock()
+_keys = None        # sorted [(key, customer id)]
+_keys_of = {}       # customer id -> its keys
+_display = {}       # customer id -> (name, contact_phone)
+_version = None     # customers write version the list is current with
+_settled = 0        # change number up to which every customer write is in the list
+
+
+def customer_keys(customer):
+    """Lookup keys of a customer: every word-start of its name and its phone digits."""
+    words = normalize(customer.get("name")).split()
+    keys = {" ".join(words[i:]) for i in range(len(words))}
+    digits = normalize_phone(customer.get("contact_phone"))
+    if digits:
+        keys.update({digits, digits[-NATIONAL_DIGITS:]})
+    return keys
+
+
+def _remove(customer_id):
+    for key in _keys_of.pop(customer_id, ()):
+        position = bisect.bisect_left(_keys, (key, customer_id))
+        if position < len(_keys) and _keys[position] == (key, customer_id):
+            del _keys[position]
+    _display.pop(customer_id, None)
+
+
+def _scan():
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=sync.SYNC_SETTLE_SECONDS)
+    keys, keys_of, display, settled = [], {}, {}, 0
+    fields = {"name": 1, "contact_phone": 1, "_seq": 1, "_seq_at": 1}
+    for customer in customers.find(temporary.NOT_TEMPORARY, fields):
+        customer_id = str(customer["_id"])
+        keys_of[customer_id] = customer_keys(customer)
+        display[customer_id] = (customer.get("name", ""), customer.get("contact_phone", ""))
+        keys.extend((key, customer_id) for key in keys_of[customer_id])
+        settled = max(settled, _settled_seq(customer, cutoff))
+    keys.sort()
+    return keys, keys_of, display, settled
+
+
+def _settled_seq(document, cutoff):
+    # Numbers are taken in time order, so every lower number has landed too
+    if isinstance(document.get("_seq_at"), datetime.datetime) and document["_seq_at"] < cutoff:
+        return document.get("_seq") or 0
+    return 0
+
+
+def _warm(version):
+    global _keys, _keys_of, _display, _version, _settled
+    # Another worker process may have built the index since the last customer write
+    keys, keys_of, display, settled = shared_cache.get_or_compute("autocomplete", "index-seq", _scan,
+                                                                  version=version, local=False)
+    _keys, _keys_of, _display = keys, dict(keys_of), dict(display)
+    _version, _settled = version, settled
+
+
+def _catch_up(version):
+    global _version, _settled
+    # Changes after `_settled` may have landed since the last look (or still
+    # be in flight), so they are re-read until they settle; re-keying is idempotent
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=sync.SYNC_SETTLE_SECONDS)
+    settled = _settled
+    fields = {"name": 1, "contact_phone": 1, "is_temporary": 1, "_seq": 1, "_seq_at": 1}
+    for customer in customers.find({"_seq": {"$gt": _settled}}, fields):
+        customer_id = str(customer["_id"])
+        settled = max(settled, _settled_seq(customer, cutoff))
+        if customer.get("is_temporary"):
+            _remove(customer_id)
+        elif (_keys_of.get(customer_id) != customer_keys(customer)
+              or _display.get(customer_id) != (customer.get("name", ""), customer.get("contact_phone", ""))):
+            _remove(customer_id)
+            _insert(customer_id, customer)
+    for deleted in db[sync.TOMBSTONES].find({"collection": "customers", "_seq": {"$gt": _settled}}):
+        _remove(str(deleted["doc_id"]))
+        settled = max(settled, _settled_seq(deleted, cutoff))
+    _version, _settled = version, settled
+
+
+def _insert(customer_id, customer):
+    _keys_of[customer_id] = customer_keys(customer)
+    _display[customer_id] = (customer.get("name", ""), customer.get("contact_phone", ""))
+    for key in _keys_of[customer_id]:
+        bisect.insort(_keys, (key, customer_id))
+
+
+def _own_write():
+    global _version
+    # Only this process's bump moved the version since the list was current
+    version = shared_cache.version(shared_cache.CUSTOMERS)
+    if _version is not None and version == _version + 1:
+        _version = version
+
+
+def update_customer(customer_id, customer):
+    """Re-key one saved customer (needs its name and contact_phone); a no-op until the index is warm."""
+    customer_id = str(customer_id)
+    with _lock:
+        if _keys is None:
+            return
+        _remove(customer_id)
+        _insert(customer_id, customer)
+        _own_write()
+
+
+def remove_customer(customer_id):
+    """Drop a deleted customer from the index."""
+    with _lock:
+        if _keys is not None:
+            _remove(str(customer_id))
+            _own_write()
+
+
+def suggest(prefix, limit=DEFAULT_LIMIT):
+    """Customers whose name words or phone start with `prefix`.
+
+    Args:
+        prefix: Typed text; case and punctuation are ignored
+        limit: Most suggestions returned
+
+    Returns:
+        [{"_id", "name", "contact_phone"}], in key order
+    """
+    text = normalize(prefix)
+    digits = normalize_phone(prefix)
+    # Phone-like input ("+91 98450") is looked up by its digits
+    if digits and len(digits) >= len(text.replace(" ", "")) - 1:
+        text = digits
+    if len(text) < MIN_PREFIX:
+        return []
+
+    with _lock:
+        version = shared_cache.version(shared_cache.CUSTOMERS)
+        if _keys is None:
+            _warm(version)
+        elif version != _version:
+            _catch_up(version)
+        position = bisect.bisect_left(_keys, (text,))
+        seen = []
+        while position < len(_keys) and len(seen) < limit:
+            key, customer_id = _keys[position]
+            if not key.startswith(text):
+                break
+            if customer_id not in seen:
+                seen.append(customer_id)
+            position += 1
+        return [{"_id": customer_id, "name": _display[customer_id][0], "contact_phone": _display[customer_id][1]}
+                for customer_id in seen]
@@ -1,20 +1,33 @@
-import pymongo
 import os
+import threading
 import streamlit as st
 from typing import Dict, Any, Optional
 
 def get_mongo_client():
     """Create and return a MongoDB client using connection string."""
+    # pymongo (and its DNS resolver) is imported here rather than at module
+    # top so pages that never query do not pay for it on a cold start
+    import pymongo
+    from database.monitoring import query_stats, pool_metrics
+    
     try:
         # Try to get connection string from Streamlit secrets
         import streamlit as st
         connection_string = st.secrets["MONGO_CONNECTION_STRING"]
-    except (ImportError, KeyError):
+    except (ImportError, KeyError, FileNotFoundError):
         # Fallback to environment variable or default
         connection_string = os.environ.get("MONGO_CONNECTION_STRING", "mongodb://localhost:27017/")
     
+    # Embedded in-process backend for load tests and benchmarks (requires mongomock)
+    if connection_string.startswith("mongomock://"):
+        import mongomock
+        import mongomock.gridfs
+        mongomock.gridfs.enable_gridfs_integration()
+        return mongomock.MongoClient()
+    
     try:
-        client = pymongo.MongoClient(connection_string, serverSelectionTimeoutMS=5000)
+        client = pymongo.MongoClient(connection_string, serverSelectionTimeoutMS=5000,
+                                     event_listeners=[query_stats, pool_metrics])
         # Verify the connection
         client.admin.command('ismaster')
         return client
@@ -24,17 +37,72 @@ def get_mongo_client():
         # For demo/fallback, create an in-memory object to simulate MongoDB
         from pymongo.mongo_client import MongoClient
         from pymongo.server_api import ServerApi
-        return MongoClient(connection_string, server_api=ServerApi('1'))
+        return MongoClient(connection_string, server_api=ServerApi('1'), event_listeners=[query_stats, pool_metrics])
     except Exception as e:
         st.error(f"Unexpected error while connecting to MongoDB: {str(e)}")
         # Return a client anyway, but operations may fail later
-        return pymongo.MongoClient(connection_string)
+        return pymongo.MongoClient(connection_string, event_listeners=[query_stats, pool_metrics])
+
+class _Lazy:
+    """Stand-in for a client, database or collection that is created on first use.
+    
+    Importing this module therefore does not connect; the connection is made
+    by the first query of the first page that needs one.
+    """
+    
+    def __init__(self, resolve):
+        object.__setattr__(self, "_resolve", resolve)
+    
+    def _target(self):
+        target = self.__dict__.get("_resolved")
+        if target is None:
+            target = self._resolve()
+            object.__setattr__(self, "_resolved", target)
+        return target
+    
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+    
+    def __getitem__(self, name):
+        return self._target()[name]
+    
+    def __repr__(self):
+        if "_resolved" in self.__dict__:
+            return repr(self._resolved)
+        return "<not yet connected>"
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the process-wide MongoDB client, connecting on first call."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = get_mongo_client()
+    return _client
 
-# Initialize MongoDB client and database
-client = get_mongo_client()
-db = client.service_workflow
+def get_db():
+    """Return the application database, connecting on first call."""
+    return get_client().service_workflow
+
+# MongoDB client and database (connected lazily)
+client = _Lazy(get_client)
+db = _Lazy(get_db)
 
 # Collections
-customers = db.customers
-mrns = db.mrns
-service_reports = db.service_reports
+customers = _Lazy(lambda: get_db().customers)
+mrns = _Lazy(lambda: get_db().mrns)
+service_reports = _Lazy(lambda: get_db().service_reports)
+daily_rollups = _Lazy(lambda: get_db().daily_rollups)
+workflow_events = _Lazy(lambda: get_db().workflow_events)
+machines = _Lazy(lambda: get_db().machines)
+drafts = _Lazy(lambda: get_db().drafts)
+
+# GridFS bucket for uploaded documents (fs.files and fs.chunks)
+def _gridfs():
+    import gridfs
+    return gridfs.GridFS(get_db())
+
+fs = _Lazy(_gridfs)
@@ -0,0 +1,291 @@
+# Fuzzy search over customer names, contacts and phone numbers
+#
+# Every customer carries `search_grams`: the trigrams of its normalized
+# name ("n"), contact name ("c") and phone digits ("p"), each prefixed with
+# its field letter. Write paths merge search_fields() into the same update
+# that saves the three fields and then call index_customer(). A query is
+# split into trigrams the same way and customers are ranked by trigram
+# similarity, so typos and partial words still match.
+#
+# Two engines, chosen like database.search (SEARCH_ENGINE):
+#   MongoGramEngine  - multikey index on search_grams, overlap counted by the server
+#   GramIndex        - in-process gram -> slot postings counted with NumPy,
+#                      for the embedded backend, which scans on every find
+import math
+import re
+import threading
+from array import array
+
+from database.connection import db
+from database.search import engine_kind
+from database import temporary
+
+# Fields searched, by gram prefix
+FIELDS = {"n": "name", "c": "contact_name", "p": "contact_phone"}
+
+# Lowest similarity a match needs (0-1)
+MIN_SIMILARITY = 0.3
+
+# Weight of the whole-field (Jaccard) similarity against the share of query grams found
+JACCARD_WEIGHT = 0.25
+
+# Candidates the server engine re-ranks per requested hit
+CANDIDATE_FACTOR = 4
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_NON_DIGIT = re.compile(r"\D+")
+
+
+def normalize(text):
+    """Lowercase words without punctuation, single-spaced."""
+    return _NON_WORD.sub(" ", str(text or "").lower()).strip()
+
+
+def normalize_phone(phone):
+    """Digits of a phone number ("+91 98450-12345" -> "919845012345")."""
+    return _NON_DIGIT.sub("", str(phone or ""))
+
+
+def trigrams(text, prefix=False):
+    """Trigrams of each word, padded with two spaces before and one after.
+
+    Args:
+        text: Text to split
+        prefix: Leave the end of the last word open (a word still being typed)
+
+    Returns:
+        Set of 3-character strings
+    """
+    words = normalize(text).split()
+    grams = set()
+    for position, word in enumerate(words):
+        padded = f"  {word}" if prefix and position == len(words) - 1 else f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def phone_trigrams(phone):
+    """Trigrams of the phone digits (unpadded, so any run of three digits matches)."""
+    digits = normalize_phone(phone)
+    return {digits[i:i + 3] for i in range(len(digits) - 2)}
+
+
+def field_grams(customer):
+    """{prefix: set of trigrams} of a customer's searched fields."""
+    return {
+        "n": trigrams(customer.get("name")),
+        "c": trigrams(customer.get("contact_name")),
+        "p": phone_trigrams(customer.get("contact_phone")),
+    }
+
+
+def customer_grams(customer):
+    """The sorted `search_grams` list stored on a customer."""
+    return sorted(prefix + gram for prefix, grams in field_grams(customer).items() for gram in grams)
+
+
+def search_fields(customer):
+    """Fields to $set next to name, contact_name and contact_phone."""
+    return {"search_grams": customer_grams(customer)}
+
+
+def query_grams(query):
+    """{prefix: set of trigrams} of a query; digits only search phones once there are three."""
+    words = trigrams(query, prefix=True)
+    return {"n": words, "c": words, "p": phone_trigrams(query)}
+
+
+def similarity(overlap, query_size, field_size):
+    """Similarity of a field sharing `overlap` of the query's trigrams.
+
+    Mostly the share of query trigrams found in the field (so "acme"
+    finds "Acme Welding Works"), plus a little whole-field Jaccard so the
+    closer of two fields ranks first.
+    """
+    if not query_size or not overlap:
+        return 0.0
+    jaccard = overlap / (query_size + field_size - overlap)
+    return (1 - JACCARD_WEIGHT) * overlap / query_size + JACCARD_WEIGHT * jaccard
+
+
+def _score(query, grams_by_field):
+    return max(similarity(len(query[prefix] & grams), len(query[prefix]), len(grams))
+               for prefix, grams in grams_by_field.items())
+
+
+class MongoGramEngine:
+    """Candidates from the multikey index on search_grams, re-ranked in Python."""
+
+    def __init__(self, database):
+        self.db = database
+        self._indexed = False
+
+    def ensure_indexes(self):
+        if self._indexed:
+            return
+        self.db.customers.create_index("search_grams", name="customers_search_grams")
+        self._indexed = True
+
+    def index(self, customer_id, customer):
+        # The server maintains its index
+        pass
+
+    def search(self, query, limit):
+        self.ensure_indexes()
+        grams = [prefix + gram for prefix, values in query.items() for gram in values]
+        # A field reaching MIN_SIMILARITY shares at least this many grams with the query
+        sizes = [len(values) for values in query.values() if values]
+        min_hits = max(math.ceil(MIN_SIMILARITY * (1 - JACCARD_WEIGHT) * min(sizes)), 1)
+        pipeline = [
+            {"$match": dict(temporary.NOT_TEMPORARY, search_grams={"$in": grams})},
+            {"$project": {"search_grams": 1, "hits": {"$size": {"$setIntersection": ["$search_grams", grams]}}}},
+            {"$match": {"hits": {"$gte": min_hits}}},
+            {"$sort": {"hits": -1}},
+            {"$limit": limit * CANDIDATE_FACTOR},
+        ]
+        matches = []
+        for row in self.db.customers.aggregate(pipeline):
+            stored = {prefix: set() for prefix in FIELDS}
+            for gram in row["search_grams"]:
+                stored[gram[0]].add(gram[1:])
+            score = _score(query, stored)
+            if score >= MIN_SIMILARITY:
+                matches.append((str(row["_id"]), score))
+        return matches
+
+
+class GramIndex:
+    """In-process trigram index for the embedded backend.
+
+    Postings are append-only slot arrays per prefixed gram; a query counts
+    each slot's shared grams per field with np.bincount. A re-indexed
+    customer gets a new slot and its old slot is masked out; the index is
+    rebuilt from the database once a quarter of the slots are stale.
+    """
+
+    def __init__(self, database):
+        self.db = database
+        self._lock = threading.RLock()
+        self._built = False
+
+    def _reset(self):
+        self._ids = []                                       # slot -> customer id (str)
+        self._slot_of = {}                                   # customer id -> slot
+        self._live = bytearray()                             # slot -> 1 while current
+        self._sizes = {prefix: array("H") for prefix in FIELDS}  # slot -> grams in the field
+        self._postings = {}                                  # prefixed gram -> array("i") slots
+        self._stale = 0
+
+    def _build(self):
+        self._reset()
+        for customer in self.db.customers.find(temporary.NOT_TEMPORARY, list(FIELDS.values())):
+            self._add(str(customer["_id"]), customer)
+        self._built = True
+
+    def _add(self, customer_id, customer):
+        previous = self._slot_of.get(customer_id)
+        if previous is not None:
+            self._live[previous] = 0
+            self._stale += 1
+        slot = len(self._ids)
+        self._ids.append(customer_id)
+        self._slot_of[customer_id] = slot
+        self._live.append(1)
+        for prefix, grams in field_grams(customer).items():
+            self._sizes[prefix].append(min(len(grams), 0xFFFF))
+            for gram in grams:
+                postings = self._postings.get(prefix + gram)
+                if postings is None:
+                    postings = self._postings[prefix + gram] = array("i")
+                postings.append(slot)
+
+    def index(self, customer_id, customer):
+        """(Re-)index one saved customer; customers saved before the first search are picked up by the build."""
+        with self._lock:
+            if not self._built:
+                return
+            self._add(str(customer_id), customer)
+            if self._stale > max(len(self._ids) // 4, 1000):
+                self._built = False
+
+    def search(self, query, limit):
+        import numpy as np
+
+        with self._lock:
+            if not self._built:
+                self._build()
+            slots_total = len(self._ids)
+            if not slots_total:
+                return []
+            scores = np.zeros(slots_total, dtype=np.float32)
+            for prefix, grams in query.items():
+                lists = [self._postings[prefix + gram] for gram in grams if prefix + gram in self._postings]
+                if not lists:
+                    continue
+                # Slots are unique within a posting list, so the counts are overlaps
+                slots = np.concatenate([np.frombuffer(postings, dtype=np.int32) for postings in lists])
+                overlap = np.bincount(slots, minlength=slots_total).astype(np.float32)
+                sizes = np.frombuffer(self._sizes[prefix], dtype=np.uint16).astype(np.float32)
+                jaccard = overlap / np.maximum(len(grams) + sizes - overlap, 1)
+                np.maximum(scores, (1 - JACCARD_WEIGHT) * overlap / len(grams) + JACCARD_WEIGHT * jaccard,
+                           out=scores)
+            scores[~np.frombuffer(self._live, dtype=np.uint8).astype(bool)] = 0
+
+            matched = np.flatnonzero(scores >= MIN_SIMILARITY)
+            if len(matched) > limit:
+                matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+            return [(self._ids[slot], float(scores[slot])) for slot in matched]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The customer search engine for this process (chosen once by SEARCH_ENGINE)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = GramIndex(db) if engine_kind() == "memory" else MongoGramEngine(db)
+    return _engine
+
+
+def index_customer(customer_id, customer):
+    """Tell the search engine about a saved customer (name, contact_name and contact_phone)."""
+    get_engine().index(customer_id, customer)
+
+
+def find_customers(query, limit=50):
+    """Customers best matching a name, contact name or phone fragment.
+
+    Args:
+        query: Text typed by the user; typos and unfinished words still match
+        limit: Most matches returned
+
+    Returns:
+        [(customer id, similarity 0-1)], best first
+    """
+    grams = query_grams(query)
+    if not any(grams.values()):
+        return []
+    matches = get_engine().search(grams, limit)
+    matches.sort(key=lambda match: match[1], reverse=True)
+    return matches[:limit]
+
+
+def backfill(db, batch_size=1000):
+    """Write `search_grams` for customers without it; returns the number of customers updated."""
+    from pymongo import UpdateOne
+
+    updated = 0
+    requests = []
+    fields = list(FIELDS.values())
+    for customer in db.customers.find({"search_grams": {"$exists": False}}, fields):
+        requests.append(UpdateOne({"_id": customer["_id"]}, {"$set": search_fields(customer)}))
+        if len(requests) >= batch_size:
+            updated += db.customers.bulk_write(requests, ordered=False).modified_count
+            requests = []
+    if requests:
+        updated += db.customers.bulk_write(requests, ordered=False).modified_count
+    return updated
@@ -0,0 +1,214 @@
+# Workflow stage timestamps, cycle times and SLA breaches
+#
+# Each workflow page stamps `<step>_at` on the customer in the same update
+# that sets `status.<step>`. stage_durations() turns the stamps of every
+# customer into per-stage duration distributions with one aggregation;
+# customers saved before the stamps existed fall back to the creation time
+# of their first MRN / service report through a $lookup.
+import datetime
+import math
+
+from database.connection import customers
+from database import temporary
+
+# Customer timestamp field per workflow step
+STAGE_TIMESTAMPS = {
+    "vendor_registered": "vendor_registered_at",
+    "mrn_created": "mrn_created_at",
+    "service_report_created": "service_report_created_at",
+    "telecontroller_done": "telecontroller_done_at",
+}
+
+# Measured stages: (name, label, start field, end field, step that ends it)
+SEGMENTS = (
+    ("vendor_registration", "Vendor registration", "created_at", "vendor_registered_at", "vendor_registered"),
+    ("mrn", "MRN", "vendor_registered_at", "mrn_created_at", "mrn_created"),
+    ("service_report", "Service report", "mrn_created_at", "service_report_created_at", "service_report_created"),
+    ("telecontroller", "Telecontroller", "service_report_created_at", "telecontroller_done_at", "telecontroller_done"),
+    ("total", "CRM entry to completion", "created_at", "telecontroller_done_at", "telecontroller_done"),
+)
+
+# SLA target per stage, in hours
+SLA_HOURS = {
+    "vendor_registration": 48,
+    "mrn": 72,
+    "service_report": 7 * 24,
+    "telecontroller": 72,
+    "total": 21 * 24,
+}
+
+# Percentiles reported per stage
+PERCENTILES = (50, 90, 95)
+
+# Every stored date sorts after this; missing values and the ISO strings
+# of old MRN documents sort before it (BSON type order)
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+_HOUR_MS = 3600 * 1000
+
+# Customer fields carried through the pipeline
+_FIELDS = ["created_at", "status"] + list(STAGE_TIMESTAMPS.values())
+
+
+def _date_or_null(expression):
+    return {"$cond": [{"$gte": [expression, _EPOCH]}, expression, None]}
+
+
+def _fallback(field, collection, alias):
+    """Stages filling `field` from the earliest related document for customers without it.
+
+    Only customers missing the field get a lookup key, so stamped customers
+    never touch the other collection.
+    """
+    keep = {name: {"$first": f"${name}"} for name in _FIELDS if name != field}
+    return [
+        {"$addFields": {"_lookup_id": {"$cond": [{"$gte": [f"${field}", _EPOCH]}, None, {"$toString": "$_id"}]}}},
+        {"$lookup": {"from": collection, "localField": "_lookup_id", "foreignField": "customer_id", "as": alias}},
+        {"$unwind": {"path": f"${alias}", "preserveNullAndEmptyArrays": True}},
+        # Drafts have no created_at, so $min only sees generated documents
+        {"$group": dict(keep, _id="$_id", **{field: {"$min": {"$ifNull": [
+            _date_or_null(f"${field}"), _date_or_null(f"${alias}.created_at")]}}})},
+    ]
+
+
+def stage_times_pipeline(match=None):
+    """Aggregation stages producing one document per customer with every step timestamp.
+
+    The $lookup fallbacks are only added while some matching customer has
+    a step done without its timestamp.
+    """
+    match = match or {}
+    pipeline = [{"$match": match}, {"$project": {name: 1 for name in _FIELDS}}]
+    for step, collection, alias in (("mrn_created", "mrns", "_mrns"),
+                                    ("service_report_created", "service_reports", "_reports")):
+        field = STAGE_TIMESTAMPS[step]
+        if customers.find_one(dict(match, **{f"status.{step}": True, field: None}), {"_id": 1}):
+            pipeline += _fallback(field, collection, alias)
+    return pipeline
+
+
+def _duration(start, end):
+    return {"$cond": [{"$and": [{"$gte": [start, _EPOCH]}, {"$gte": [end, _EPOCH]}]},
+                      {"$max": [0, {"$subtract": [end, start]}]}, None]}
+
+
+def _histogram(field, sla_ms):
+    return [
+        {"$match": {field: {"$ne": None}}},
+        {"$group": {
+            "_id": {"$floor": {"$divide": [f"${field}", _HOUR_MS]}},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": f"${field}"},
+            "breaches": {"$sum": {"$cond": [{"$gt": [f"${field}", sla_ms]}, 1, 0]}},
+        }},
+    ]
+
+
+def percentile_hours(histogram, percentile):
+    """Upper edge (hours) of the hour bucket holding the given percentile.
+
+    Args:
+        histogram: [(hour bucket, count)] sorted by bucket
+        percentile: 0-100
+
+    Returns:
+        Hours, or None for an empty histogram
+    """
+    total = sum(count for _, count in histogram)
+    if not total:
+        return None
+    rank = max(math.ceil(total * percentile / 100), 1)
+    seen = 0
+    for hour, count in histogram:
+        seen += count
+        if seen >= rank:
+            return hour + 1
+    return histogram[-1][0] + 1
+
+
+def stage_durations(start=None, end=None, now=None, sla_hours=None):
+    """Per-stage cycle time distributions and SLA breaches across customers.
+
+    Finished stages are measured between their two step timestamps; stages
+    still waiting on their step count as open, aged against `now`. The
+    database returns hour-bucket histograms, so the result size does not
+    grow with the number of customers.
+
+    Args:
+        start: Optional first customer creation time (inclusive)
+        end: Optional last customer creation time (exclusive)
+        now: Time open stages are aged against (default: now)
+        sla_hours: Optional {stage: hours} overriding SLA_HOURS
+
+    Returns:
+        {stage: {"label", "sla_hours", "count", "breaches", "breach_rate",
+        "mean_hours", "percentiles" ({50: hours, ...}), "histogram"
+        ([(hour, count)]), "open", "open_breaches"}} in SEGMENTS order
+    """
+    now = now or datetime.datetime.now()
+    targets = dict(SLA_HOURS, **(sla_hours or {}))
+
+    # Placeholders left by earlier versions would age as open stages
+    match = dict(temporary.NOT_TEMPORARY)
+    if start or end:
+        match["created_at"] = {}
+        if start:
+            match["created_at"]["$gte"] = start
+        if end:
+            match["created_at"]["$lt"] = end
+
+    durations, facets = {}, {}
+    for name, _, start_field, end_field, step in SEGMENTS:
+        durations[name] = _duration(f"${start_field}", f"${end_field}")
+        durations[f"{name}_open"] = {"$cond": [
+            {"$and": [{"$gte": [f"${start_field}", _EPOCH]}, {"$ne": [f"$status.{step}", True]}]},
+            {"$max": [0, {"$subtract": [now, f"${start_field}"]}]}, None]}
+        sla_ms = targets[name] * _HOUR_MS
+        facets[name] = _histogram(name, sla_ms)
+        facets[f"{name}_open"] = [
+            {"$match": {f"{name}_open": {"$ne": None}}},
+            {"$group": {"_id": None, "count": {"$sum": 1},
+                        "breaches": {"$sum": {"$cond": [{"$gt": [f"${name}_open", sla_ms]}, 1, 0]}}}},
+        ]
+
+    pipeline = stage_times_pipeline(match) + [{"$project": durations}, {"$facet": facets}]
+    result = next(iter(customers.aggregate(pipeline, allowDiskUse=True)), {})
+
+    stages = {}
+    for name, label, *_ in SEGMENTS:
+        buckets = sorted((int(row["_id"]), row) for row in result.get(name, []))
+        histogram = [(hour, row["count"]) for hour, row in buckets]
+        count = sum(row["count"] for _, row in buckets)
+        breaches = sum(row["breaches"] for _, row in buckets)
+        open_rows = result.get(f"{name}_open") or [{}]
+        stages[name] = {
+            "label": label,
+            "sla_hours": targets[name],
+            "count": count,
+            "breaches": breaches,
+            "breach_rate": breaches / count if count else None,
+            "mean_hours": sum(row["total_ms"] for _, row in buckets) / count / _HOUR_MS if count else None,
+            "percentiles": {p: percentile_hours(histogram, p) for p in PERCENTILES},
+            "histogram": histogram,
+            "open": open_rows[0].get("count", 0),
+            "open_breaches": open_rows[0].get("breaches", 0),
+        }
+    return stages
+
+
+def customer_stage_times(customer_id):
+    """Step timestamps of one customer.
+
+    Returns:
+        {"created_at", "<step>_at" fields (datetime or None), "status"},
+        or None if the customer does not exist
+    """
+    from bson.objectid import ObjectId
+
+    row = next(iter(customers.aggregate(stage_times_pipeline({"_id": ObjectId(customer_id)}))), None)
+    if row is None:
+        return None
+    times = {name: row.get(name) if isinstance(row.get(name), datetime.datetime) else None
+             for name in ["created_at"] + list(STAGE_TIMESTAMPS.values())}
+    times["status"] = row.get("status") or {}
+    return times
@@ -0,0 +1,156 @@
+# Server-side drafts of in-progress forms
+#
+# One document per (customer, form), with _id "<customer_id>/<form>", so a
+# save is a single upsert and there is never more than one draft per form:
+#   {"_id", "customer_id", "form", "values": {field: value}, "updated_at"}
+# save_draft() only $sets the fields that changed since the caller's last
+# save. Drafts expire DRAFT_TTL_DAYS after their last change through a TTL
+# index; load_draft() also skips expired drafts, since the embedded backend
+# does not run TTL deletes. Generated MRNs and saved service reports
+# discard their draft. Saves and discards go through the write journal
+# (database/writeback.py), so they cost a local fsync and keep their order.
+import datetime
+import os
+
+from database.connection import drafts
+from database import writeback
+
+# Days a draft is kept after its last change
+DRAFT_TTL_DAYS = int(os.environ.get("DRAFT_TTL_DAYS", "14"))
+
+MRN = "mrn"
+SERVICE_REPORT = "service_report"
+
+_indexed = False
+
+
+def ensure_indexes(db=None):
+    """Create the TTL index on updated_at and the per-customer index."""
+    target = db.drafts if db is not None else drafts
+    target.create_index("updated_at", expireAfterSeconds=DRAFT_TTL_DAYS * 86400)
+    target.create_index("customer_id")
+
+
+def _ensure_indexes():
+    global _indexed
+    if not _indexed:
+        ensure_indexes()
+        _indexed = True
+
+
+def encode(value):
+    """Make a widget value storable (BSON has no date-only or time-of-day types)."""
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"__time__": value.isoformat()}
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    return value
+
+
+def decode(value):
+    """Inverse of encode()."""
+    if isinstance(value, dict):
+        if set(value) == {"__date__"}:
+            return datetime.date.fromisoformat(value["__date__"])
+        if set(value) == {"__time__"}:
+            return datetime.time.fromisoformat(value["__time__"])
+        return {key: decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+def draft_id(customer_id, form):
+    """_id of a form's draft."""
+    return f"{customer_id}/{form}"
+
+
+def save_draft(customer_id, form, values, previous=None):
+    """Upsert the fields of a draft that changed since `previous`.
+
+    Args:
+        customer_id: Customer the form belongs to
+        form: Form name (MRN or SERVICE_REPORT)
+        values: {field: value} of the whole form; field names must not contain dots
+        previous: Encoded values returned by the last save_draft() or
+            load_draft() for this form, or None to write every field
+
+    Returns:
+        The encoded values, to pass as `previous` next time
+    """
+    encoded = {field: encode(value) for field, value in values.items()}
+    if previous is None:
+        changes = {"values": encoded}
+        removed = {}
+    else:
+        changes = {f"values.{field}": value for field, value in encoded.items()
+                   if field not in previous or previous[field] != value}
+        removed = {f"values.{field}": "" for field in previous if field not in encoded}
+    if not changes and not removed:
+        return encoded
+
+    update = {"$set": dict(changes, updated_at=datetime.datetime.now()),
+              "$setOnInsert": {"customer_id": str(customer_id), "form": form}}
+    if removed:
+        update["$unset"] = removed
+    writeback.submit(writeback.DRAFT, {"_id": draft_id(customer_id, form), "update": update})
+    return encoded
+
+
+def load_draft(customer_id, form):
+    """A saved draft that has not expired.
+
+    Returns:
+        (values, encoded values, updated_at), or None without a draft
+    """
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=DRAFT_TTL_DAYS)
+    draft = drafts.find_one({"_id": draft_id(customer_id, form), "updated_at": {"$gte": cutoff}})
+    if not draft:
+        return None
+    encoded = draft.get("values") or {}
+    return decode(encoded), encoded, draft["updated_at"]
+
+
+def discard_draft(customer_id, form):
+    """Delete the draft of a form that has been saved for real."""
+    writeback.submit(writeback.DRAFT, {"_id": draft_id(customer_id, form), "delete": True})
+
+
+def apply_draft(payload):
+    """Apply a journaled draft write: {"_id", "update"} upserts, {"_id", "delete": True} deletes."""
+    from database import sync
+
+    if payload.get("delete"):
+        # Only a draft that exists leaves a tombstone for sync clients
+        if drafts.delete_one({"_id": payload["_id"]}).deleted_count:
+            sync.tombstone("drafts", payload["_id"])
+    else:
+        _ensure_indexes()
+        update = dict(payload["update"])
+        update["$set"] = dict(update.get("$set") or {}, **sync.stamp())
+        drafts.update_one({"_id": payload["_id"]}, update, upsert=True)
+        sync.revive("drafts", payload["_id"])
+
+
+def migrate_mrn_drafts(db):
+    """Move drafts saved in the mrns collection (is_draft) to drafts; returns the number moved."""
+    ensure_indexes(db)
+    moved = 0
+    for legacy in db.mrns.find({"is_draft": True}):
+        values = {field: value for field, value in legacy.items()
+                  if field not in ("_id", "customer_id", "is_draft", "updated_at")}
+        # A draft already in the drafts collection is newer and wins
+        db.drafts.update_one({"_id": draft_id(legacy["customer_id"], MRN)},
+                             {"$setOnInsert": {"customer_id": legacy["customer_id"], "form": MRN,
+                                               "values": values,
+                                               "updated_at": legacy.get("updated_at") or datetime.datetime.now()}},
+                             upsert=True)
+        db.mrns.delete_one({"_id": legacy["_id"]})
+        moved += 1
+    return moved
@@ -0,0 +1,185 @@
+# Append-only workflow event log
+#
+# Every workflow transition appends one small document to workflow_events
+# next to the state change it records:
+#   {"c": customer id (str), "t": time, "k": kind, "v": False (step undone, optional), "r": MRN/SR code (optional)}
+# The (c, t) index makes a customer's history one range read. Replaying the
+# log rebuilds the customers' status and step timestamps, from which
+# tools/rebuild_rollups.py rebuilds the rollups.
+import datetime
+
+from database.connection import workflow_events
+from database.cycle_times import STAGE_TIMESTAMPS
+
+CREATED = "created"
+VENDOR_REGISTERED = "vendor_registered"
+MRN_CREATED = "mrn_created"
+SR_CREATED = "sr_created"
+SR_UPDATED = "sr_updated"
+TELECONTROLLER_DONE = "telecontroller_done"
+
+# Workflow step set (or cleared) by each event kind
+STEP_OF_KIND = {
+    VENDOR_REGISTERED: "vendor_registered",
+    MRN_CREATED: "mrn_created",
+    SR_CREATED: "service_report_created",
+    TELECONTROLLER_DONE: "telecontroller_done",
+}
+
+# Code stored with the event ("r")
+REF_FIELDS = {MRN_CREATED: "mrn_code", SR_CREATED: "sr_code"}
+
+# Steps a customer starts with
+EMPTY_STATUS = {step: False for step in STAGE_TIMESTAMPS}
+
+_indexed = False
+
+
+def ensure_indexes(db=None):
+    """Create the (customer, time) index the timeline reads use."""
+    target = db.workflow_events if db is not None else workflow_events
+    target.create_index([("c", 1), ("t", 1)])
+
+
+def event(customer_id, kind, when=None, done=True, ref=None):
+    """Build one event document."""
+    document = {"c": str(customer_id), "t": when or datetime.datetime.now(), "k": kind}
+    if not done:
+        document["v"] = False
+    if ref:
+        document["r"] = ref
+    return document
+
+
+def record(customer_id, kind, when=None, done=True, ref=None, key=None):
+    """Append one event.
+
+    Args:
+        customer_id: Customer the transition belongs to
+        kind: One of the event kinds above
+        when: Time of the transition; pass the time written with the state change
+        done: False when a step is undone (vendor registration unchecked)
+        ref: Optional MRN or SR code
+        key: Idempotency key of the journaled write recording it; the event
+            is then recorded once however often the write is replayed
+    """
+    from pymongo.errors import DuplicateKeyError
+
+    global _indexed
+    if not _indexed:
+        ensure_indexes()
+        _indexed = True
+    document = event(customer_id, kind, when, done, ref)
+    if key:
+        from bson.objectid import ObjectId
+        # Time of the transition, then the key: the same _id on every replay
+        document["_id"] = ObjectId(f"{int(document['t'].timestamp()) & 0xFFFFFFFF:08x}{key[:16]}")
+    try:
+        workflow_events.insert_one(document)
+    except DuplicateKeyError:
+        pass
+
+
+def timeline(customer_id):
+    """Events of one customer, oldest first (one indexed range read)."""
+    return list(workflow_events.find({"c": str(customer_id)}, {"_id": 0}).sort([("t", 1), ("_id", 1)]))
+
+
+def replay(events):
+    """Fold one customer's events (oldest first) into its projected state.
+
+    Returns:
+        {"created_at", "status", "<step>_at" for each step (None when not done)}
+    """
+    state = {"created_at": None, "status": dict(EMPTY_STATUS)}
+    state.update({field: None for field in STAGE_TIMESTAMPS.values()})
+    for entry in events:
+        kind = entry["k"]
+        if kind == CREATED:
+            state["created_at"] = entry["t"]
+        elif kind in STEP_OF_KIND:
+            step = STEP_OF_KIND[kind]
+            done = entry.get("v", True)
+            state["status"][step] = done
+            state[STAGE_TIMESTAMPS[step]] = entry["t"] if done else None
+    return state
+
+
+def project(db):
+    """Yield (customer_id, state) for every customer in the log, replaying one customer at a time."""
+    current, pending = None, []
+    for entry in db.workflow_events.find({}, {"_id": 0}).sort([("c", 1), ("t", 1), ("_id", 1)]):
+        if entry["c"] != current and pending:
+            yield current, replay(pending)
+            pending = []
+        current = entry["c"]
+        pending.append(entry)
+    if pending:
+        yield current, replay(pending)
+
+
+def rebuild_projections(db, batch_size=1000):
+    """Rewrite customers' status and step timestamps from the log; returns the number of customers updated."""
+    from bson.objectid import ObjectId
+    from pymongo import UpdateOne
+
+    ensure_indexes(db)
+    updated = 0
+    requests = []
+    for customer_id, state in project(db):
+        values = {"status": state["status"]}
+        cleared = {}
+        for field in STAGE_TIMESTAMPS.values():
+            if state[field]:
+                values[field] = state[field]
+            else:
+                cleared[field] = ""
+        if state["created_at"]:
+            values["created_at"] = state["created_at"]
+        update = {"$set": values}
+        if cleared:
+            update["$unset"] = cleared
+        requests.append(UpdateOne({"_id": ObjectId(customer_id)}, update))
+        if len(requests) >= batch_size:
+            updated += db.customers.bulk_write(requests, ordered=False).matched_count
+            requests = []
+    if requests:
+        updated += db.customers.bulk_write(requests, ordered=False).matched_count
+    return updated
+
+
+def events_from_customer(customer):
+    """Events reconstructed from a customer document (for data written before the log existed)."""
+    customer_id = customer["_id"]
+    created = customer.get("created_at")
+    status = customer.get("status") or {}
+    events = [event(customer_id, CREATED, created)] if created else []
+    for kind, step in STEP_OF_KIND.items():
+        if status.get(step):
+            # Steps without a timestamp are placed at the customer's creation
+            when = customer.get(STAGE_TIMESTAMPS[step]) or created
+            ref = customer.get(REF_FIELDS[kind]) if kind in REF_FIELDS else None
+            events.append(event(customer_id, kind, when, ref=ref))
+    return events
+
+
+def backfill(db, batch_size=1000):
+    """Write reconstructed events for customers that have none; returns the number of events written."""
+    ensure_indexes(db)
+    logged = set(db.workflow_events.distinct("c"))
+    fields = {"created_at": 1, "status": 1, **{field: 1 for field in REF_FIELDS.values()},
+              **{field: 1 for field in STAGE_TIMESTAMPS.values()}}
+    written = 0
+    batch = []
+    for customer in db.customers.find({}, fields):
+        if str(customer["_id"]) in logged:
+            continue
+        batch.extend(events_from_customer(customer))
+        if len(batch) >= batch_size:
+            db.workflow_events.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.workflow_events.insert_many(batch, ordered=False)
+        written += len(batch)
+    return written
@@ -0,0 +1,233 @@
+# Machine registry keyed by normalized serial number
+#
+# One document per machine, with _id = the serial number uppercased and
+# stripped of spaces and punctuation, so "sn-0012 3" and "SN00123" are the
+# same machine and a machine is always one _id lookup. MRN and service
+# report saves pass their old and new documents to record_mrn() /
+# record_report(), which move the documents' contributions with $inc like
+# the daily rollups:
+#   mrns, mrn_codes          MRNs raised for the machine
+#   visits, last_service     service reports and the latest service date
+#   parts_minor, labor_minor cumulative costs in cents
+#   open_follow_ups          reports with a follow-up, listed in follow_ups {sr_code: {date, details}}
+# tools/rebuild_rollups.py --machines recomputes the registry from the raw collections.
+import datetime
+import re
+
+from database.connection import machines
+
+# Service report fields read by record_report() (add to pre-image projections)
+REPORT_FIELDS = ["sr_code", "customer_id", "serial_number", "make_model", "type_of_machine", "service_date",
+                 "total_parts_minor", "total_labor_minor", "total_parts_cost", "total_labor_cost",
+                 "follow_up_required", "follow_up_details", "follow_up_date"]
+
+# MRN fields read by record_mrn()
+MRN_FIELDS = ["mrn_code", "customer_id", "serial_no", "model", "machine_type", "created_at"]
+
+_NON_ALNUM = re.compile(r"[^0-9A-Z]+")
+
+
+def normalize_serial(serial):
+    """Registry key of a serial number ("sn-0012 3" -> "SN00123")."""
+    return _NON_ALNUM.sub("", str(serial or "").upper())
+
+
+def _as_datetime(value):
+    # MRNs saved before the stamps were datetimes store ISO strings
+    if isinstance(value, str) and value:
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value if isinstance(value, datetime.datetime) else None
+
+
+def _report_costs(report):
+    from utils.costs import to_minor
+
+    parts = report.get("total_parts_minor")
+    labor = report.get("total_labor_minor")
+    parts = parts if parts is not None else to_minor(report.get("total_parts_cost"))
+    labor = labor if labor is not None else to_minor(report.get("total_labor_cost"))
+    return parts, labor
+
+
+def report_counters(report, sign=1):
+    """Counters one service report contributes to its machine."""
+    parts, labor = _report_costs(report)
+    return {
+        "visits": sign,
+        "parts_minor": sign * parts,
+        "labor_minor": sign * labor,
+        "open_follow_ups": sign if report.get("follow_up_required") else 0,
+    }
+
+
+def _follow_up(report):
+    return {"date": report.get("follow_up_date"), "details": report.get("follow_up_details") or ""}
+
+
+def _update(updates, serial):
+    return updates.setdefault(serial, {"$inc": {}, "$set": {}, "$unset": {}, "$max": {}, "$min": {}})
+
+
+def _apply(updates, upsert_serial):
+    now = datetime.datetime.now()
+    for serial, update in updates.items():
+        update["$inc"] = {name: value for name, value in update["$inc"].items() if value}
+        update["$set"]["updated_at"] = now
+        update = {operator: fields for operator, fields in update.items() if fields}
+        machines.update_one({"_id": serial}, update, upsert=serial == upsert_serial)
+
+
+def record_mrn(old_mrn, new_mrn):
+    """Move an MRN from its old machine (None for a new MRN) to its current one."""
+    old_serial = normalize_serial(old_mrn.get("serial_no")) if old_mrn else ""
+    new_serial = normalize_serial(new_mrn.get("serial_no")) if new_mrn else ""
+    updates = {}
+    if old_serial and old_serial != new_serial:
+        update = _update(updates, old_serial)
+        update["$inc"]["mrns"] = -1
+        update["$pull"] = {"mrn_codes": old_mrn.get("mrn_code")}
+    if new_serial:
+        update = _update(updates, new_serial)
+        update["$set"].update({"serial_no": new_mrn.get("serial_no"), "customer_id": new_mrn.get("customer_id")})
+        for field in ("model", "machine_type"):
+            if new_mrn.get(field):
+                update["$set"][field] = new_mrn[field]
+        if old_serial != new_serial:
+            update["$inc"]["mrns"] = 1
+            update["$addToSet"] = {"mrn_codes": new_mrn.get("mrn_code")}
+            created = _as_datetime(new_mrn.get("created_at"))
+            if created:
+                update["$min"]["first_seen"] = created
+    _apply(updates, new_serial)
+
+
+def record_report(old_report, new_report, sr_code=None):
+    """Move a service report's contribution from its old machine/values to the new ones.
+
+    Args:
+        old_report: Pre-image of the report (REPORT_FIELDS), or None for a new report
+        new_report: The saved report, or None
+        sr_code: Code of the report when the documents do not carry it
+    """
+    code = sr_code or (new_report or {}).get("sr_code") or (old_report or {}).get("sr_code")
+    old_serial = normalize_serial(old_report.get("serial_number")) if old_report else ""
+    new_serial = normalize_serial(new_report.get("serial_number")) if new_report else ""
+    updates = {}
+    if old_serial:
+        update = _update(updates, old_serial)
+        for name, value in report_counters(old_report, sign=-1).items():
+            update["$inc"][name] = update["$inc"].get(name, 0) + value
+        if old_report.get("follow_up_required") and code:
+            update["$unset"][f"follow_ups.{code}"] = ""
+    if new_serial:
+        update = _update(updates, new_serial)
+        for name, value in report_counters(new_report).items():
+            update["$inc"][name] = update["$inc"].get(name, 0) + value
+        update["$set"].update({"serial_no": new_report.get("serial_number"),
+                               "customer_id": new_report.get("customer_id")})
+        if new_report.get("make_model"):
+            update["$set"]["model"] = new_report["make_model"]
+        if new_report.get("type_of_machine"):
+            update["$set"]["machine_type"] = new_report["type_of_machine"]
+        if new_report.get("follow_up_required") and code:
+            update["$set"][f"follow_ups.{code}"] = _follow_up(new_report)
+            update["$unset"].pop(f"follow_ups.{code}", None)
+        service_date = new_report.get("service_date")
+        if isinstance(service_date, datetime.datetime):
+            update["$max"]["last_service"] = service_date
+            update["$min"]["first_seen"] = service_date
+    _apply(updates, new_serial)
+
+
+def get_machine(serial):
+    """Registry document of a machine, or None (one _id read)."""
+    key = normalize_serial(serial)
+    return machines.find_one({"_id": key}) if key else None
+
+
+def customer_machines(customer_id):
+    """Registry documents of a customer's machines, most recently serviced first."""
+    return list(machines.find({"customer_id": str(customer_id)}).sort([("last_service", -1), ("_id", 1)]))
+
+
+def compute_machines(db):
+    """Compute every registry document from the MRNs and service reports.
+
+    Descriptive fields (serial as entered, customer, model, type) come from
+    the latest document mentioning the machine.
+
+    Returns:
+        {serial: document}
+    """
+    documents = {}
+    latest = {}
+
+    def describe(serial, when, fields):
+        if when is not None and (serial not in latest or when >= latest[serial]):
+            latest[serial] = when
+            documents[serial].update({name: value for name, value in fields.items() if value or name == "customer_id"})
+
+    def machine(serial):
+        return documents.setdefault(serial, {"_id": serial, "mrns": 0, "mrn_codes": [], "visits": 0,
+                                             "parts_minor": 0, "labor_minor": 0, "open_follow_ups": 0,
+                                             "follow_ups": {}})
+
+    for mrn in db.mrns.find({}, MRN_FIELDS):
+        serial = normalize_serial(mrn.get("serial_no"))
+        if not serial:
+            continue
+        document = machine(serial)
+        document["mrns"] += 1
+        if mrn.get("mrn_code") not in document["mrn_codes"]:
+            document["mrn_codes"].append(mrn.get("mrn_code"))
+        created = _as_datetime(mrn.get("created_at"))
+        if created and created < document.get("first_seen", datetime.datetime.max):
+            document["first_seen"] = created
+        describe(serial, created or datetime.datetime.min,
+                 {"serial_no": mrn.get("serial_no"), "customer_id": mrn.get("customer_id"),
+                  "model": mrn.get("model"), "machine_type": mrn.get("machine_type")})
+
+    for report in db.service_reports.find({}, REPORT_FIELDS):
+        serial = normalize_serial(report.get("serial_number"))
+        if not serial:
+            continue
+        document = machine(serial)
+        for name, value in report_counters(report).items():
+            document[name] += value
+        if report.get("follow_up_required") and report.get("sr_code"):
+            document["follow_ups"][report["sr_code"]] = _follow_up(report)
+        service_date = report.get("service_date")
+        if isinstance(service_date, datetime.datetime):
+            document["last_service"] = max(document.get("last_service", service_date), service_date)
+            document["first_seen"] = min(document.get("first_seen", service_date), service_date)
+        describe(serial, service_date if isinstance(service_date, datetime.datetime) else datetime.datetime.min,
+                 {"serial_no": report.get("serial_number"), "customer_id": report.get("customer_id"),
+                  "model": report.get("make_model"), "machine_type": report.get("type_of_machine")})
+    return documents
+
+
+def ensure_indexes(db, name="machines"):
+    """Indexes for a customer's machines and for machines with open follow-ups."""
+    db[name].create_index([("customer_id", 1), ("last_service", -1)])
+    db[name].create_index("open_follow_ups", partialFilterExpression={"open_follow_ups": {"$gt": 0}})
+
+
+def rebuild(db, batch_size=1000):
+    """Recompute the machines collection from scratch; returns the number of machines written.
+
+    Built in a scratch collection that replaces machines in one rename, as
+    rollups.rebuild() does.
+    """
+    documents = list(compute_machines(db).values())
+    rebuilt_at = datetime.datetime.now()
+    scratch = db["machines_rebuild"]
+    scratch.drop()
+    # The indexes move with the collection on rename
+    ensure_indexes(db, scratch.name)
+    for i in range(0, len(documents), batch_size):
+        scratch.insert_many([dict(document, updated_at=rebuilt_at) for document in documents[i:i + batch_size]])
+    scratch.rename("machines", dropTarget=True)
+    return len(documents)
@@ -0,0 +1,404 @@
+# Query monitoring: per-shape statistics and slow-query log
+import os
+import json
+import math
+import time
+import datetime
+import threading
+from collections import OrderedDict, deque
+
+import bson
+from bson import json_util
+from pymongo import monitoring
+
+from utils import metrics
+
+# Commands slower than this (in milliseconds) are recorded in the slow-query log
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+
+# Where snapshots are written for the CLI report (empty string disables flushing)
+QUERY_STATS_PATH = os.environ.get("QUERY_STATS_PATH", ".query_stats.json")
+
+# How often (in seconds) the snapshot file is refreshed
+FLUSH_INTERVAL = 30.0
+
+# Number of recent latencies kept per shape for percentile calculation
+LATENCY_WINDOW = 1024
+
+# Only data commands are fingerprinted; handshakes, heartbeats and auth are ignored
+TRACKED_COMMANDS = {
+    "find", "getMore", "aggregate", "count", "distinct",
+    "insert", "update", "delete", "findAndModify",
+}
+
+# Open cursors remembered for getMore attribution; the oldest are forgotten
+# past this, covering cursors that are neither exhausted nor killed
+MAX_OPEN_CURSORS = 10000
+
+# Commands that can be wrapped in an `explain`
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+# Driver-internal fields stripped from commands kept for the slow log
+_INTERNAL_FIELDS = {"lsid", "$clusterTime", "$db", "txnNumber", "$readPreference", "documents"}
+
+
+def _shape(value):
+    """Replace literal values with '?' while keeping field names and operators."""
+    if isinstance(value, dict):
+        return {key: _shape(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        # Lists of sub-documents ($and/$or, pipelines) keep their structure
+        if value and all(isinstance(item, dict) for item in value):
+            return [_shape(item) for item in value]
+        return "?"
+    return "?"
+
+
+def _ordered_keys(value):
+    """Keep only the key order of a sort/projection specification."""
+    if isinstance(value, dict):
+        return list(value.keys())
+    return "?"
+
+
+def fingerprint(command_name, command):
+    """Build a stable query-shape string for a command.
+
+    Args:
+        command_name: The name of the command (find, aggregate, update...)
+        command: The command document sent to the server
+
+    Returns:
+        A string such as 'find customers {"name": {"$options": "?", "$regex": "?"}}'
+    """
+    collection = command.get(command_name)
+    parts = [command_name, str(collection)]
+
+    if command_name == "find":
+        parts.append(json.dumps(_shape(command.get("filter", {}))))
+        if command.get("sort"):
+            parts.append("sort " + json.dumps(_ordered_keys(command["sort"])))
+        if command.get("projection"):
+            parts.append("proj " + json.dumps(sorted(command["projection"])))
+    elif command_name == "aggregate":
+        parts.append(json.dumps(_shape(command.get("pipeline", []))))
+    elif command_name == "count":
+        parts.append(json.dumps(_shape(command.get("query", {}))))
+    elif command_name == "distinct":
+        parts.append(str(command.get("key")))
+        parts.append(json.dumps(_shape(command.get("query", {}))))
+    elif command_name == "update":
+        statements = command.get("updates", [])
+        if statements:
+            first = statements[0]
+            parts.append(json.dumps(_shape(first.get("q", {}))))
+            update = first.get("u", {})
+            if isinstance(update, dict):
+                parts.append("set " + json.dumps(sorted(update)))
+            if first.get("upsert"):
+                parts.append("upsert")
+    elif command_name == "delete":
+        statements = command.get("deletes", [])
+        if statements:
+            parts.append(json.dumps(_shape(statements[0].get("q", {}))))
+    elif command_name == "findAndModify":
+        parts.append(json.dumps(_shape(command.get("query", {}))))
+        if command.get("sort"):
+            parts.append("sort " + json.dumps(_ordered_keys(command["sort"])))
+
+    return " ".join(parts)
+
+
+def _documents_returned(command_name, reply):
+    """Count the documents a reply carried back to the client."""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name in ("count", "distinct", "findAndModify"):
+        return 1 if reply.get("value", reply.get("n", reply.get("values"))) is not None else 0
+    return int(reply.get("n", 0) or 0)
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(rank, 1)) - 1]
+
+
+class ShapeStats:
+    """Accumulated statistics for one query shape."""
+
+    __slots__ = ("shape", "command_name", "collection", "count", "failures",
+                 "total_ms", "max_ms", "docs_returned", "bytes_returned", "latencies")
+
+    def __init__(self, shape, command_name, collection):
+        self.shape = shape
+        self.command_name = command_name
+        self.collection = collection
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.docs_returned = 0
+        self.bytes_returned = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def as_dict(self):
+        latencies = sorted(self.latencies)
+        return {
+            "shape": self.shape,
+            "command": self.command_name,
+            "collection": self.collection,
+            "count": self.count,
+            "failures": self.failures,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(_percentile(latencies, 50), 3),
+            "p95_ms": round(_percentile(latencies, 95), 3),
+            "p99_ms": round(_percentile(latencies, 99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "docs_returned": self.docs_returned,
+            "bytes_returned": self.bytes_returned,
+        }
+
+
+class QueryStatsListener(monitoring.CommandListener):
+    """pymongo command listener that fingerprints commands and tracks their cost."""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, stats_path=QUERY_STATS_PATH):
+        self.slow_query_ms = slow_query_ms
+        self.stats_path = stats_path
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._pending = {}
+        self._cursors = OrderedDict()    # cursor id -> shape that opened it
+        self._slow = deque(maxlen=200)
+        self._last_flush = time.monotonic()
+        self.started_at = datetime.datetime.now()
+
+    # --- pymongo.monitoring.CommandListener interface ---
+
+    def started(self, event):
+        name = event.command_name
+        if name == "killCursors":
+            # Closed before they were exhausted
+            with self._lock:
+                for cursor_id in event.command.get("cursors") or ():
+                    self._cursors.pop(cursor_id, None)
+            return
+        if name not in TRACKED_COMMANDS:
+            return
+
+        if name == "getMore":
+            # Attribute follow-up batches to the shape that opened the cursor
+            cursor_id = event.command.get("getMore")
+            shape = self._cursors.get(cursor_id, f"getMore {event.command.get('collection')}")
+            explainable = None
+        else:
+            cursor_id = None
+            shape = fingerprint(name, event.command)
+            explainable = event.command if name in EXPLAINABLE_COMMANDS else None
+
+        self._pending[(event.connection_id, event.request_id)] = (shape, explainable, cursor_id)
+
+    def succeeded(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        shape, command, getmore_cursor_id = pending
+        name = event.command_name
+        reply = event.reply or {}
+        duration_ms = event.duration_micros / 1000.0
+
+        docs = _documents_returned(name, reply)
+        size = len(bson.encode(reply)) if "cursor" in reply or name == "findAndModify" else 0
+
+        # Remember which shape owns an open cursor so getMore batches are attributed to it
+        cursor = reply.get("cursor")
+        if isinstance(cursor, dict):
+            cursor_id = cursor.get("id", 0)
+            with self._lock:
+                if cursor_id:
+                    self._cursors[cursor_id] = shape
+                    while len(self._cursors) > MAX_OPEN_CURSORS:
+                        self._cursors.popitem(last=False)
+                elif getmore_cursor_id is not None:
+                    # Cursor exhausted
+                    self._cursors.pop(getmore_cursor_id, None)
+
+        self._record(shape, name, event.database_name, duration_ms, docs, size, failed=False)
+
+        if duration_ms >= self.slow_query_ms:
+            self._log_slow(shape, name, event.database_name, duration_ms, docs, command)
+
+        self._maybe_flush()
+
+    def failed(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        shape, _, getmore_cursor_id = pending
+        if getmore_cursor_id is not None:
+            # A failed getMore (e.g. cursor not found) leaves nothing to resume
+            with self._lock:
+                self._cursors.pop(getmore_cursor_id, None)
+        self._record(shape, event.command_name, event.database_name,
+                     event.duration_micros / 1000.0, 0, 0, failed=True)
+
+    # --- accumulation ---
+
+    def _record(self, shape, command_name, database_name, duration_ms, docs, size, failed):
+        with self._lock:
+            stats = self._stats.get(shape)
+            if stats is None:
+                collection = shape.split(" ", 2)[1] if " " in shape else ""
+                stats = self._stats[shape] = ShapeStats(shape, command_name, f"{database_name}.{collection}")
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.latencies.append(duration_ms)
+            if duration_ms > stats.max_ms:
+                stats.max_ms = duration_ms
+            stats.docs_returned += docs
+            stats.bytes_returned += size
+            if failed:
+                stats.failures += 1
+
+    def _log_slow(self, shape, command_name, database_name, duration_ms, docs, command):
+        entry = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "shape": shape,
+            "command_name": command_name,
+            "database": database_name,
+            "duration_ms": round(duration_ms, 3),
+            "docs_returned": docs,
+            # Keep the original command (minus driver internals) so it can be explained later
+            "command": ({k: v for k, v in command.items() if k not in _INTERNAL_FIELDS}
+                        if command is not None else None),
+        }
+        with self._lock:
+            self._slow.append(entry)
+
+    # --- reporting ---
+
+    def snapshot(self):
+        """Return the current statistics as a JSON-serializable dict."""
+        with self._lock:
+            shapes = [stats.as_dict() for stats in self._stats.values()]
+            slow = list(self._slow)
+
+        shapes.sort(key=lambda s: s["total_ms"], reverse=True)
+        return {
+            "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "slow_query_ms": self.slow_query_ms,
+            "shapes": shapes,
+            # Commands may contain BSON types, so serialize them with Extended JSON
+            "slow_queries": [dict(entry, command=json_util.dumps(entry["command"]) if entry["command"] else None)
+                             for entry in reversed(slow)],
+        }
+
+    def reset(self):
+        """Clear all accumulated statistics and the slow-query log."""
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+            self.started_at = datetime.datetime.now()
+
+    def dump(self, path=None):
+        """Write a snapshot to disk atomically.
+
+        Args:
+            path: Destination file, defaults to QUERY_STATS_PATH
+        """
+        path = path or self.stats_path
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _maybe_flush(self):
+        now = time.monotonic()
+        if not self.stats_path or now - self._last_flush < FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        try:
+            self.dump()
+        except OSError:
+            # Reporting must never break the query path
+            pass
+
+
+def explain_command(client, database_name, command, verbosity="queryPlanner"):
+    """Run `explain` for a command captured in the slow-query log.
+
+    Args:
+        client: A MongoClient to run the explain on
+        database_name: The database the command ran against
+        command: The command document (dict or Extended JSON string)
+        verbosity: queryPlanner, executionStats or allPlansExecution
+
+    Returns:
+        The explain output document
+    """
+    if isinstance(command, str):
+        command = json_util.loads(command)
+    return client[database_name].command({"explain": command, "verbosity": verbosity})
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Connection-pool listener feeding checkout wait and usage into utils/metrics.py."""
+
+    def __init__(self):
+        # Checkout events for one operation are published on the thread running it
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "checkout_started", None)
+        if started is not None:
+            metrics.mongo_pool_checkout_seconds.observe(time.perf_counter() - started)
+            self._local.checkout_started = None
+        metrics.mongo_pool_checked_out.inc()
+
+    def connection_check_out_failed(self, event):
+        started = getattr(self._local, "checkout_started", None)
+        if started is not None:
+            metrics.mongo_pool_checkout_seconds.observe(time.perf_counter() - started)
+            self._local.checkout_started = None
+        metrics.mongo_pool_checkout_failures.inc(reason=str(event.reason))
+
+    def connection_checked_in(self, event):
+        metrics.mongo_pool_checked_out.dec()
+
+    # Remaining pool events are not needed for metrics
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+# Process-wide listeners registered with the MongoClient in database/connection.py
+query_stats = QueryStatsListener()
+pool_metrics = PoolMetricsListener()
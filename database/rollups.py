@@ -0,0 +1,324 @@
+# Daily rollups for dashboards, maintained incrementally by the write paths
+#
+# One document per day x service_type x machine_type x machine_status x engineer holds
+# counters that are only ever changed with $inc. Rows for events that have
+# no service report (new customers, MRNs, status flips) use "-" for the
+# report dimensions. tools/rebuild_rollups.py recomputes everything from the
+# raw collections.
+import datetime
+
+from database.connection import daily_rollups
+from database.cycle_times import STAGE_TIMESTAMPS
+
+# Rollup key fields, in _id order
+DIMENSIONS = ("day", "service_type", "machine_type", "machine_status", "engineer")
+
+# Value for a dimension that does not apply to the event
+NO_DIMENSION = "-"
+
+# Workflow steps in order; a customer is complete when all are done
+STAGES = ("vendor_registered", "mrn_created", "service_report_created", "telecontroller_done")
+
+# Service report fields read by report_key() and report_counters()
+REPORT_FIELDS = ["service_date", "service_type_ws", "service_type_gs", "other_service_types", "type_of_machine",
+                 "service_status", "service_advisor", "staff_assigned.name", "labor_costs.hours",
+                 "total_parts_minor", "total_labor_minor", "total_parts_cost", "total_labor_cost",
+                 "satisfaction_level"]
+
+
+def _day(when):
+    if isinstance(when, datetime.datetime):
+        return when.strftime("%Y-%m-%d")
+    if isinstance(when, datetime.date):
+        return when.isoformat()
+    if isinstance(when, str) and when:
+        return when[:10]
+    return datetime.datetime.now().strftime("%Y-%m-%d")
+
+
+def _as_datetime(value):
+    # The MRN page stores created_at as an ISO string
+    if isinstance(value, str) and value:
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value if isinstance(value, datetime.datetime) else None
+
+
+def rollup_key(day, service_type=NO_DIMENSION, machine_type=NO_DIMENSION, machine_status=NO_DIMENSION,
+               engineer=NO_DIMENSION):
+    """Return the rollup key dict for one row."""
+    return {"day": day, "service_type": service_type, "machine_type": machine_type,
+            "machine_status": machine_status, "engineer": engineer}
+
+
+def report_key(report):
+    """Rollup key of a service report: service day, service and machine type, outcome and engineer."""
+    if report.get("service_type_ws"):
+        service_type = "WS"
+    elif report.get("service_type_gs"):
+        service_type = "GS"
+    elif report.get("other_service_types"):
+        service_type = report["other_service_types"][0]
+    else:
+        service_type = NO_DIMENSION
+
+    staff = [entry.get("name") for entry in report.get("staff_assigned") or [] if entry and entry.get("name")]
+    engineer = report.get("service_advisor") or (staff[0] if staff else NO_DIMENSION)
+    return rollup_key(_day(report.get("service_date")), service_type,
+                      (report.get("type_of_machine") or "").strip() or NO_DIMENSION,
+                      report.get("service_status") or NO_DIMENSION, engineer)
+
+
+def report_counters(report, sign=1):
+    """Counters one service report contributes to its rollup row."""
+    from utils.costs import to_minor
+
+    # Labour hours in hundredths keep the sums exact
+    hours = sum(to_minor(entry.get("hours")) for entry in report.get("labor_costs") or [] if entry)
+    parts = report.get("total_parts_minor")
+    labor = report.get("total_labor_minor")
+    parts = parts if parts is not None else to_minor(report.get("total_parts_cost"))
+    labor = labor if labor is not None else to_minor(report.get("total_labor_cost"))
+    counters = {
+        "reports": sign,
+        "parts_minor": sign * parts,
+        "labor_minor": sign * labor,
+        "grand_total_minor": sign * (parts + labor),
+        "labor_hours_hundredths": sign * hours,
+    }
+    satisfaction = report.get("satisfaction_level")
+    if satisfaction:
+        counters[f"satisfaction.{int(satisfaction)}"] = sign
+    return counters
+
+
+def status_counters(before, after, created_at=None, when=None):
+    """Counters for a change of customer workflow status.
+
+    Each step that flips adds +1 (or -1 when undone) to `transitions.<step>`;
+    `transitions.started` and `transitions.completed` track customers with
+    at least one and with all steps done. Steps completed get their cycle
+    time since the customer was created in `cycle.<step>.seconds` / `.count`.
+    """
+    before = before or {}
+    after = after or {}
+    counters = {}
+    for stage in STAGES:
+        was, now = bool(before.get(stage)), bool(after.get(stage))
+        if was == now:
+            continue
+        counters[f"transitions.{stage}"] = 1 if now else -1
+        if now and created_at and when:
+            counters[f"cycle.{stage}.seconds"] = max(int((when - created_at).total_seconds()), 0)
+            counters[f"cycle.{stage}.count"] = 1
+
+    steps_before = sum(bool(before.get(stage)) for stage in STAGES)
+    steps_after = sum(bool(after.get(stage)) for stage in STAGES)
+    if (steps_before > 0) != (steps_after > 0):
+        counters["transitions.started"] = 1 if steps_after > 0 else -1
+    if (steps_before == len(STAGES)) != (steps_after == len(STAGES)):
+        counters["transitions.completed"] = 1 if steps_after == len(STAGES) else -1
+        if steps_after == len(STAGES) and created_at and when:
+            counters["cycle.completed.seconds"] = max(int((when - created_at).total_seconds()), 0)
+            counters["cycle.completed.count"] = 1
+    return counters
+
+
+def apply(key, counters, collection=None):
+    """$inc counters on one rollup row, creating it if needed."""
+    counters = {name: value for name, value in counters.items() if value}
+    if not counters:
+        return
+    target = collection if collection is not None else daily_rollups
+    row_id = "|".join(str(key[d]) for d in DIMENSIONS)
+    # updated_at is the data version readers cache against
+    target.update_one({"_id": row_id},
+                      {"$inc": counters, "$setOnInsert": dict(key), "$max": {"updated_at": datetime.datetime.now()}},
+                      upsert=True)
+
+
+def record_customer(customer, old_machine_count=None):
+    """Count a new customer (or a change of its machine count)."""
+    machines = int(customer.get("machine_count") or 0)
+    if old_machine_count is None:
+        counters = {"customers": 1, "machines": machines}
+    else:
+        counters = {"machines": machines - int(old_machine_count or 0)}
+    apply(rollup_key(_day(customer.get("created_at"))), counters)
+
+
+def record_mrn(mrn):
+    """Count a generated MRN on its creation day."""
+    apply(rollup_key(_day(mrn.get("created_at"))), {"mrns": 1})
+
+
+def record_report(old_report, new_report):
+    """Move a service report's contribution from its old row/values to the new ones."""
+    if old_report:
+        apply(report_key(old_report), report_counters(old_report, sign=-1))
+    if new_report:
+        apply(report_key(new_report), report_counters(new_report))
+
+
+def record_status(customer, new_status, when=None):
+    """Record the status flips between a customer document and its new status.
+
+    A step that is undone also takes back its cycle time, on the day it was
+    recorded, when the customer document carries the step's `<step>_at`.
+    """
+    if not customer:
+        return
+    when = when or datetime.datetime.now()
+    before = customer.get("status") or {}
+    after = dict(before, **new_status)
+    created_at = customer.get("created_at")
+    apply(rollup_key(_day(when)), status_counters(before, after, created_at, when))
+
+    for stage in STAGES:
+        done_at = customer.get(STAGE_TIMESTAMPS[stage])
+        if before.get(stage) and not after.get(stage) and done_at and created_at:
+            seconds = max(int((done_at - created_at).total_seconds()), 0)
+            apply(rollup_key(_day(done_at)), {f"cycle.{stage}.seconds": -seconds, f"cycle.{stage}.count": -1})
+
+
+def _add(rows, key, counters):
+    row = rows.setdefault("|".join(str(key[d]) for d in DIMENSIONS), dict(key))
+    for name, value in counters.items():
+        row[name] = row.get(name, 0) + value
+
+
+def compute_rollups(db):
+    """Compute all rollup rows from the raw collections.
+
+    Step timestamps come from the customer's `<step>_at` fields. Customers
+    saved before those existed fall back to the MRN and service report
+    creation times and the telecontroller upload date; vendor registration
+    then counts on the customer's creation day.
+
+    Returns:
+        {row_id: row} with dotted counter names, as apply() would $inc them
+    """
+    rows = {}
+    first_mrn, first_report = {}, {}
+
+    for mrn in db.mrns.find({}, {"customer_id": 1, "created_at": 1}):
+        _add(rows, rollup_key(_day(mrn.get("created_at"))), {"mrns": 1})
+        created = _as_datetime(mrn.get("created_at"))
+        if created and (mrn.get("customer_id") not in first_mrn or created < first_mrn[mrn["customer_id"]]):
+            first_mrn[mrn.get("customer_id")] = created
+
+    for report in db.service_reports.find({}, REPORT_FIELDS + ["customer_id", "created_at"]):
+        _add(rows, report_key(report), report_counters(report))
+        created = _as_datetime(report.get("created_at"))
+        if created and (report.get("customer_id") not in first_report
+                        or created < first_report[report["customer_id"]]):
+            first_report[report.get("customer_id")] = created
+
+    for customer in db.customers.find({}, {"created_at": 1, "machine_count": 1, "status": 1,
+                                            "telecontroller_file_info.upload_date": 1,
+                                            **{field: 1 for field in STAGE_TIMESTAMPS.values()}}):
+        created = customer.get("created_at")
+        customer_id = str(customer["_id"])
+        _add(rows, rollup_key(_day(created)), {"customers": 1, "machines": int(customer.get("machine_count") or 0)})
+
+        status = customer.get("status") or {}
+        fallback = {
+            "vendor_registered": created,
+            "mrn_created": first_mrn.get(customer_id, created),
+            "service_report_created": first_report.get(customer_id, created),
+            "telecontroller_done": (customer.get("telecontroller_file_info") or {}).get("upload_date", created),
+        }
+        stage_times = {stage: customer.get(field) or fallback[stage] for stage, field in STAGE_TIMESTAMPS.items()}
+        # Replay the steps in time order so started/completed land on the right day
+        done = {}
+        for stage in sorted((s for s in STAGES if status.get(s)), key=lambda s: stage_times[s] or created):
+            when = stage_times[stage] or created
+            _add(rows, rollup_key(_day(when)), status_counters(done, dict(done, **{stage: True}), created, when))
+            done[stage] = True
+    return rows
+
+
+def _nest(row):
+    """Turn dotted counter names into the nested documents $inc would build."""
+    nested = {}
+    for name, value in row.items():
+        target = nested
+        parts = name.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return nested
+
+
+def rebuild(db, batch_size=1000):
+    """Recompute daily_rollups from scratch; returns the number of rows written.
+
+    The rows are written to a scratch collection that then replaces
+    daily_rollups in one rename, so readers and $inc writers never see it
+    empty or half filled. Increments made between the scan and the rename
+    are still lost.
+    """
+    rows = compute_rollups(db)
+    rebuilt_at = datetime.datetime.now()
+    documents = [dict(_nest(row), _id=row_id, updated_at=rebuilt_at) for row_id, row in rows.items()]
+    scratch = db["daily_rollups_rebuild"]
+    scratch.drop()
+    # Indexes move with the collection on rename
+    scratch.create_index("day")
+    scratch.create_index("updated_at")
+    scratch.create_index([("engineer", 1), ("service_type", 1), ("machine_type", 1),
+                          ("machine_status", 1), ("day", 1)])
+    for i in range(0, len(documents), batch_size):
+        scratch.insert_many(documents[i:i + batch_size])
+    scratch.rename("daily_rollups", dropTarget=True)
+    return len(documents)
+
+
+def load_rollups(start_day=None, end_day=None, **dimensions):
+    """Rollup rows between two days (inclusive, "YYYY-MM-DD"), optionally filtered by dimension.
+
+    A dimension filter is a single value or a list of accepted values.
+    """
+    query = {}
+    for name, value in dimensions.items():
+        if name in DIMENSIONS and value is not None:
+            query[name] = {"$in": list(value)} if isinstance(value, (list, tuple)) else value
+    if start_day or end_day:
+        query["day"] = {}
+        if start_day:
+            query["day"]["$gte"] = start_day
+        if end_day:
+            query["day"]["$lte"] = end_day
+    return list(daily_rollups.find(query))
+
+
+def load_workflow_rollups(start_day=None, end_day=None):
+    """Rows without report dimensions: customers, machines, MRNs and status transitions (one per day)."""
+    return load_rollups(start_day, end_day, service_type=NO_DIMENSION, machine_type=NO_DIMENSION,
+                        machine_status=NO_DIMENSION, engineer=NO_DIMENSION)
+
+
+def data_version():
+    """Time of the latest rollup change (None when there are no rollups)."""
+    latest = daily_rollups.find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    return latest.get("updated_at") if latest else None
+
+
+def summarize(rows):
+    """Sum rollup rows into one dict of (nested) counters."""
+    totals = {}
+
+    def add(target, source):
+        for name, value in source.items():
+            if name in DIMENSIONS or name in ("_id", "updated_at"):
+                continue
+            if isinstance(value, dict):
+                add(target.setdefault(name, {}), value)
+            else:
+                target[name] = target.get(name, 0) + value
+
+    for row in rows:
+        add(totals, row)
+    return totals
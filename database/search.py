@@ -0,0 +1,329 @@
+# Full-text search over service reports and MRNs
+#
+# Two engines behind one interface:
+#   MongoTextEngine  - weighted $text indexes on a MongoDB server
+#   InvertedIndex    - an in-process BM25 index for the embedded backend,
+#                      which has no $text
+# SEARCH_ENGINE picks one ("mongo", "memory"; default: by backend). Write
+# paths call index_document() after saving so the in-process index stays
+# current; it is a no-op for the server engine.
+import heapq
+import html
+import math
+import os
+import re
+import threading
+from array import array
+
+from database.connection import db, get_client
+
+# Searchable fields per collection and their boosts
+SEARCH_FIELDS = {
+    "service_reports": {"reported_fault": 4, "problem_diagnosis": 3, "job_carried_out": 2, "recommendations": 1},
+    "mrns": {"problem_reported": 4, "accessories_received": 1},
+}
+
+# Tie-break position of each collection in hit_order()
+COLLECTION_ORDER = {collection: position for position, collection in enumerate(SEARCH_FIELDS)}
+
+# Fields returned with each hit
+DISPLAY_FIELDS = {
+    "service_reports": ["sr_code", "mrn_code", "customer_id", "customer_name", "type_of_machine", "service_date"],
+    "mrns": ["mrn_code", "customer_id", "customer_name", "model", "serial_no", "created_at"],
+}
+
+# Engine: "mongo", "memory" or "auto" (memory on the embedded backend)
+SEARCH_ENGINE = os.environ.get("SEARCH_ENGINE", "auto")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Characters of context in a snippet
+SNIPPET_CHARS = 160
+
+STOPWORDS = frozenset("a an and are as at be but by for from has have in is it its no not of on or "
+                      "so that the this to was were will with".split())
+
+_WORD = re.compile(r"[A-Za-z0-9]+")
+
+
+def stem(word):
+    """Crude English suffix stripping, so "leaking" and "leaks" find "leak"."""
+    for suffix in ("ing", "ed", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            return word[:-len(suffix)]
+    return word
+
+
+def terms(text):
+    """Index terms of a text: lowercased, stemmed words without stopwords."""
+    words = (word.lower() for word in _WORD.findall(str(text or "")))
+    return [stem(word) for word in words if word not in STOPWORDS]
+
+
+def highlight(text, query_terms, width=SNIPPET_CHARS):
+    """HTML snippet of `text` around its first query term, with matches in <mark>.
+
+    Args:
+        text: Field text
+        query_terms: Stemmed query terms (from terms())
+        width: Characters of context
+
+    Returns:
+        Escaped HTML, or "" when no term occurs in the text
+    """
+    text = str(text or "")
+    matches = [m for m in _WORD.finditer(text) if stem(m.group().lower()) in query_terms]
+    if not matches:
+        return ""
+    start = max(matches[0].start() - width // 4, 0)
+    end = min(start + width, len(text))
+    parts = ["…" if start > 0 else ""]
+    position = start
+    for match in matches:
+        if match.start() < start or match.end() > end:
+            continue
+        parts.append(html.escape(text[position:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        position = match.end()
+    parts.append(html.escape(text[position:end]))
+    parts.append("…" if end < len(text) else "")
+    return "".join(parts)
+
+
+def _stored_fields(collection):
+    return list(SEARCH_FIELDS[collection]) + DISPLAY_FIELDS[collection]
+
+
+class MongoTextEngine:
+    """$text search with one weighted text index per collection."""
+
+    def __init__(self, database):
+        self.db = database
+        self._indexed = False
+
+    def ensure_indexes(self):
+        if self._indexed:
+            return
+        for collection, boosts in SEARCH_FIELDS.items():
+            self.db[collection].create_index([(field, "text") for field in boosts], weights=boosts,
+                                             name=f"{collection}_search", default_language="english")
+        self._indexed = True
+
+    def index(self, collection, document):
+        # The server maintains its text indexes
+        pass
+
+    def search(self, query, limit, collections):
+        """Top `limit` hits per collection (score, then _id order) and the total match count."""
+        self.ensure_indexes()
+        score = {"$meta": "textScore"}
+        hits, total = [], 0
+        for collection in collections:
+            text = {"$text": {"$search": query}}
+            projection = dict({field: 1 for field in _stored_fields(collection)}, score=score)
+            cursor = (self.db[collection].find(text, projection)
+                      .sort([("score", score), ("_id", 1)]).limit(limit))
+            hits.extend(dict(document, collection=collection) for document in cursor)
+            total += self.db[collection].count_documents(text)
+        return hits, total
+
+
+class InvertedIndex:
+    """In-process BM25 index for the embedded backend.
+
+    Postings are append-only typed arrays (document slot, field-weighted
+    term frequency) scored with NumPy. Each slot also stores the fields a
+    hit displays, because the embedded backend scans the whole collection
+    for any find. A re-indexed document gets a new slot and its old slot
+    is masked out; the index is rebuilt from the database once a quarter
+    of the slots are stale.
+    """
+
+    def __init__(self, database):
+        self.db = database
+        self._lock = threading.RLock()
+        self._built = False
+
+    def _reset(self):
+        self._keys = []                 # slot -> (collection, _id)
+        self._stored = []               # slot -> tuple of the collection's stored field values
+        self._slot_of = {}              # (collection, str(_id)) -> slot
+        self._live = bytearray()        # slot -> 1 while current
+        self._collection = array("b")   # slot -> position in SEARCH_FIELDS
+        self._postings = {}             # term -> (array("i") slots, array("f") weights)
+        self._stale = 0
+
+    def _build(self):
+        self._reset()
+        documents = {}
+        for collection, boosts in SEARCH_FIELDS.items():
+            documents[collection] = list(self.db[collection].find({}, _stored_fields(collection)))
+        # Average field lengths normalize the term frequencies (BM25F)
+        self._average = {}
+        for collection, boosts in SEARCH_FIELDS.items():
+            for field in boosts:
+                lengths = [len(terms(document.get(field))) for document in documents[collection]]
+                self._average[(collection, field)] = max(sum(lengths) / len(lengths), 1.0) if lengths else 8.0
+        for collection, batch in documents.items():
+            for document in batch:
+                self._add(collection, document)
+        self._built = True
+
+    def _add(self, collection, document):
+        key = (collection, str(document["_id"]))
+        previous = self._slot_of.get(key)
+        if previous is not None:
+            self._live[previous] = 0
+            self._stale += 1
+
+        weights = {}
+        for field, boost in SEARCH_FIELDS[collection].items():
+            field_terms = terms(document.get(field))
+            if not field_terms:
+                continue
+            norm = 1 - BM25_B + BM25_B * len(field_terms) / self._average[(collection, field)]
+            for term in field_terms:
+                weights[term] = weights.get(term, 0.0) + boost / norm
+
+        slot = len(self._keys)
+        self._keys.append((collection, document["_id"]))
+        self._stored.append(tuple(document.get(field) for field in _stored_fields(collection)))
+        self._slot_of[key] = slot
+        self._live.append(1)
+        self._collection.append(list(SEARCH_FIELDS).index(collection))
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("i"), array("f"))
+            postings[0].append(slot)
+            postings[1].append(weight)
+
+    def index(self, collection, document):
+        """(Re-)index one saved document; documents saved before the first search are picked up by the build."""
+        if collection not in SEARCH_FIELDS or "_id" not in document:
+            return
+        with self._lock:
+            if not self._built:
+                return
+            self._add(collection, document)
+            if self._stale > max(len(self._keys) // 4, 1000):
+                self._built = False
+
+    def search(self, query, limit, collections):
+        """Top `limit` hits across the collections (hit_order()) and the total match count."""
+        import numpy as np
+
+        query_terms = sorted(set(terms(query)))
+        if not query_terms:
+            return [], 0
+
+        with self._lock:
+            if not self._built:
+                self._build()
+            slots_total = len(self._keys)
+            if not slots_total:
+                return [], 0
+            live = np.frombuffer(self._live, dtype=np.uint8).astype(bool)
+            wanted = [list(SEARCH_FIELDS).index(collection) for collection in collections]
+            if len(wanted) < len(SEARCH_FIELDS):
+                live &= np.isin(np.frombuffer(self._collection, dtype=np.int8), wanted)
+            documents = int(live.sum())
+
+            scores = np.zeros(slots_total, dtype=np.float32)
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                slots = np.frombuffer(postings[0], dtype=np.int32)
+                weights = np.frombuffer(postings[1], dtype=np.float32)
+                # Slots are unique within a posting list, so fancy-index += is safe
+                frequency = int(live[slots].sum())
+                idf = math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+                scores[slots] += idf * weights * (BM25_K1 + 1) / (weights + BM25_K1)
+                del slots, weights
+            scores[~live] = 0
+
+            matched = np.flatnonzero(scores > 0)
+            total = len(matched)
+            if total > limit:
+                # Every hit above the cutoff score is in; the hits tied at the cutoff are
+                # picked in hit_order(), not by argpartition, so pages never overlap
+                cutoff = np.partition(scores[matched], total - limit)[total - limit]
+                above = matched[scores[matched] > cutoff]
+                tied = [(COLLECTION_ORDER[self._keys[slot][0]], self._keys[slot][1], slot)
+                        for slot in matched[scores[matched] == cutoff]]
+                matched = list(above) + [slot for _, _, slot in heapq.nsmallest(limit - len(above), tied)]
+            hits = []
+            for slot in matched:
+                collection, document_id = self._keys[slot]
+                hits.append({"_id": document_id, "collection": collection, "score": float(scores[slot]), "slot": slot})
+            hits.sort(key=hit_order)
+            for hit in hits:
+                slot = hit.pop("slot")
+                hit.update(zip(_stored_fields(hit["collection"]), self._stored[slot]))
+        return hits, total
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def engine_kind(setting=None):
+    """Resolve an engine setting ("mongo", "memory" or "auto") for the current backend."""
+    kind = setting or SEARCH_ENGINE
+    if kind == "auto":
+        embedded = get_client().__class__.__module__.startswith("mongomock")
+        kind = "memory" if embedded else "mongo"
+    return kind
+
+
+def get_engine():
+    """The search engine for this process (chosen once by SEARCH_ENGINE)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = InvertedIndex(db) if engine_kind() == "memory" else MongoTextEngine(db)
+    return _engine
+
+
+def index_document(collection, document):
+    """Tell the search engine about a saved service report or MRN (with its _id)."""
+    get_engine().index(collection, document)
+
+
+def hit_order(hit):
+    """Sort key of a hit: score, then collection and _id, so tied hits keep one order on every page."""
+    return -hit["score"], COLLECTION_ORDER[hit["collection"]], hit["_id"]
+
+
+def search(query, page=1, per_page=20, collections=None):
+    """Ranked full-text search over service reports and MRNs.
+
+    Args:
+        query: Free text; words are matched after stemming, any word matches
+        page: 1-based page number
+        per_page: Hits per page
+        collections: Optional subset of SEARCH_FIELDS' collections
+
+    Returns:
+        Dict with "total" (matching documents), "page", "per_page" and
+        "hits": documents with "collection", "score" and "snippets"
+        ({field: HTML with <mark>ed matches})
+    """
+    collections = [c for c in (collections or SEARCH_FIELDS) if c in SEARCH_FIELDS]
+    page = max(int(page), 1)
+    hits, total = get_engine().search(query, page * per_page, collections)
+    hits.sort(key=hit_order)
+    hits = hits[(page - 1) * per_page:page * per_page]
+
+    query_terms = set(terms(query))
+    for hit in hits:
+        hit["snippets"] = {}
+        for field in SEARCH_FIELDS[hit["collection"]]:
+            snippet = highlight(hit.get(field), query_terms)
+            if snippet:
+                hit["snippets"][field] = snippet
+    return {"total": total, "page": page, "per_page": per_page, "hits": hits}
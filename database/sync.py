@@ -0,0 +1,431 @@
+# Delta sync for offline clients
+#
+# Every write to a synced collection (SYNC_COLLECTIONS) stamps the document
+# with `_seq`, the next value of one change counter shared by all of them
+# (counters {_id: "sync"}), and `_seq_at`, the time the number was taken.
+# The number is taken right before the database write, so `_seq` order is
+# write order to within a few milliseconds. Deletes leave a tombstone in
+# sync_tombstones with a `_seq` of its own. Tombstones are kept
+# SYNC_TOMBSTONE_DAYS. A client whose token is older than that syncs from
+# scratch again.
+#
+# pull() pages through the changes after a sync token in `_seq` order. The
+# first pull has no token: it copies every document, in _id order per
+# collection, then moves on to the changes made meanwhile. A token has two
+# positions. "after" is where the next page starts. "safe" is where a new
+# sync starts: it only moves past changes older than SYNC_SETTLE_SECONDS.
+# A change whose number was taken earlier can then no longer be on its way
+# to the database. Changes after "safe" are sent again by the next sync,
+# and clients apply them by `_id` and `_seq`.
+#
+# push() applies a batch of client edits field by field. Each edit carries
+# the values the client started from ("was"). A field the server has not
+# changed since then takes the client's value. A field both sides changed
+# goes to the later edit: the client's edited_at against the document's
+# `_seq_at`. Edits go through the same workflow functions as the pages
+# (database/workflow.py).
+#
+# Documents written before this existed have no `_seq`; the first pull
+# copies them. Backfills and migrations (tools/rebuild_rollups.py) do not
+# stamp what they touch, so clients see those fields on their next full sync.
+import datetime
+import os
+
+# Collections clients sync, in the order a first sync copies them
+SYNC_COLLECTIONS = ("customers", "mrns", "service_reports", "drafts")
+
+# Seconds after which a change number can no longer be in flight
+SYNC_SETTLE_SECONDS = float(os.environ.get("SYNC_SETTLE_SECONDS", "10"))
+
+# Days tombstones are kept (and sync tokens stay valid)
+SYNC_TOMBSTONE_DAYS = int(os.environ.get("SYNC_TOMBSTONE_DAYS", "30"))
+
+# Documents per pull page (default and maximum) and edits per push
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+PUSH_LIMIT = 1000
+
+# Fields pull leaves out (derived server-side, or write journal bookkeeping)
+HIDDEN_FIELDS = {"customers": {"search_grams": 0, "_writes": 0}, "service_reports": {"_writes": 0}}
+
+# Fields a push may set, per collection (None: any field not set by the server)
+PUSH_FIELDS = {
+    "customers": ("name", "contact_name", "contact_phone", "machine_count"),
+    "mrns": None,
+    "service_reports": None,
+    "drafts": None,
+}
+
+# Fields only the server sets
+SERVER_FIELDS = ("_id", "_seq", "_seq_at", "_writes", "customer_id", "mrn_code", "sr_code", "code", "created_at",
+                 "updated_at", "status", "form")
+
+TOMBSTONES = "sync_tombstones"
+
+_indexed = False
+
+
+def _database(db):
+    if db is not None:
+        return db
+    from database.connection import db as default_db
+    return default_db
+
+
+def ensure_indexes(db=None):
+    """Create the `_seq` indexes and the tombstone TTL index."""
+    db = _database(db)
+    for name in SYNC_COLLECTIONS:
+        db[name].create_index("_seq")
+    db[TOMBSTONES].create_index("_seq")
+    db[TOMBSTONES].create_index("_seq_at", expireAfterSeconds=SYNC_TOMBSTONE_DAYS * 86400)
+
+
+def _ensure_indexes(db=None):
+    global _indexed
+    if not _indexed:
+        ensure_indexes(db)
+        _indexed = True
+
+
+def stamp(db=None):
+    """Fields to $set on a synced document that is being written."""
+    from pymongo import ReturnDocument
+
+    db = _database(db)
+    _ensure_indexes(db)
+    counter = db.counters.find_one_and_update({"_id": "sync"}, {"$inc": {"seq": 1}}, upsert=True,
+                                              return_document=ReturnDocument.AFTER)
+    return {"_seq": counter["seq"], "_seq_at": datetime.datetime.now()}
+
+
+def tombstone(collection, doc_id, db=None):
+    """Record the delete of a synced document."""
+    _database(db)[TOMBSTONES].update_one(
+        {"_id": f"{collection}/{doc_id}"},
+        {"$set": dict(stamp(db), collection=collection, doc_id=doc_id)},
+        upsert=True)
+
+
+def revive(collection, doc_id, db=None):
+    """Drop the tombstone of a document written again under the same _id (drafts)."""
+    _database(db)[TOMBSTONES].delete_one({"_id": f"{collection}/{doc_id}"})
+
+
+def encode_token(state):
+    """Opaque, URL-safe form of a token state dict."""
+    import base64
+    from bson import json_util
+
+    return base64.urlsafe_b64encode(json_util.dumps(state, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Token state dict of a token; raises ValueError if it is not one."""
+    import base64
+    from bson import json_util
+
+    try:
+        state = json_util.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        int(state["s"]), int(state["a"]), float(state["i"])
+    except Exception:
+        raise ValueError("not a sync token")
+    return state
+
+
+def settled_seq(db=None, now=None):
+    """Highest change number taken more than SYNC_SETTLE_SECONDS ago (0 without any)."""
+    db = _database(db)
+    cutoff = (now or datetime.datetime.now()) - datetime.timedelta(seconds=SYNC_SETTLE_SECONDS)
+    highest = 0
+    for name in SYNC_COLLECTIONS + (TOMBSTONES,):
+        row = db[name].find_one({"_seq_at": {"$lt": cutoff}}, {"_seq": 1}, sort=[("_seq", -1)])
+        if row:
+            highest = max(highest, row["_seq"])
+    return highest
+
+
+def _full_page(db, state, limit, now):
+    """The next page of a first sync: every document, collection by collection in _id order."""
+    from database.temporary import NOT_TEMPORARY
+    from database.drafts import DRAFT_TTL_DAYS
+
+    index, after_id = state["f"]
+    changes, count = {}, 0
+    while index < len(SYNC_COLLECTIONS) and count < limit:
+        name = SYNC_COLLECTIONS[index]
+        query = {} if after_id is None else {"_id": {"$gt": after_id}}
+        if name == "customers":
+            query.update(NOT_TEMPORARY)
+        elif name == "drafts":
+            # The embedded backend does not run TTL deletes
+            query["updated_at"] = {"$gte": now - datetime.timedelta(days=DRAFT_TTL_DAYS)}
+        batch = list(db[name].find(query, HIDDEN_FIELDS.get(name)).sort("_id", 1).limit(limit - count))
+        if batch:
+            changes.setdefault(name, []).extend(batch)
+            count += len(batch)
+        if count < limit:
+            index, after_id = index + 1, None
+        else:
+            after_id = batch[-1]["_id"]
+    token = {"s": state["s"], "a": state["s"], "i": state["i"]}
+    if index < len(SYNC_COLLECTIONS):
+        token["f"] = [index, after_id]
+    # The changes made during the copy follow, so there is always more
+    return {"changes": changes, "deleted": {}, "token": encode_token(token), "more": True}
+
+
+def _delta_page(db, state, limit, now):
+    """The changes after a token, in _seq order."""
+    after = state["a"]
+    rows = []
+    for name in SYNC_COLLECTIONS + (TOMBSTONES,):
+        cursor = db[name].find({"_seq": {"$gt": after}}, HIDDEN_FIELDS.get(name)).sort("_seq", 1).limit(limit + 1)
+        rows.extend((name, document) for document in cursor)
+    rows.sort(key=lambda row: row[1]["_seq"])
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes, deleted = {}, {}
+    safe = state["s"]
+    cutoff = now - datetime.timedelta(seconds=SYNC_SETTLE_SECONDS)
+    settled = True
+    for name, document in rows:
+        if name == TOMBSTONES:
+            deleted.setdefault(document["collection"], []).append(document["doc_id"])
+        else:
+            changes.setdefault(name, []).append(document)
+        # The resume point stops at the first change that may still have earlier ones in flight
+        settled = settled and document["_seq_at"] < cutoff
+        if settled:
+            safe = max(safe, document["_seq"])
+    if not rows:
+        safe = max(safe, min(after, settled_seq(db, now)))
+    last = rows[-1][1]["_seq"] if rows else after
+    # A finished sync resumes from the safe point next time
+    token = {"s": safe, "a": last if more else safe, "i": now.timestamp()}
+    return {"changes": changes, "deleted": deleted, "token": encode_token(token), "more": more}
+
+
+def pull(token=None, limit=PAGE_SIZE, db=None, now=None):
+    """One page of changes for a client.
+
+    Args:
+        token: Token returned by the previous pull, or None for a first sync
+        limit: Most documents in the page
+        db: Database (default: the app database)
+        now: Current time (tests)
+
+    Returns:
+        {"changes": {collection: [document]}, "deleted": {collection: [_id]},
+        "token": token for the next pull, "more": pull again right away,
+        "reset": the client must drop its copy first (first sync, or a
+        token older than SYNC_TOMBSTONE_DAYS)}
+    """
+    db = _database(db)
+    _ensure_indexes(db)
+    now = now or datetime.datetime.now()
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    state = decode_token(token) if token else None
+    reset = state is None or now.timestamp() - state["i"] > SYNC_TOMBSTONE_DAYS * 86400
+    if reset:
+        safe = settled_seq(db, now)
+        state = {"s": safe, "a": safe, "i": now.timestamp(), "f": [0, None]}
+    if "f" in state:
+        page = _full_page(db, state, limit, now)
+    else:
+        page = _delta_page(db, state, limit, now)
+    page["reset"] = reset
+    return page
+
+
+def plain(value):
+    """A value as it looks after a JSON round trip (dates as ISO 8601, ObjectIds as strings)."""
+    from bson.objectid import ObjectId
+
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(item) for item in value]
+    return value
+
+
+def merge_fields(current, fields, was, edited_at, current_at):
+    """Resolve a client edit against the current document field by field.
+
+    Args:
+        current: Current field values on the server
+        fields: {field: value} the client set
+        was: {field: value} the client started from (a field left out
+            started empty)
+        edited_at: When the client made the edit
+        current_at: When the server document last changed
+
+    Returns:
+        ({field: value} to write, [conflict dicts])
+    """
+    accepted, conflicts = {}, []
+    for field, value in fields.items():
+        server = plain(current.get(field))
+        if server == plain(value):
+            continue
+        if server == plain(was.get(field)):
+            accepted[field] = value
+            continue
+        # Both sides changed the field: the later edit wins
+        client_wins = current_at is None or (edited_at is not None and edited_at > current_at)
+        if client_wins:
+            accepted[field] = value
+        conflicts.append({"field": field, "server": current.get(field), "client": value,
+                          "winner": "client" if client_wins else "server"})
+    return accepted, conflicts
+
+
+def _parse_time(value):
+    """A client time as a naive local datetime, like the `_seq_at` it is compared with."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError("edited_at must be an ISO 8601 time")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _push_one(db, edit):
+    """Apply one client edit; returns its result dict."""
+    from bson.objectid import ObjectId
+    from database import drafts, workflow
+
+    collection = edit.get("collection")
+    if collection not in SYNC_COLLECTIONS:
+        raise ValueError(f"collection must be one of {', '.join(SYNC_COLLECTIONS)}")
+    doc_id = edit.get("_id")
+    if not isinstance(doc_id, str) or not doc_id:
+        raise ValueError("_id must be a string")
+    fields, was = edit.get("fields") or {}, edit.get("was") or {}
+    if not isinstance(fields, dict) or not isinstance(was, dict):
+        raise ValueError("fields and was must be objects")
+    allowed = PUSH_FIELDS[collection]
+    rejected = [field for field in fields
+                if field in SERVER_FIELDS or "." in field or field.startswith("$")
+                or (allowed is not None and field not in allowed)]
+    if rejected:
+        raise ValueError(f"fields not accepted: {', '.join(sorted(rejected))}")
+    edited_at = _parse_time(edit.get("edited_at"))
+
+    if collection == "drafts":
+        customer_id, _, form = doc_id.partition("/")
+        if form not in (drafts.MRN, drafts.SERVICE_REPORT):
+            raise ValueError("draft _id must be <customer_id>/<form>")
+        current = db.drafts.find_one({"_id": doc_id})
+        if edit.get("delete"):
+            if current:
+                drafts.discard_draft(customer_id, form)
+            return {"status": "deleted"}
+        values = (current or {}).get("values") or {}
+        accepted, conflicts = merge_fields(values, fields, was, edited_at, (current or {}).get("_seq_at"))
+        if accepted:
+            drafts.save_draft(customer_id, form, dict(values, **accepted), previous=values if current else None)
+        return {"status": "conflict" if conflicts else "applied", "conflicts": conflicts}
+
+    try:
+        object_id = ObjectId(doc_id)
+    except Exception:
+        raise ValueError("_id must be an ObjectId")
+    current = db[collection].find_one({"_id": object_id}, HIDDEN_FIELDS.get(collection))
+    if current is None:
+        if db[TOMBSTONES].find_one({"_id": f"{collection}/{doc_id}"}, {"_id": 1}):
+            return {"status": "deleted"}
+        return _create(collection, doc_id, edit.get("customer_id"), fields)
+
+    accepted, conflicts = merge_fields(current, fields, was, edited_at, current.get("_seq_at"))
+    if accepted:
+        if collection == "customers":
+            workflow.save_customer(dict({field: current.get(field) for field in PUSH_FIELDS["customers"]
+                                         if field in current}, **accepted), doc_id)
+        elif collection == "mrns":
+            workflow.update_mrn(current, accepted)
+        else:
+            workflow.save_service_report(current["customer_id"], workflow.parse_report_dates(accepted), object_id)
+    return {"status": "conflict" if conflicts else "applied", "conflicts": conflicts}
+
+
+def _create(collection, doc_id, customer_id, fields):
+    """Create a document the client made offline, under the client's _id."""
+    from database import workflow
+
+    if collection == "customers":
+        missing = [field for field in workflow.REQUIRED_CUSTOMER_FIELDS if not fields.get(field)]
+        if missing:
+            raise ValueError(f"Fill in the {', '.join(missing)}")
+        workflow.save_customer(fields, doc_id, new=True)
+        return {"status": "created"}
+
+    from bson.objectid import ObjectId
+    from database import writeback
+    from database.connection import customers
+
+    def exists():
+        try:
+            return customers.find_one({"_id": ObjectId(customer_id)}, {"_id": 1}) is not None
+        except Exception:
+            return False
+
+    # The customer may have been created earlier in the same push
+    if not exists() and not (writeback.flush(timeout=5.0) and exists()):
+        raise ValueError("customer_id must name an existing customer")
+    if collection == "mrns":
+        mrn = workflow.create_mrn(customer_id, fields, mrn_id=doc_id)
+        return {"status": "created", "mrn_code": mrn["mrn_code"]}
+    workflow.save_service_report(customer_id, workflow.parse_report_dates(fields), ObjectId(doc_id), new=True)
+    return {"status": "created"}
+
+
+def push(edits, db=None):
+    """Apply a batch of client edits in order.
+
+    Args:
+        edits: [{"collection", "_id", "fields": {field: value}, "was":
+            {field: value the client started from}, "edited_at": ISO time,
+            "customer_id" (new MRNs and service reports), "delete" (drafts)}]
+        db: Database (default: the app database)
+
+    Returns:
+        One result per edit: {"status": "applied", "created", "conflict"
+        (with "conflicts"), "deleted" (the document is gone), "rejected"
+        (with "error") or "failed" (a server error; the client may retry
+        the edit)}
+    """
+    from database import writeback
+    from utils import metrics
+
+    db = _database(db)
+    if len(edits) > PUSH_LIMIT:
+        raise ValueError(f"at most {PUSH_LIMIT} edits per push")
+    results = []
+    for edit in edits:
+        try:
+            if not isinstance(edit, dict):
+                raise ValueError("each edit must be an object")
+            result = _push_one(db, edit)
+        except ValueError as error:
+            result = {"status": "rejected", "error": str(error)}
+        except Exception:
+            # The edits before this one are applied already, so the rest of the batch goes on
+            import logging
+            logging.getLogger(__name__).exception("sync push edit failed")
+            result = {"status": "failed", "error": "server error"}
+        result.update(collection=edit.get("collection") if isinstance(edit, dict) else None,
+                      _id=edit.get("_id") if isinstance(edit, dict) else None)
+        metrics.sync_push_edits.inc(status=result["status"])
+        results.append(result)
+    # Journaled writes are applied before the client's next pull
+    writeback.flush(timeout=5.0)
+    return results
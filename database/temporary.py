@@ -0,0 +1,118 @@
+# Temporary "New Customer" placeholders
+#
+# Earlier versions inserted a placeholder customer ({"name": "New Customer",
+# "is_temporary": True}) as soon as "New Service Visit" was clicked, and
+# never cleared the flag once the form was filled in. Customers are now
+# created on their first valid save (pages/crm_entry.py), so placeholders
+# are only left over from those versions.
+#
+# Dashboard and stats queries add NOT_TEMPORARY, which the
+# (is_temporary, created_at) index serves; the reaper uses the same index to
+# find placeholders. reap() first clears the flag on placeholders that were
+# filled in, then deletes untouched ones older than TEMPORARY_TTL_HOURS and
+# takes them back out of the rollups, the event log and the drafts. It is
+# not a TTL index because a TTL delete would leave them in the rollups.
+import datetime
+import os
+
+# Hours an untouched placeholder is kept (a visit may still be in progress)
+TEMPORARY_TTL_HOURS = int(os.environ.get("TEMPORARY_TTL_HOURS", "24"))
+
+# Query predicate excluding placeholders
+NOT_TEMPORARY = {"is_temporary": {"$ne": True}}
+
+PLACEHOLDER_NAME = "New Customer"
+
+_indexed = False
+
+
+def ensure_indexes(db=None):
+    """Create the index serving NOT_TEMPORARY and the reaper's scan."""
+    if db is None:
+        from database.connection import customers
+    else:
+        customers = db.customers
+    customers.create_index([("is_temporary", 1), ("created_at", 1)])
+
+
+def _ensure_indexes():
+    global _indexed
+    if not _indexed:
+        ensure_indexes()
+        _indexed = True
+
+
+def not_temporary(query=None):
+    """A customer query with placeholders excluded.
+
+    Args:
+        query: Optional filter to combine with NOT_TEMPORARY
+
+    Returns:
+        New filter dict
+    """
+    _ensure_indexes()
+    return dict(query or {}, **NOT_TEMPORARY)
+
+
+def is_untouched(customer):
+    """True for a placeholder nobody typed into or moved along the workflow."""
+    return (customer.get("name", PLACEHOLDER_NAME) == PLACEHOLDER_NAME
+            and not customer.get("contact_name")
+            and not customer.get("contact_phone")
+            and not customer.get("machine_count")
+            and not any((customer.get("status") or {}).values()))
+
+
+def reap(db, ttl_hours=None, now=None):
+    """Promote filled-in placeholders and delete untouched, expired ones.
+
+    Args:
+        db: Database to clean up
+        ttl_hours: Age after which an untouched placeholder is deleted
+            (default: TEMPORARY_TTL_HOURS)
+        now: Time placeholders are aged against (default: now)
+
+    Returns:
+        (number promoted, number deleted)
+    """
+    from database import autocomplete, rollups, sync
+
+    ensure_indexes(db)
+    ttl_hours = TEMPORARY_TTL_HOURS if ttl_hours is None else ttl_hours
+    cutoff = (now or datetime.datetime.now()) - datetime.timedelta(hours=ttl_hours)
+
+    promoted, expired = [], []
+    fields = {"name": 1, "contact_name": 1, "contact_phone": 1, "machine_count": 1, "status": 1, "created_at": 1}
+    for customer in db.customers.find({"is_temporary": True}, fields):
+        if not is_untouched(customer):
+            promoted.append(customer["_id"])
+        elif isinstance(customer.get("created_at"), datetime.datetime) and customer["created_at"] < cutoff:
+            expired.append(customer)
+
+    # One change number per customer, so a sync page never splits a number
+    for customer_id in promoted:
+        db.customers.update_one({"_id": customer_id}, {"$set": sync.stamp(db), "$unset": {"is_temporary": ""}})
+
+    deleted = 0
+    for customer in expired:
+        # A save since the scan clears the flag, and the delete then misses
+        result = db.customers.delete_one({"_id": customer["_id"], "is_temporary": True})
+        if not result.deleted_count:
+            continue
+        deleted += 1
+        customer_id = str(customer["_id"])
+        sync.tombstone("customers", customer_id, db)
+        autocomplete.remove_customer(customer_id)
+        # Placeholders were counted as customers when they were inserted
+        rollups.apply(rollups.rollup_key(rollups._day(customer["created_at"])),
+                      {"customers": -1, "machines": -int(customer.get("machine_count") or 0)},
+                      collection=db.daily_rollups)
+        db.workflow_events.delete_many({"c": customer_id})
+        for draft in db.drafts.find({"customer_id": customer_id}, {"_id": 1}):
+            sync.tombstone("drafts", draft["_id"], db)
+        db.drafts.delete_many({"customer_id": customer_id})
+    if promoted or deleted:
+        from utils import shared_cache
+        shared_cache.bump(shared_cache.CUSTOMERS)
+    return len(promoted), deleted
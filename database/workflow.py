@@ -0,0 +1,286 @@
+# Workflow steps shared by the Streamlit pages and the HTTP API
+#
+# Each function performs one step the way the page did inline before: the
+# write itself, then the rollups, machine registry, search index, event log
+# and shared cache write version. Customer and service report saves go
+# through the write journal (database/writeback.py); the other steps write
+# directly, as they did from the pages. Writes to synced collections carry
+# a change number (database/sync.py).
+import datetime
+
+from database.connection import customers, mrns, fs
+from database import sync, writeback
+from utils import metrics, shared_cache
+
+# Customer fields a save may set
+CUSTOMER_FIELDS = ("name", "contact_name", "contact_phone", "machine_count")
+
+# Fields a new customer needs
+REQUIRED_CUSTOMER_FIELDS = ("name", "contact_name", "contact_phone")
+
+# Service report fields the page stores as datetimes
+REPORT_DATE_FIELDS = ("service_date", "service_advisor_date", "customer_rep_date", "follow_up_date")
+
+
+def new_customer_status():
+    """Workflow status of a customer that has not started any step."""
+    return {
+        "vendor_registered": False,
+        "mrn_created": False,
+        "service_report_created": False,
+        "telecontroller_done": False
+    }
+
+
+def save_customer(fields, customer_id=None, new=None):
+    """Journal a customer insert (without `customer_id`) or update.
+
+    Args:
+        fields: Values of CUSTOMER_FIELDS to save
+        customer_id: Existing customer, or None to create one
+        new: Create the customer under `customer_id` (an id chosen offline)
+
+    Returns:
+        (customer id, journal sequence number of the write)
+    """
+    from bson.objectid import ObjectId
+    from database import customer_search
+
+    customer_data = {field: fields[field] for field in CUSTOMER_FIELDS if field in fields}
+    # Search grams are written with the fields they index
+    customer_data.update(customer_search.search_fields(customer_data))
+    if new is None:
+        new = not customer_id
+    if not new:
+        payload = {"customer_id": str(customer_id), "new": False, "fields": customer_data}
+    else:
+        customer_data.update({"created_at": datetime.datetime.now(), "status": new_customer_status()})
+        # The id is chosen here, so the caller can go on before the insert reaches the database
+        customer_id = str(customer_id or ObjectId())
+        payload = {"customer_id": customer_id, "new": True, "fields": customer_data}
+    return customer_id, writeback.submit(writeback.CUSTOMER, payload)
+
+
+def overview():
+    """Customer, machine and completion counts from the daily rollups.
+
+    Returns:
+        (total customers, total machines, {"Complete", "In Progress",
+        "Not Started": count}), or None while there are no rollups
+    """
+    from database import rollups
+
+    summary = shared_cache.get_or_compute("rollups", "workflow_summary",
+                                          lambda: rollups.summarize(rollups.load_workflow_rollups()),
+                                          version=rollups.data_version())
+    if not summary:
+        return None
+    total_customers = summary.get("customers", 0)
+    transitions = summary.get("transitions", {})
+    return total_customers, summary.get("machines", 0), {
+        "Complete": transitions.get("completed", 0),
+        "In Progress": transitions.get("started", 0) - transitions.get("completed", 0),
+        "Not Started": total_customers - transitions.get("started", 0)
+    }
+
+
+def set_vendor_registered(customer_id, status):
+    """Set or clear the vendor registration step.
+
+    Returns:
+        The customer's previous status and created_at, or None if it does not exist
+    """
+    from bson.objectid import ObjectId
+    from database import rollups, events
+
+    # Stamp the step time in the same write as the status
+    now = datetime.datetime.now()
+    update = {"$set": dict(sync.stamp(), **{"status.vendor_registered": status})}
+    if status:
+        update["$set"]["vendor_registered_at"] = now
+    else:
+        update["$unset"] = {"vendor_registered_at": ""}
+    before = customers.find_one_and_update(
+        {"_id": ObjectId(customer_id)},
+        update,
+        projection={"status": 1, "created_at": 1, "vendor_registered_at": 1}
+    )
+    if before is None:
+        return None
+    rollups.record_status(before, {"vendor_registered": status}, when=now)
+    shared_cache.bump(shared_cache.CUSTOMERS)
+    events.record(customer_id, events.VENDOR_REGISTERED, now, done=status)
+    return before
+
+
+def create_mrn(customer_id, form_data, mrn_id=None):
+    """Generate an MRN for a customer from its form values.
+
+    Args:
+        customer_id: Customer the machine belongs to
+        form_data: MRN form fields (dates may be datetime.date)
+        mrn_id: _id for the MRN (an id chosen offline), or None for a new one
+
+    Returns:
+        The stored MRN document (with mrn_code)
+    """
+    from bson.objectid import ObjectId
+    from database import rollups, events, search, machines, drafts
+    from utils.helpers import generate_sequential_code
+
+    mrn_code = generate_sequential_code("MRN")
+    created_at = datetime.datetime.now()
+
+    # Combine the form data with the MRN information
+    mrn_data = dict(form_data)
+    mrn_data.update({
+        "customer_id": str(customer_id),
+        "mrn_code": mrn_code,
+        "created_at": created_at,
+        "code": mrn_code  # To help with the sequential code search
+    })
+
+    # Convert form dates to strings (timestamps stay dates)
+    for key, value in mrn_data.items():
+        if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+            mrn_data[key] = value.isoformat()
+    if mrn_id is not None:
+        mrn_data["_id"] = ObjectId(mrn_id)
+    mrn_data.update(sync.stamp())
+
+    mrns.insert_one(mrn_data)
+    rollups.record_mrn(mrn_data)
+    machines.record_mrn(None, mrn_data)
+    search.index_document("mrns", mrn_data)
+    drafts.discard_draft(customer_id, drafts.MRN)
+
+    # Update customer status
+    before = customers.find_one_and_update(
+        {"_id": ObjectId(customer_id)},
+        {"$set": dict(sync.stamp(), **{
+            "status.mrn_created": True,
+            "mrn_created_at": created_at,
+            "mrn_code": mrn_code
+        })},
+        projection={"status": 1, "created_at": 1}
+    )
+    rollups.record_status(before, {"mrn_created": True}, when=created_at)
+    shared_cache.bump(shared_cache.CUSTOMERS)
+    events.record(customer_id, events.MRN_CREATED, created_at, ref=mrn_code)
+    return mrn_data
+
+
+def update_mrn(mrn, changes):
+    """Change fields of a stored MRN.
+
+    Args:
+        mrn: The MRN as stored (with _id)
+        changes: {field: value} to set
+
+    Returns:
+        The MRN with the changes
+    """
+    from database import machines, search
+
+    changes = dict(changes, updated_at=datetime.datetime.now())
+    mrns.update_one({"_id": mrn["_id"]}, {"$set": dict(changes, **sync.stamp())})
+    updated = dict(mrn, **changes)
+    machines.record_mrn(mrn, updated)
+    search.index_document("mrns", updated)
+    return updated
+
+
+def parse_report_dates(report):
+    """Report fields with the REPORT_DATE_FIELDS given as ISO 8601 strings made datetimes.
+
+    Raises:
+        ValueError: A date field is not ISO 8601
+    """
+    report = dict(report)
+    for field in REPORT_DATE_FIELDS:
+        if isinstance(report.get(field), str):
+            try:
+                report[field] = datetime.datetime.fromisoformat(report[field])
+            except ValueError:
+                raise ValueError(f"{field} must be an ISO 8601 date")
+    return report
+
+
+def save_service_report(customer_id, report, report_id=None, new=None):
+    """Journal a whole service report document (as stored) for a customer.
+
+    The Streamlit page sends row-level array updates itself; this is the
+    plain form for callers that hold the full document.
+
+    Args:
+        customer_id: Customer the report belongs to
+        report: Report fields (dates as datetime)
+        report_id: Existing report to update, or None to create one
+        new: Create the report under `report_id` (an id chosen offline)
+
+    Returns:
+        (report id, journal sequence number of the write)
+    """
+    from bson.objectid import ObjectId
+    from database.connection import service_reports
+
+    changes = dict(report, customer_id=str(customer_id), updated_at=datetime.datetime.now())
+    if new is None:
+        new = report_id is None
+    if new:
+        report_id = report_id or ObjectId()
+        changes["created_at"] = changes["updated_at"]
+        payload = {"customer_id": str(customer_id), "report_id": report_id, "new": True, "report": changes}
+    else:
+        # The applier counts the whole new report in the rollups, so fields left out keep their value
+        existing = service_reports.find_one({"_id": report_id}) or {}
+        merged = {field: value for field, value in existing.items()
+                  if field not in ("_id", "sr_code", "code", "_seq", "_seq_at", writeback.WRITES)}
+        merged.update(changes)
+        payload = {"customer_id": str(customer_id), "report_id": report_id, "new": False,
+                   "report": merged, "set": changes, "push": {}}
+    return report_id, writeback.submit(writeback.SERVICE_REPORT, payload)
+
+
+def attach_telecontroller(customer_id, filename, data, content_type="application/pdf"):
+    """Store a telecontroller PDF in GridFS and complete the telecontroller step.
+
+    Returns:
+        The file info saved on the customer, or None if the customer does not exist
+    """
+    from bson.objectid import ObjectId
+    from database import rollups, events
+
+    file_id = fs.put(
+        data,
+        filename=filename,
+        content_type=content_type,
+        customer_id=str(customer_id)
+    )
+    metrics.gridfs_bytes.inc(len(data))
+
+    file_info = {
+        "filename": filename,
+        "content_type": content_type,
+        "size": len(data),
+        "file_id": file_id,
+        "upload_date": datetime.datetime.now()
+    }
+
+    # Update customer status and file info
+    before = customers.find_one_and_update(
+        {"_id": ObjectId(customer_id)},
+        {"$set": dict(sync.stamp(), **{
+            "status.telecontroller_done": True,
+            "telecontroller_done_at": file_info["upload_date"],
+            "telecontroller_file_info": file_info
+        })},
+        projection={"status": 1, "created_at": 1}
+    )
+    if before is None:
+        fs.delete(file_id)
+        return None
+    rollups.record_status(before, {"telecontroller_done": True}, when=file_info["upload_date"])
+    shared_cache.bump(shared_cache.CUSTOMERS)
+    events.record(customer_id, events.TELECONTROLLER_DONE, file_info["upload_date"])
+    return file_info
@@ -0,0 +1,395 @@
+# Journaled form writes, applied to MongoDB in the background
+#
+# Form saves call submit(kind, payload): the write is appended to a local
+# journal (utils/journal.py) and submit() returns once it is on disk, so a
+# save costs a local fsync rather than a database round trip, and a save
+# made while MongoDB is slow or unreachable is not lost. One drainer thread
+# per process applies journaled writes in order through APPLIERS. A write
+# that fails with a connection error is retried with backoff and holds up
+# the writes behind it, so writes to one form are never reordered; a write
+# that fails for any other reason is set aside in rejected.log.
+#
+# Every write carries an idempotency key. Its progress is kept in
+# applied_writes (Ledger), so a write handed out again after a crash or a
+# connection error picks up where the last try stopped: the document write
+# carries the key into the document (WRITES) in the same update, so it lands
+# once; events get an _id made from the key; and each rollup and registry
+# step is marked done once it has run. Search, autocomplete and cache
+# updates are safe to repeat and are not tracked. Writes left in the journal by a stopped process are replayed by
+# the next process that opens its journal slot.
+import datetime
+import itertools
+import os
+import threading
+import time
+import uuid
+
+from database.connection import db, customers, service_reports
+from utils import metrics, shared_cache
+from utils.journal import Journal, lock_directory
+
+# Journal location; each running process takes the first free slot below it
+JOURNAL_DIR = os.environ.get("JOURNAL_DIR", ".journal")
+
+# Backoff between retries while the database is unreachable
+RETRY_MIN_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30.0
+
+# Days idempotency keys are kept in applied_writes
+APPLIED_TTL_DAYS = 7
+
+# Document field holding the keys of the last WRITE_KEYS journaled writes applied to it
+WRITES = "_writes"
+WRITE_KEYS = 20
+
+# Writes that could not be applied, one JSON line each
+REJECTED = "rejected.log"
+
+# Write kinds
+CUSTOMER = "customer"
+SERVICE_REPORT = "service_report"
+DRAFT = "draft"
+
+_lock = threading.Lock()
+_journal = None
+_journal_lock = None
+_drainer = None
+_wake = threading.Event()
+_applied = threading.Condition()
+_applied_seq = 0
+_indexed = False
+_state = {"error": None, "failing_since": None, "rejected": 0}
+
+
+def _dumps(value):
+    from bson import json_util
+    return json_util.dumps(value, json_options=json_util.RELAXED_JSON_OPTIONS)
+
+
+def _loads(text):
+    from bson import json_util
+    return json_util.loads(text)
+
+
+def _get_journal():
+    global _journal, _journal_lock, _applied_seq
+    with _lock:
+        if _journal is None:
+            for slot in itertools.count():
+                directory = os.path.join(JOURNAL_DIR, str(slot))
+                _journal_lock = lock_directory(directory)
+                if _journal_lock is not None:
+                    break
+            _journal = Journal(directory, dumps=_dumps, loads=_loads)
+            _applied_seq = _journal.committed
+            metrics.journal_pending.set_function(_journal.pending_count)
+        return _journal
+
+
+def _start_drainer():
+    global _drainer
+    with _lock:
+        if _drainer is None:
+            _drainer = threading.Thread(target=_drain_forever, name="writeback", daemon=True)
+            _drainer.start()
+
+
+def submit(kind, payload):
+    """Journal one write for the drainer to apply.
+
+    Args:
+        kind: Key of APPLIERS
+        payload: BSON-compatible dict the applier receives
+
+    Returns:
+        The write's journal sequence number (see flush())
+    """
+    seq = _get_journal().append({"kind": kind, "key": uuid.uuid4().hex, "payload": payload})
+    _start_drainer()
+    _wake.set()
+    return seq
+
+
+def flush(seq=None, timeout=5.0):
+    """Wait until the write `seq` (default: every write so far) has been applied.
+
+    Returns:
+        True if it was applied within `timeout` seconds
+    """
+    target = seq or _get_journal().last_seq
+    with _applied:
+        return _applied.wait_for(lambda: _applied_seq >= target, timeout=timeout)
+
+
+def status():
+    """Sync state for the sidebar.
+
+    Returns:
+        Dict with "pending" (journaled writes not yet applied), "error" (last
+        connection error while retrying, or None), "failing_since" and
+        "rejected" (writes set aside since the process started)
+    """
+    journal = _get_journal()
+    pending = journal.pending_count()
+    if pending:
+        # Writes left by a previous process
+        _start_drainer()
+    return dict(_state, pending=pending)
+
+
+def close():
+    """Flush the journal to disk (at process exit)."""
+    if _journal is not None:
+        _journal.close()
+
+
+def _ensure_indexes():
+    global _indexed
+    if not _indexed:
+        db.applied_writes.create_index("applied_at", expireAfterSeconds=APPLIED_TTL_DAYS * 86400)
+        _indexed = True
+
+
+class Ledger:
+    """Progress of one journaled write in applied_writes.
+
+    The record is {"_id": key, "kind", "applied_at", "state": "applying",
+    "done" or "rejected", "writes": [document writes started],
+    "before": {name: pre-image}, "steps": [name], "values": {name: value}}. Records written before progress was kept
+    have no state and count as done.
+    """
+
+    def __init__(self, entry):
+        self.key = entry["key"]
+        self.kind = entry["kind"]
+        self.record = db.applied_writes.find_one({"_id": self.key}) or {}
+
+    @property
+    def finished(self):
+        return bool(self.record) and self.record.get("state", "done") == "done"
+
+    def _save(self, update):
+        update.setdefault("$setOnInsert", {}).update(kind=self.kind, applied_at=datetime.datetime.now())
+        db.applied_writes.update_one({"_id": self.key}, update, upsert=True)
+
+    def value(self, name, compute):
+        """A value computed once per write (e.g. a sequential code), the same on every try."""
+        values = self.record.setdefault("values", {})
+        if name not in values:
+            values[name] = compute()
+            self._save({"$set": {f"values.{name}": values[name], "state": "applying"}})
+        return values[name]
+
+    def insert(self, collection, document):
+        """Insert a document chosen by _id; False if another write owns that _id."""
+        from pymongo.errors import DuplicateKeyError
+        from database import sync
+
+        self._save({"$addToSet": {"writes": collection.name}, "$set": {"state": "applying"}})
+        try:
+            collection.insert_one(dict(document, **sync.stamp(), **{WRITES: [self.key]}))
+        except DuplicateKeyError:
+            # An earlier try of this write inserted it, or another write took the _id
+            return collection.find_one({"_id": document["_id"], WRITES: self.key}, {"_id": 1}) is not None
+        return True
+
+    def write(self, name, collection, doc_id, update, fields):
+        """Apply `update` to one synced document once.
+
+        The pre-image is saved in the ledger before the update, which only
+        matches while the document is unchanged (same `_seq`) and does not
+        hold the key yet, so the saved pre-image is the one the update saw.
+
+        Returns:
+            The pre-image (`fields`, _id and _seq), or None if the document does not exist
+        """
+        from database import sync
+
+        saved = (self.record.get("before") or {}).get(name)
+        while True:
+            if saved is not None and collection.find_one({"_id": doc_id, WRITES: self.key}, {"_id": 1}):
+                return saved
+            before = collection.find_one({"_id": doc_id}, dict(dict.fromkeys(fields, 1), _seq=1))
+            if before is None:
+                return None
+            self._save({"$set": {f"before.{name}": before, "state": "applying"}, "$addToSet": {"writes": name}})
+            self.record.setdefault("before", {})[name] = saved = before
+            guarded = dict(update, **{"$set": dict(update.get("$set") or {}, **sync.stamp())})
+            guarded["$push"] = dict(update.get("$push") or {},
+                                    **{WRITES: {"$each": [self.key], "$slice": -WRITE_KEYS}})
+            result = collection.update_one({"_id": doc_id, "_seq": before.get("_seq"), WRITES: {"$ne": self.key}},
+                                           guarded)
+            if result.matched_count:
+                return before
+            # Written in between (or by the last try): look again
+
+    def step(self, name, function, *args, **kwargs):
+        """Run a side effect that must not be repeated, unless an earlier try finished it.
+
+        A crash inside the step itself can still repeat it; steps are a
+        single rollup or registry call.
+        """
+        if name in self.record.get("steps", ()):
+            return
+        function(*args, **kwargs)
+        self._save({"$addToSet": {"steps": name}, "$set": {"state": "applying"}})
+        self.record.setdefault("steps", []).append(name)
+
+    def finish(self, state="done"):
+        self._save({"$set": {"state": state}, "$unset": {"before": ""}})
+
+
+def _apply(entry):
+    _ensure_indexes()
+    ledger = Ledger(entry)
+    if ledger.finished:
+        return
+    APPLIERS[entry["kind"]](entry["payload"], ledger)
+    ledger.finish()
+
+
+def _reject(journal, seq, entry, error):
+    _state["rejected"] += 1
+    metrics.journal_rejected.inc(kind=entry.get("kind", ""))
+    rejected = {"seq": seq, "entry": entry, "error": repr(error), "rejected_at": datetime.datetime.now()}
+    try:
+        record = db.applied_writes.find_one({"_id": entry.get("key")})
+        if record:
+            # Partly applied: say what already reached the database
+            rejected["partial"] = {"writes_started": record.get("writes", []), "steps": record.get("steps", []),
+                                   "values": record.get("values", {})}
+            db.applied_writes.update_one({"_id": entry["key"]}, {"$set": {"state": "rejected"}})
+    except Exception:
+        pass
+    with open(os.path.join(journal.directory, REJECTED), "a", encoding="utf-8") as f:
+        f.write(_dumps(rejected) + "\n")
+
+
+def drain():
+    """Apply the pending writes in order.
+
+    Returns:
+        False if a connection error stopped it (the write stays pending)
+    """
+    from pymongo.errors import ConnectionFailure
+
+    global _applied_seq
+    journal = _get_journal()
+    for seq, entry in journal.pending():
+        try:
+            _apply(entry)
+        except ConnectionFailure as exc:
+            _state["error"] = str(exc)
+            _state["failing_since"] = _state["failing_since"] or datetime.datetime.now()
+            metrics.journal_retries.inc(kind=entry["kind"])
+            return False
+        except Exception as exc:
+            _reject(journal, seq, entry, exc)
+        journal.commit(seq)
+        with _applied:
+            _applied_seq = seq
+            _applied.notify_all()
+    _state["error"] = None
+    _state["failing_since"] = None
+    return True
+
+
+def _drain_forever():
+    delay = RETRY_MIN_SECONDS
+    while True:
+        # Cleared before draining, so a submit during the drain is not missed
+        _wake.clear()
+        if drain():
+            delay = RETRY_MIN_SECONDS
+            _wake.wait()
+        else:
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_SECONDS)
+
+
+def _apply_customer(payload, ledger):
+    """Insert or update a customer saved on the CRM entry page."""
+    from bson.objectid import ObjectId
+    from database import rollups, events, customer_search, autocomplete
+
+    customer_id = payload["customer_id"]
+    fields = payload["fields"]
+    if payload["new"]:
+        if not ledger.insert(customers, dict(fields, _id=ObjectId(customer_id))):
+            return
+        ledger.step("rollups", rollups.record_customer, fields)
+        events.record(customer_id, events.CREATED, fields["created_at"], key=ledger.key)
+    else:
+        # Creation time and workflow status belong to the existing record; a
+        # placeholder from an earlier version becomes a real customer
+        before = ledger.write("customer", customers, ObjectId(customer_id),
+                              {"$set": fields, "$unset": {"is_temporary": ""}},
+                              ("machine_count", "created_at"))
+        if not before:
+            return
+        ledger.step("rollups", rollups.record_customer, dict(before, **fields),
+                    old_machine_count=before.get("machine_count"))
+    shared_cache.bump(shared_cache.CUSTOMERS)
+    customer_search.index_customer(customer_id, fields)
+    autocomplete.update_customer(customer_id, fields)
+
+
+def _apply_service_report(payload, ledger):
+    """Insert or update a service report, with its rollups, registry, search and events."""
+    from bson.objectid import ObjectId
+    from database import rollups, events, search, machines, drafts
+    from utils.helpers import generate_sequential_code
+
+    customer_id = payload["customer_id"]
+    report_id = payload["report_id"]
+    report = payload["report"]
+    if payload["new"]:
+        # The code is taken when the report reaches the database, once per write
+        sr_code = ledger.value("sr_code", lambda: generate_sequential_code("SR"))
+        report = dict(report, _id=report_id, sr_code=sr_code, code=sr_code)
+        if not ledger.insert(service_reports, report):
+            return
+        ledger.step("rollups", rollups.record_report, None, report)
+        ledger.step("machines", machines.record_report, None, report)
+        search.index_document("service_reports", report)
+
+        # Update customer status
+        before = ledger.write("customer", customers, ObjectId(customer_id), {"$set": {
+            "status.service_report_created": True,
+            "service_report_created_at": report["created_at"],
+            "sr_code": sr_code
+        }}, ("status", "created_at"))
+        ledger.step("status", rollups.record_status, before, {"service_report_created": True},
+                    when=report["created_at"])
+        shared_cache.bump(shared_cache.CUSTOMERS)
+        events.record(customer_id, events.SR_CREATED, report["created_at"], ref=sr_code, key=ledger.key)
+    else:
+        update = {"$set": payload["set"]}
+        if payload.get("push"):
+            update["$push"] = payload["push"]
+        # The pre-image, not the copy the page loaded, is what the rollups counted
+        before = ledger.write("report", service_reports, report_id, update,
+                              rollups.REPORT_FIELDS + machines.REPORT_FIELDS)
+        if not before:
+            return
+        ledger.step("rollups", rollups.record_report, before, report)
+        ledger.step("machines", machines.record_report, before, report, sr_code=before.get("sr_code"))
+        search.index_document("service_reports", dict(report, _id=report_id))
+        events.record(customer_id, events.SR_UPDATED, report["updated_at"], ref=before.get("sr_code"),
+                      key=ledger.key)
+    # The report now holds everything the draft did
+    drafts.apply_draft({"_id": drafts.draft_id(customer_id, drafts.SERVICE_REPORT), "delete": True})
+
+
+def _apply_draft(payload, ledger):
+    # Upserting the same values or deleting again is harmless, so drafts need no steps
+    from database import drafts
+    drafts.apply_draft(payload)
+
+
+# Write kind -> function applying its payload
+APPLIERS = {
+    CUSTOMER: _apply_customer,
+    SERVICE_REPORT: _apply_service_report,
+    DRAFT: _apply_draft,
+}
@@ -0,0 +1,189 @@
+import streamlit as st
+import datetime
+import os
+import threading
+from collections import OrderedDict
+from utils import metrics, shared_cache
+from utils.analytics import GRANULARITIES, period_of, period_range, figure_dict
+from database import rollups
+from database.connection import daily_rollups
+from utils.reliability import load_reliability
+
+# Worker processes building figures ("0" builds them in the session thread)
+ANALYTICS_WORKERS = int(os.environ.get("ANALYTICS_WORKERS", "2"))
+
+# Figure sets kept per (filters, data version)
+FIGURE_CACHE_SIZE = 64
+
+_pool = None
+_pool_lock = threading.Lock()
+_figure_cache = OrderedDict()
+_figure_cache_lock = threading.Lock()
+
+def _get_pool():
+    """Process pool for figure construction, started on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # spawn: forking the multi-threaded server process is unsafe
+                _pool = ProcessPoolExecutor(max_workers=ANALYTICS_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _load_rows(start_day, end_day, machine_types, engineers):
+    strip = lambda rows: [{k: v for k, v in row.items() if k not in ("_id", "updated_at")} for row in rows]
+    rows = rollups.load_rollups(start_day, end_day, machine_type=machine_types or None, engineer=engineers or None)
+    return strip(rows), strip(rollups.load_workflow_rollups(start_day, end_day))
+
+def get_figures(start_day, end_day, granularity, machine_types, engineers):
+    """Figures for a filter selection, built once per rollup data version.
+
+    Concurrent sessions asking for the same figures share one build. The
+    waiting session thread blocks on a future, so other sessions keep
+    rerunning while a worker process builds the figures.
+    """
+    from concurrent.futures import Future
+    from utils.analytics import build_figures
+
+    key = (start_day, end_day, granularity, tuple(machine_types), tuple(engineers), rollups.data_version())
+    with _figure_cache_lock:
+        future = _figure_cache.get(key)
+        hit = future is not None
+        if hit:
+            _figure_cache.move_to_end(key)
+        else:
+            future = _figure_cache[key] = Future()
+            while len(_figure_cache) > FIGURE_CACHE_SIZE:
+                _figure_cache.popitem(last=False)
+    metrics.record_cache_lookup("analytics", hit)
+
+    if not hit:
+        def build():
+            rows, workflow_rows = _load_rows(start_day, end_day, machine_types, engineers)
+            if ANALYTICS_WORKERS > 0:
+                return _get_pool().submit(build_figures, rows, workflow_rows, granularity).result(timeout=120)
+            return build_figures(rows, workflow_rows, granularity)
+        
+        try:
+            # Another worker process may have built them already; _figure_cache is this process's L1
+            result = shared_cache.get_or_compute("analytics", repr(key[:-1]), build, version=key[-1], local=False)
+            future.set_result(result)
+        except Exception as e:
+            # Do not cache failures
+            future.set_exception(e)
+            with _figure_cache_lock:
+                if _figure_cache.get(key) is future:
+                    del _figure_cache[key]
+            raise
+    return future.result(timeout=120)
+
+def _distinct(field):
+    return sorted(value for value in daily_rollups.distinct(field) if value and value != rollups.NO_DIMENSION)
+
+def render():
+    """Render the analytics page."""
+    st.header("Analytics")
+
+    # Instructions in a card
+    st.markdown("""
+    <div class="css-card">
+        <h3>Service Analytics</h3>
+        <p>Spend, engineer utilization, satisfaction and cycle times from the daily rollups. Pick a month, then a week, to drill down.</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+    if rollups.data_version() is None:
+        st.info("No rollups yet. Run `python -m tools.rebuild_rollups` to build them from existing data.")
+        return
+
+    # Filters
+    today = datetime.date.today()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        date_range = st.date_input("Service dates", value=(today - datetime.timedelta(days=365), today),
+                                   key="analytics_dates")
+    with col2:
+        machine_types = st.multiselect("Machine type", _distinct("machine_type"), key="analytics_machine_types")
+    with col3:
+        engineers = st.multiselect("Engineer", _distinct("engineer"), key="analytics_engineers")
+
+    if not isinstance(date_range, (list, tuple)) or len(date_range) != 2:
+        st.info("Select a start and end date.")
+        return
+    start_day, end_day = date_range[0].isoformat(), date_range[1].isoformat()
+
+    # Drilldown: all months -> the weeks of one month -> the days of one week
+    months = sorted({period_of(day, "month") for day in _days(start_day, end_day)})
+    col1, col2 = st.columns(2)
+    with col1:
+        month = st.selectbox("Month", ["All"] + months, key="analytics_month")
+    week = "All"
+    if month != "All":
+        start_day, end_day = _clip(period_range(month, "month"), start_day, end_day)
+        weeks = sorted({period_of(day, "week") for day in _days(start_day, end_day)})
+        with col2:
+            week = st.selectbox("Week starting", ["All"] + weeks, key="analytics_week")
+        if week != "All":
+            start_day, end_day = _clip(period_range(week, "week"), start_day, end_day)
+    granularity = GRANULARITIES[(month != "All") + (week != "All")]
+
+    with st.spinner("Building charts..."):
+        result = get_figures(start_day, end_day, granularity, machine_types, engineers)
+
+    # Headline numbers
+    totals = result["totals"]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Service Reports", totals["reports"])
+    with col2:
+        st.metric("Parts Spend", f"${totals['parts']:,.2f}")
+    with col3:
+        st.metric("Labour Hours", f"{totals['labor_hours']:,.1f}")
+    with col4:
+        st.metric("Avg. Satisfaction", f"{totals['satisfaction']:.2f}" if totals["satisfaction"] else "–")
+
+    figures = result["figures"]
+    if not figures:
+        st.info("No service data for this selection.")
+        return
+
+    for name in ("spend", "satisfaction", "machine_types", "engineers"):
+        if name in figures:
+            st.plotly_chart(figure_dict(figures[name]), use_container_width=True)
+    if "cycle_time" in figures:
+        st.plotly_chart(figure_dict(figures["cycle_time"]), use_container_width=True)
+        st.caption("Cycle times cover every customer in the date range; machine type and engineer filters do not apply.")
+    
+    _render_reliability()
+
+def _render_reliability():
+    """Per-model reliability table from the last batch run (tools/reliability.py)."""
+    st.subheader("Reliability by Model")
+    results = load_reliability()
+    if not results:
+        st.info("No reliability statistics yet. Run `python -m tools.reliability` to compute them.")
+        return
+    rows = [{
+        "Model": result["_id"],
+        "Machines": result["machines"],
+        "Reports": result["reports"],
+        "MTBF (days)": round(result["mtbf_days"], 1) if result.get("mtbf_days") is not None else None,
+        "MTBF (running hours)": round(result["mtbf_hours"]) if result.get("mtbf_hours") is not None else None,
+        "Repeat visits (%)": round(100 * result["repeat_rate"], 1) if result.get("repeat_rate") is not None else None,
+        "Top faults": ", ".join(f"{fault['category']} ({fault['count']})" for fault in result.get("top_faults", [])),
+    } for result in results]
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+    computed_at = max(result["computed_at"] for result in results)
+    st.caption(f"Repeat visits are returns within {results[0]['repeat_days']} days. All service reports, "
+               f"regardless of the filters above; last computed {computed_at:%Y-%m-%d %H:%M}.")
+
+def _days(start_day, end_day):
+    start = datetime.date.fromisoformat(start_day)
+    end = datetime.date.fromisoformat(end_day)
+    return [(start + datetime.timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+def _clip(period, start_day, end_day):
+    return max(period[0], start_day), min(period[1], end_day)
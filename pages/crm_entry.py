@@ -1,8 +1,8 @@
 import streamlit as st
-import datetime
 from bson.objectid import ObjectId
-from utils.helpers import navigate_to_page, reset_autosave_timer, create_workflow_steps_indicator
+from utils.helpers import navigate_to_page, autosave, create_workflow_steps_indicator
 from database.connection import customers
+from database import writeback, workflow
 
 def render():
     # Display workflow steps indicator
@@ -41,38 +41,31 @@ def render():
         contact_phone = st.text_input("Procurement contact phone", key="contact_phone")
         machine_count = st.number_input("Number of machines", min_value=0, step=1, key="machine_count")
     
+    # Required fields; a new customer is not created until they are filled in
+    missing = [label for label, value in (("company name", company_name), ("contact name", contact_name),
+                                          ("contact phone", contact_phone)) if not value.strip()]
+    
     # Autosave function for CRM entry
-    def save_customer_data():
-        customer_data = {
+    def save_customer_data(notify=True):
+        if not st.session_state.customer_id and missing:
+            # Nothing is written for a visit that has not been filled in yet
+            if notify:
+                st.warning(f"Fill in the {', '.join(missing)} before saving")
+            return
+        # Journaled; the database write follows in the background
+        st.session_state.customer_id, _ = workflow.save_customer({
             "name": company_name,
             "contact_name": contact_name,
             "contact_phone": contact_phone,
-            "machine_count": machine_count,
-            "created_at": datetime.datetime.now(),
-            "status": {
-                "vendor_registered": False,
-                "mrn_created": False,
-                "service_report_created": False,
-                "telecontroller_done": False
-            }
-        }
-        
-        # If customer_id exists, update; otherwise insert
-        if st.session_state.customer_id:
-            customers.update_one(
-                {"_id": ObjectId(st.session_state.customer_id)}, 
-                {"$set": customer_data}
-            )
-        else:
-            result = customers.insert_one(customer_data)
-            st.session_state.customer_id = str(result.inserted_id)
-            
-        st.toast("Customer data saved", icon="✅")
+            "machine_count": machine_count
+        }, st.session_state.customer_id)
+        st.session_state.setdefault("autosave_snapshots", {})[f"customer/{st.session_state.customer_id}"] = snapshot
+        if notify:
+            st.toast("Customer data saved", icon="✅")
     
-    # Set up input change detection for autosave
-    for key in ["company_name", "contact_name", "contact_phone", "machine_count"]:
-        if key in st.session_state:
-            reset_autosave_timer(save_customer_data)
+    # Autosave whenever an edit changed the form
+    snapshot = (company_name, contact_name, contact_phone, machine_count)
+    autosave(f"customer/{st.session_state.customer_id}", snapshot, save_customer_data, notify=False)
     
     # Add a manual save button
     if st.button("💾 Save Information", key="save_customer_info"):
@@ -80,14 +73,8 @@ def render():
     
     # Form validation
     has_errors = False
-    if not company_name.strip():
-        st.error("Company name is required")
-        has_errors = True
-    if not contact_name.strip():
-        st.error("Contact name is required")
-        has_errors = True
-    if not contact_phone.strip():
-        st.error("Contact phone is required")
+    for label in missing:
+        st.error(f"{label.capitalize()} is required")
         has_errors = True
     if machine_count <= 0:
         st.warning("Please specify at least 1 machine")
@@ -101,5 +88,7 @@ def render():
             if not st.session_state.customer_id:
                 # If no autosave happened yet, save immediately
                 save_customer_data()
+            # The next page reads the customer back; give the journaled save a moment to land
+            writeback.flush(timeout=3.0)
             navigate_to_page("vendor_registration")
             st.rerun()
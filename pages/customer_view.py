@@ -1,13 +1,15 @@
 import streamlit as st
 import datetime
-import pandas as pd
 from bson.objectid import ObjectId
 import base64
 from io import BytesIO
 import json
 
 from utils.helpers import navigate_to_page, create_audit_log
+from utils.costs import format_money
+from utils import shared_cache
 from database.connection import customers, mrns, service_reports
+from database import rollups, customer_search, autocomplete, machines, sync, workflow
 
 def render():
     """Render the customer view page."""
@@ -31,7 +33,7 @@ def render():
         return
     
     # Get related data
-    mrn_data = mrns.find_one({"customer_id": st.session_state.view_customer_id, "is_draft": {"$ne": True}})
+    mrn_data = mrns.find_one({"customer_id": st.session_state.view_customer_id})
     service_report_data = service_reports.find_one({"customer_id": st.session_state.view_customer_id})
     
     # Show header with customer name
@@ -82,11 +84,15 @@ def render():
                     if field != "updated_at" and customer.get(field) != value:
                         changed_fields[field] = value
                 
-                # Update the database
+                # Update the database (search grams are written with the fields they index)
                 customers.update_one(
                     {"_id": ObjectId(st.session_state.view_customer_id)},
-                    {"$set": updates}
+                    {"$set": dict(updates, **customer_search.search_fields(updates), **sync.stamp())}
                 )
+                rollups.record_customer(dict(customer, **updates), old_machine_count=customer.get("machine_count", 0))
+                shared_cache.bump(shared_cache.CUSTOMERS)
+                customer_search.index_customer(st.session_state.view_customer_id, updates)
+                autocomplete.update_customer(st.session_state.view_customer_id, updates)
                 
                 # Create audit log entry
                 create_audit_log(
@@ -132,8 +138,9 @@ def render():
                     # Update the database
                     customers.update_one(
                         {"_id": ObjectId(st.session_state.view_customer_id)},
-                        {"$set": updates}
+                        {"$set": dict(updates, **sync.stamp())}
                     )
+                    shared_cache.bump(shared_cache.CUSTOMERS)
                     
                     # Create audit log entry
                     create_audit_log(
@@ -173,6 +180,21 @@ def render():
                 **Serial Number:** {mrn_data.get('serial_no', 'Not specified')}  
                 **Accessories Received:** {mrn_data.get('accessories_received', 'Not specified')}  
                 """)
+                
+                # Service history of this machine (one read from the machine registry)
+                machine = machines.get_machine(mrn_data.get('serial_no'))
+                if machine:
+                    last_service = machine.get('last_service')
+                    st.markdown(f"""
+                    **Service Visits:** {machine.get('visits', 0)}  
+                    **Last Service:** {last_service.strftime('%Y-%m-%d') if last_service else 'Not serviced yet'}  
+                    **Parts Spend:** {format_money(machine.get('parts_minor', 0))}  
+                    **Open Follow-ups:** {machine.get('open_follow_ups', 0)}  
+                    """)
+                    for sr_code, follow_up in sorted((machine.get('follow_ups') or {}).items()):
+                        due = follow_up.get('date')
+                        st.markdown(f"- {sr_code}: {follow_up.get('details') or 'Follow-up'}"
+                                    f"{' (due ' + due.strftime('%Y-%m-%d') + ')' if due else ''}")
             
             with st.expander("Inspection Results", expanded=False):
                 checklist_items = ["power_cable", "front_panel", "control_knobs_buttons", 
@@ -227,10 +249,7 @@ def render():
                             changed_fields[field] = value
                     
                     # Update the database
-                    mrns.update_one(
-                        {"_id": mrn_data["_id"]},
-                        {"$set": updates}
-                    )
+                    workflow.update_mrn(mrn_data, updates)
                     
                     # Create audit log entry
                     create_audit_log(
@@ -300,7 +319,7 @@ def render():
                     # Update the database
                     service_reports.update_one(
                         {"_id": service_report_data["_id"]},
-                        {"$set": updates}
+                        {"$set": dict(updates, **sync.stamp())}
                     )
                     
                     # Create audit log entry
@@ -340,8 +359,14 @@ def render():
     )
     
     if st.button("Generate Printable Document", key="generate_print"):
-        # Generate HTML for the selected sections
-        html_content = generate_printable_document(customer, mrn_data, service_report_data, print_options)
+        # Generate HTML for the selected sections; renders are keyed by their inputs, so
+        # any worker process reuses one rendered for the same records
+        import hashlib
+        from bson import json_util
+        inputs = json_util.dumps([customer, mrn_data, service_report_data, print_options], sort_keys=True)
+        html_content = shared_cache.get_or_compute(
+            "printable", hashlib.sha1(inputs.encode()).hexdigest(),
+            lambda: generate_printable_document(customer, mrn_data, service_report_data, print_options))
         
         # Convert to PDF-ready format
         pdf_display_html = f'''
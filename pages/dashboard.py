@@ -0,0 +1,466 @@
+import streamlit as st
+import datetime
+from bson.objectid import ObjectId
+from utils.helpers import navigate_to_page, build_dashboard_rows, find_customer_ids_by_serial
+from database.connection import customers
+from database import rollups, cycle_times, events, customer_search, temporary, workflow
+from utils import shared_cache
+
+# Customers returned by a company/contact/phone search
+SEARCH_LIMIT = 50
+
+# Sort option ordering search results by similarity
+BEST_MATCH = "Best Match"
+
+# Workflow steps shown on the timeline, in order
+TIMELINE_STEPS = (
+    ("vendor_registered", "Vendor Registration"),
+    ("mrn_created", "MRN Creation"),
+    ("service_report_created", "Service Report"),
+    ("telecontroller_done", "Telecontroller"),
+)
+
+# Timeline labels of the workflow event kinds
+EVENT_LABELS = {
+    events.CREATED: "CRM Entry",
+    events.VENDOR_REGISTERED: "Vendor Registration",
+    events.MRN_CREATED: "MRN Creation",
+    events.SR_CREATED: "Service Report",
+    events.SR_UPDATED: "Service Report Updated",
+    events.TELECONTROLLER_DONE: "Telecontroller",
+}
+
+def _scan_statistics():
+    """Customer, machine and completion counts computed from every customer document."""
+    # Placeholders left by earlier versions are not customers yet
+    query = temporary.not_temporary()
+    total_customers = customers.count_documents(query)
+    total_machines = sum([c.get('machine_count', 0) for c in customers.find(query, {"machine_count": 1})])
+    
+    # Calculate completion statistics
+    completion_stats = {
+        "Complete": 0,
+        "In Progress": 0,
+        "Not Started": 0
+    }
+    
+    for cust in customers.find(query, {"status": 1}):
+        status = cust.get('status', {})
+        completed_steps = sum([
+            status.get('vendor_registered', False),
+            status.get('mrn_created', False),
+            status.get('service_report_created', False),
+            status.get('telecontroller_done', False)
+        ])
+        
+        if completed_steps == 4:
+            completion_stats["Complete"] += 1
+        elif completed_steps > 0:
+            completion_stats["In Progress"] += 1
+        else:
+            completion_stats["Not Started"] += 1
+    
+    return total_customers, total_machines, completion_stats
+
+def _format_time(when):
+    return when.strftime("%Y-%m-%d %H:%M") if isinstance(when, datetime.datetime) else str(when)
+
+def _cycle_statistics():
+    """Stage durations and SLA breaches, recomputed when the rollups change or hourly (open stages age)."""
+    now = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+    # The aggregation reads every customer; one worker process runs it per version
+    return shared_cache.get_or_compute("cycle_times", "stage_durations",
+                                       lambda: cycle_times.stage_durations(now=now),
+                                       version=(rollups.data_version(), now))
+
+def _customer_rows(query, sort_field, sort_direction):
+    """Dashboard rows of the customers matching a query, cached until a customer is written."""
+    import hashlib
+    from bson import json_util
+    
+    key = hashlib.sha1(json_util.dumps([query, sort_field, sort_direction], sort_keys=True).encode()).hexdigest()
+    return shared_cache.get_or_compute(
+        "dashboard", key,
+        lambda: build_dashboard_rows(customers.find(query).sort(sort_field, sort_direction)),
+        version=shared_cache.version(shared_cache.CUSTOMERS))
+
+def render():
+    """Render the home page with the service dashboard."""
+    # Display current date in the top right
+    current_date = datetime.datetime.now().strftime("%B %d, %Y")
+    st.markdown(f"<div style='text-align: right; color: #666; margin-bottom: 20px;'>{current_date}</div>", 
+                unsafe_allow_html=True)
+    
+    # Welcome header with custom styling
+    st.markdown("<div class='welcome-message'>Welcome, Pofisian! 👋</div>", unsafe_allow_html=True)
+    
+    # Show summary statistics
+    st.header("Service Overview")
+    
+    # Statistics come from the daily rollups: one workflow row per day
+    statistics = workflow.overview()
+    if statistics:
+        total_customers, total_machines, completion_stats = statistics
+    else:
+        # No rollups yet (backfill with `python -m tools.rebuild_rollups`): scan the customers
+        total_customers, total_machines, completion_stats = _scan_statistics()
+    
+    # Display metrics
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown("""
+        <div class="metric-card">
+            <div class="metric-value">{}</div>
+            <div class="metric-label">Total Clients</div>
+        </div>
+        """.format(total_customers), unsafe_allow_html=True)
+    with col2:
+        st.markdown("""
+        <div class="metric-card">
+            <div class="metric-value">{}</div>
+            <div class="metric-label">Total Machines Under Service</div>
+        </div>
+        """.format(total_machines), unsafe_allow_html=True)
+    with col3:
+        avg_machines = round(total_machines / total_customers, 1) if total_customers > 0 else 0
+        st.markdown("""
+        <div class="metric-card">
+            <div class="metric-value">{}</div>
+            <div class="metric-label">Avg. Machines per Client</div>
+        </div>
+        """.format(avg_machines), unsafe_allow_html=True)
+    
+    # Add a visual representation of completion status using a chart
+    if total_customers > 0:
+        st.subheader("Service Completion Status")
+        
+        # Create a simple bar chart to visualize completion status
+        chart_data = {
+            "Status": list(completion_stats.keys()),
+            "Count": list(completion_stats.values())
+        }
+        
+        # Add some styling to the chart
+        st.bar_chart(chart_data, x="Status", y="Count", color="#FF5733")
+        
+        # Add a pie chart showing percentage breakdown
+        try:
+            import pandas as pd
+            import plotly.express as px
+            
+            df = pd.DataFrame({
+                "Status": list(completion_stats.keys()),
+                "Count": list(completion_stats.values())
+            })
+            
+            if sum(df["Count"]) > 0:
+                fig = px.pie(df, values="Count", names="Status", 
+                            title="Service Workflows Status Distribution",
+                            color_discrete_sequence=["#28a745", "#ffc107", "#dc3545"])
+                st.plotly_chart(fig, use_container_width=True)
+        except ImportError:
+            # Fallback if plotly is not available
+            st.write("Status breakdown:", completion_stats)
+        
+        # Cycle times and SLA breaches per workflow stage
+        st.subheader("Cycle Times & SLA")
+        stages = _cycle_statistics()
+        hours = lambda value: f"{value:,.0f}" if value is not None else "–"
+        sla_rows = [{
+            "Stage": stage["label"],
+            "Completed": stage["count"],
+            **{f"p{p} (h)": hours(stage["percentiles"][p]) for p in cycle_times.PERCENTILES},
+            "Mean (h)": hours(stage["mean_hours"]),
+            "SLA (h)": stage["sla_hours"],
+            "Over SLA": f"{stage['breach_rate']:.0%}" if stage["breach_rate"] is not None else "–",
+            "Open": stage["open"],
+            "Open over SLA": stage["open_breaches"],
+        } for stage in stages.values()]
+        st.dataframe(sla_rows, hide_index=True, use_container_width=True)
+        st.caption("Percentiles are rounded up to the hour. Open stages are waiting on their step; "
+                   "their age counts against the SLA.")
+    
+    # Show dashboard with client info
+    st.subheader("Client Overview")
+    
+    # Advanced filter options
+    st.subheader("Filter Options")
+    with st.expander("Advanced Filters", expanded=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            show_incomplete = st.checkbox("Show only incomplete records", value=False)
+        with col2:
+            show_complete = st.checkbox("Show only complete records", value=False)
+        
+        # Filter by date range
+        st.write("Filter by creation date:")
+        date_col1, date_col2 = st.columns(2)
+        with date_col1:
+            start_date = st.date_input("Start date", value=None)
+        with date_col2:
+            end_date = st.date_input("End date", value=None)
+        
+        # Fuzzy search by company, contact or phone
+        search_term = st.text_input("Search by company, contact or phone", "",
+                                    help="Matches partial words, typos and any part of the phone number")
+    
+    # Sorting options
+    sort_options = {
+        "Company Name (A-Z)": ("name", 1),
+        "Company Name (Z-A)": ("name", -1),
+        "Newest First": ("created_at", -1),
+        "Oldest First": ("created_at", 1),
+        "Most Machines": ("machine_count", -1),
+        "Fewest Machines": ("machine_count", 1),
+        "Highest Completion": ("completion_score", -1),
+        "Lowest Completion": ("completion_score", 1)
+    }
+    
+    # Searches can also be ordered by how well the customers match
+    sort_choices = list(sort_options.keys())
+    if search_term.strip():
+        sort_choices.insert(0, BEST_MATCH)
+    sort_by = st.selectbox("Sort by:", options=sort_choices)
+    sort_field, sort_direction = sort_options.get(sort_by, sort_options["Company Name (A-Z)"])
+    
+    # Query parameters (placeholders left by earlier versions are not listed)
+    query = temporary.not_temporary()
+    
+    # Handle filter logic
+    if show_incomplete and show_complete:
+        # If both are checked, show all (no filter)
+        pass
+    elif show_incomplete:
+        query["$or"] = [
+            {"status.vendor_registered": False},
+            {"status.mrn_created": False},
+            {"status.service_report_created": False},
+            {"status.telecontroller_done": False}
+        ]
+    elif show_complete:
+        query["$and"] = [
+            {"status.vendor_registered": True},
+            {"status.mrn_created": True},
+            {"status.service_report_created": True},
+            {"status.telecontroller_done": True}
+        ]
+    
+    # Date range filtering
+    if start_date or end_date:
+        date_query = {}
+        if start_date:
+            date_query["$gte"] = datetime.datetime.combine(start_date, datetime.time.min)
+        if end_date:
+            date_query["$lte"] = datetime.datetime.combine(end_date, datetime.time.max)
+        if date_query:
+            query["created_at"] = date_query
+    
+    # Company, contact and phone search (ranked by the trigram index)
+    similarity = {}
+    if search_term.strip():
+        similarity = dict(customer_search.find_customers(search_term, limit=SEARCH_LIMIT))
+        query["_id"] = {"$in": [ObjectId(customer_id) for customer_id in similarity]}
+    
+    # Rows of all customers matching the query with sorting (a copy: cached rows are shared)
+    dashboard_data = list(_customer_rows(query, sort_field, sort_direction))
+    if sort_by == BEST_MATCH:
+        dashboard_data.sort(key=lambda row: similarity.get(row["_id"], 0), reverse=True)
+    
+    # Filter by machine serial number (search in MRNs)
+    serial_search = st.text_input("Search by machine serial number:", "")
+    if serial_search.strip():
+        # Get customer IDs from MRNs with matching serial numbers
+        customer_ids = find_customer_ids_by_serial(serial_search)
+        if customer_ids:
+            # Filter customers to only those with matching MRNs
+            dashboard_data = [row for row in dashboard_data if row["_id"] in customer_ids]
+            st.success(f"Found {len(dashboard_data)} customer(s) with machines matching serial number pattern: {serial_search}")
+        else:
+            st.info(f"No machines found with serial number matching: {serial_search}")
+            dashboard_data = []
+    
+    # Display dataframe
+    if dashboard_data:
+        # Create a selection mechanism
+        st.markdown("**Click on any row to continue or view that workflow**")
+        
+        # Create the dataframe with selection
+        selection = st.dataframe(
+            dashboard_data,
+            column_config={
+                "_id": None,  # Hide the ID column
+                "Completion": st.column_config.ProgressColumn(
+                    "Completion",
+                    help="Workflow completion percentage",
+                    format="%d%%",
+                    min_value=0,
+                    max_value=100
+                ),
+                "Actions": st.column_config.Column(
+                    "Actions",
+                    help="View or edit customer data",
+                    width="small"
+                )
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+        
+        # Add a row selection mechanism for editing/viewing
+        st.markdown("### View or Edit Customer Data")
+        customer_for_edit = st.selectbox(
+            "Select a customer to view or edit:",
+            range(len(dashboard_data)),
+            format_func=lambda i: dashboard_data[i]["Company"] if i < len(dashboard_data) else ""
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔍 View Customer Data", key="view_customer_data", use_container_width=True):
+                if customer_for_edit is not None and customer_for_edit < len(dashboard_data):
+                    selected_customer_id = dashboard_data[customer_for_edit]["_id"]
+                    st.session_state.view_customer_id = selected_customer_id
+                    st.session_state.customer_view_mode = "view"
+                    st.session_state.page = "customer_view"
+                    st.rerun()
+        
+        with col2:
+            if st.button("📝 Edit Customer Data", key="edit_customer_data", use_container_width=True):
+                if customer_for_edit is not None and customer_for_edit < len(dashboard_data):
+                    selected_customer_id = dashboard_data[customer_for_edit]["_id"]
+                    st.session_state.view_customer_id = selected_customer_id
+                    st.session_state.customer_view_mode = "edit"
+                    st.session_state.page = "customer_view"
+                    st.rerun()
+        
+        # Add timeline visualization for selected customer
+        if dashboard_data:
+            st.subheader("Service Workflow Timeline View")
+            selected_customer_index = st.selectbox(
+                "Select a customer to view their service timeline:",
+                range(len(dashboard_data)),
+                format_func=lambda i: dashboard_data[i]["Company"] if i < len(dashboard_data) else ""
+            )
+            
+            if selected_customer_index is not None and selected_customer_index < len(dashboard_data):
+                selected_customer_id = dashboard_data[selected_customer_index]["_id"]
+                
+                # The event log holds the full history (one indexed range read); customers
+                # from before the log fall back to the step timestamps, which one aggregation
+                # fills in from the MRN / service report for older customers
+                history = events.timeline(selected_customer_id)
+                if history:
+                    stage_times = events.replay(history)
+                else:
+                    stage_times = cycle_times.customer_stage_times(selected_customer_id)
+                
+                if stage_times:
+                    import pandas as pd
+                    
+                    if history:
+                        timeline_list = [{
+                            "Stage": (EVENT_LABELS.get(entry["k"], entry["k"])
+                                      + ("" if entry.get("v", True) else " (undone)")),
+                            "Date": _format_time(entry["t"]),
+                            "Reference": entry.get("r", "")
+                        } for entry in history]
+                    else:
+                        timeline_list = [{"Stage": "CRM Entry", "Date": _format_time(stage_times["created_at"])}]
+                        for step, label in TIMELINE_STEPS:
+                            if stage_times["status"].get(step, False):
+                                when = stage_times[cycle_times.STAGE_TIMESTAMPS[step]]
+                                timeline_list.append({
+                                    "Stage": label,
+                                    "Date": _format_time(when) if when else "Done (time not recorded)"
+                                })
+                    
+                    # Display as table with custom formatting
+                    st.table(pd.DataFrame(timeline_list))
+                    
+                    # Add a service completion time calculation
+                    start_date = stage_times["created_at"]
+                    end_date = stage_times["telecontroller_done_at"]
+                    if start_date and end_date and stage_times["status"].get("telecontroller_done", False):
+                        service_time = end_date - start_date
+                        days = service_time.days
+                        hours = service_time.seconds // 3600
+                        
+                        st.success(f"Total service completion time: {days} days and {hours} hours")
+        
+        # Below the dataframe, add buttons for each customer
+        st.markdown("### Continue Workflow")
+        st.markdown("Select a customer to continue their workflow:")
+        
+        # Create a selectbox with customer names
+        customer_options = [f"{cust['Company']} ({cust['Completion']} complete)" for cust in dashboard_data]
+        customer_index = st.selectbox("Select customer:", 
+                                       options=range(len(customer_options)),
+                                       format_func=lambda i: customer_options[i] if i < len(customer_options) else "")
+        
+        if st.button("Continue Selected Workflow", use_container_width=True):
+            if customer_index is not None and customer_index < len(dashboard_data):
+                selected_customer_id = dashboard_data[customer_index]["_id"]
+                
+                # Set customer ID in session state
+                st.session_state.customer_id = selected_customer_id
+                
+                # Get customer data
+                customer = customers.find_one({"_id": ObjectId(selected_customer_id)})
+                
+                # Determine which page to navigate to based on workflow progress
+                if not customer['status'].get('vendor_registered', False):
+                    navigate_to_page("vendor_registration")
+                elif not customer['status'].get('mrn_created', False):
+                    navigate_to_page("mrn_creation")
+                elif not customer['status'].get('service_report_created', False):
+                    navigate_to_page("service_report")
+                elif not customer['status'].get('telecontroller_done', False):
+                    navigate_to_page("telecontroller")
+                else:
+                    # If all steps are complete, just stay on the dashboard
+                    st.success(f"Workflow for {customer.get('name', 'Unknown')} is already complete!")
+                    
+                # Get MRN code if exists
+                if customer.get('mrn_code'):
+                    st.session_state.mrn_code = customer.get('mrn_code')
+                    
+                # Get SR code if exists
+                if customer.get('sr_code'):
+                    st.session_state.sr_code = customer.get('sr_code')
+        
+    else:
+        st.info("No records found matching the filter criteria.")
+    
+    # Create new service visit button with better styling
+    st.markdown("<br>", unsafe_allow_html=True)
+    
+    # Create a card-like container for the button
+    st.markdown("""
+    <div style="background-color: #f8f9fa; padding: 20px; border-radius: 10px; text-align: center; margin-top: 20px;">
+        <h3>Start a New Service Workflow</h3>
+        <p>Click below to begin a new customer service workflow</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    col1, col2, col3 = st.columns([3, 2, 3])
+    with col2:
+        if st.button("✨ Create New Service Visit", key="create_new_visit", use_container_width=True):
+            # Reset session state for a new customer; the record is created
+            # by its first valid save on the CRM entry page
+            st.session_state.customer_id = None
+            st.session_state.mrn_code = None
+            st.session_state.sr_code = None
+            
+            # Reset any other form input values that might be in session state
+            if "company_name" in st.session_state:
+                del st.session_state.company_name
+            if "contact_name" in st.session_state:
+                del st.session_state.contact_name
+            if "contact_phone" in st.session_state:
+                del st.session_state.contact_phone
+            if "machine_count" in st.session_state:
+                del st.session_state.machine_count
+            
+            # Navigate to the CRM entry page
+            navigate_to_page("crm_entry")
+            st.rerun()
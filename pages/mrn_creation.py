@@ -1,9 +1,82 @@
 import streamlit as st
 import datetime
-import pandas as pd
 from bson.objectid import ObjectId
-from utils.helpers import navigate_to_page, generate_sequential_code, create_workflow_steps_indicator
+from utils.helpers import navigate_to_page, create_workflow_steps_indicator
 from database.connection import customers, mrns
+from database import autocomplete, drafts, workflow
+
+# Visual inspection items with detailed descriptions
+INSPECTION_ITEMS = [
+    {"name": "Power Cable", "key": "power_cable", "description": "Check for fraying, damage, proper connection"},
+    {"name": "Front Panel", "key": "front_panel", "description": "Check for cracks, dents, display clarity"},
+    {"name": "Control Knobs/Buttons", "key": "control_knobs_button", "description": "Test functionality, check for sticking or damage"},
+    {"name": "Display Screen", "key": "display_screen", "description": "Verify screen works, no dead pixels or cracks"},
+    {"name": "Gas Hose Connectors", "key": "gas_hose_connectors", "description": "Check for proper connection, leaks, damage"},
+    {"name": "Cooling Fan/Vents", "key": "cooling_fan_vents", "description": "Ensure fans spin freely, vents are clear"},
+    {"name": "Welding Torch Socket", "key": "welding_torch_socket", "description": "Check connection quality and secure fit"}
+]
+
+# Draft fields (as in mrn_form_data) and the widgets they are restored into
+DRAFT_WIDGETS = {
+    "received_by": "mrn_received_by",
+    "date_of_receipt": "mrn_receipt_date",
+    "delivered_by": "mrn_delivered_by",
+    "email_id": "mrn_email_id",
+    "deliverer_contact": "mrn_deliverer_contact",
+    "model": "mrn_model",
+    "machine_type": "mrn_machine_type",
+    "serial_no": "mrn_serial_no",
+    "accessories_received": "mrn_accessories",
+    **{f"{item['key']}_{part}": f"mrn_{item['key']}_{part}" for item in INSPECTION_ITEMS for part in ("status", "remarks")},
+    "overall_condition": "mrn_overall_condition",
+    "problem_reported": "mrn_problem_reported",
+    "signature_received_by": "mrn_signature_name",
+    "signature_date": "mrn_signature_date",
+    "customer_signature": "mrn_customer_signature",
+    "office_use_notes": "mrn_office_notes",
+}
+
+# Widgets filled with dates
+DATE_WIDGETS = {"mrn_receipt_date", "mrn_signature_date"}
+
+def _draft_values():
+    """The form's draft fields as last rendered."""
+    form_data = st.session_state.mrn_form_data
+    return {field: form_data[field] for field in DRAFT_WIDGETS if field in form_data}
+
+def _restore_draft(customer_id):
+    """Fill the form from the customer's saved draft, once per customer.
+    
+    Returns:
+        When the restored draft was last saved, or None
+    """
+    if st.session_state.get("mrn_draft_customer") != customer_id:
+        st.session_state.mrn_draft_customer = customer_id
+        # No baseline yet: the first render's values become it without a write
+        st.session_state.mrn_draft_saved = None
+        st.session_state.mrn_draft_restored = None
+        draft = drafts.load_draft(customer_id, drafts.MRN)
+        if draft:
+            values, encoded, updated_at = draft
+            for field, key in DRAFT_WIDGETS.items():
+                if field not in values:
+                    continue
+                value = values[field]
+                # Drafts moved from the mrns collection keep dates as ISO strings
+                if key in DATE_WIDGETS and isinstance(value, str):
+                    try:
+                        value = datetime.date.fromisoformat(value[:10])
+                    except ValueError:
+                        continue
+                st.session_state[key] = value
+            st.session_state.mrn_draft_saved = encoded
+            st.session_state.mrn_draft_restored = updated_at
+    return st.session_state.mrn_draft_restored
+
+def _pick_customer(customer_id):
+    """Switch the MRN to another customer found by the lookup."""
+    st.session_state.customer_id = customer_id
+    st.session_state.mrn_customer_lookup = ""
 
 def render():
     # Display workflow steps indicator
@@ -92,6 +165,11 @@ def render():
                 if "mrn_form_data" not in st.session_state:
                     st.session_state.mrn_form_data = {}
                 
+                # Pick up where a previous visit left off
+                restored_at = _restore_draft(st.session_state.customer_id)
+                if restored_at:
+                    st.info(f"Restored the draft saved on {restored_at:%d %b %Y at %H:%M}.")
+                
                 with tab1:
                     st.subheader("Receipt Information")
                     
@@ -103,19 +181,14 @@ def render():
                     
                     # Date of Receipt
                     receipt_date = st.date_input("Date of Receipt", 
-                                               value=datetime.datetime.now(),
                                                key="mrn_receipt_date")
                     st.session_state.mrn_form_data["date_of_receipt"] = receipt_date
                     
                     # Customer details
                     st.subheader("Customer Information")
                     
-                    # Get all customers for the dropdown suggestion
-                    all_customers = list(customers.find({}, {"name": 1, "contact_phone": 1}))
-                    customer_names = [c.get("name", "") for c in all_customers]
-                    
-                    # Customer name with autocomplete
-                    customer_name = customer["name"]  # Pre-fill with current customer
+                    # Customer name (pre-filled with the current customer)
+                    customer_name = customer["name"]
                     st.session_state.mrn_form_data["customer_name"] = customer_name
                     st.text_input("Customer Name", value=customer_name, disabled=True)
                     
@@ -124,6 +197,19 @@ def render():
                     st.session_state.mrn_form_data["contact_number"] = contact_number
                     st.text_input("Contact Number", value=contact_number, disabled=True)
                     
+                    # Switch to another customer (prefix lookup, no collection scan)
+                    with st.expander("Wrong customer? Find another"):
+                        lookup = st.text_input("Company name or phone", key="mrn_customer_lookup",
+                                               placeholder="Start typing a name or number")
+                        suggestions = [suggestion for suggestion in autocomplete.suggest(lookup)
+                                       if suggestion["_id"] != st.session_state.customer_id]
+                        for i, suggestion in enumerate(suggestions):
+                            label = " · ".join(filter(None, [suggestion["name"], suggestion["contact_phone"]]))
+                            st.button(label, key=f"mrn_customer_pick_{i}", on_click=_pick_customer,
+                                      args=(suggestion["_id"],))
+                        if lookup.strip() and not suggestions:
+                            st.caption("No matching customers.")
+                    
                     # Delivered By
                     st.subheader("Delivery Information")
                     delivered_by = st.text_input("Delivered By (Name/Company)", 
@@ -159,22 +245,11 @@ def render():
                 with tab3:
                     st.subheader("Machine Visual Inspection Checklist")
                     
-                    # Define inspection items with detailed descriptions
-                    inspection_items = [
-                        {"name": "Power Cable", "key": "power_cable", "description": "Check for fraying, damage, proper connection"},
-                        {"name": "Front Panel", "key": "front_panel", "description": "Check for cracks, dents, display clarity"},
-                        {"name": "Control Knobs/Buttons", "key": "control_knobs_button", "description": "Test functionality, check for sticking or damage"},
-                        {"name": "Display Screen", "key": "display_screen", "description": "Verify screen works, no dead pixels or cracks"},
-                        {"name": "Gas Hose Connectors", "key": "gas_hose_connectors", "description": "Check for proper connection, leaks, damage"},
-                        {"name": "Cooling Fan/Vents", "key": "cooling_fan_vents", "description": "Ensure fans spin freely, vents are clear"},
-                        {"name": "Welding Torch Socket", "key": "welding_torch_socket", "description": "Check connection quality and secure fit"}
-                    ]
-                    
                     # Track overall inspection status
                     inspection_statuses = []
                     
                     # Create inspection form with improved UI
-                    for item in inspection_items:
+                    for item in INSPECTION_ITEMS:
                         with st.expander(f"**{item['name']}**", expanded=False):
                             st.info(item['description'])
                             
@@ -244,7 +319,6 @@ def render():
                     
                     signature_date = st.date_input(
                         "Date:",
-                        value=datetime.datetime.now(),
                         key="mrn_signature_date"
                     )
                     st.session_state.mrn_form_data["signature_date"] = signature_date
@@ -268,72 +342,28 @@ def render():
                 # Add a save button before generate
                 st.markdown("<br>", unsafe_allow_html=True)
                 if st.button("💾 Save Form Data (Without Generating MRN)", key="save_mrn_form"):
-                    # Save the form data without generating MRN
-                    if st.session_state.customer_id and "mrn_form_data" in st.session_state:
-                        # Save form data to database without generating MRN
-                        draft_data = st.session_state.mrn_form_data.copy()
-                        draft_data.update({
-                            "customer_id": st.session_state.customer_id,
-                            "is_draft": True,
-                            "updated_at": datetime.datetime.now()
-                        })
-                        
-                        # Convert date objects to strings
-                        for key, value in draft_data.items():
-                            if isinstance(value, datetime.date):
-                                draft_data[key] = value.isoformat()
-                        
-                        # Check if draft exists already
-                        existing_draft = mrns.find_one({
-                            "customer_id": st.session_state.customer_id, 
-                            "is_draft": True
-                        })
-                        
-                        if existing_draft:
-                            # Update existing draft
-                            mrns.update_one(
-                                {"_id": existing_draft["_id"]},
-                                {"$set": draft_data}
-                            )
-                        else:
-                            # Insert new draft
-                            mrns.insert_one(draft_data)
-                        
-                        st.toast("Form data saved as draft", icon="✅")
+                    # Write the whole draft (one upsert in the drafts collection, not an MRN)
+                    st.session_state.mrn_draft_saved = drafts.save_draft(
+                        st.session_state.customer_id, drafts.MRN, _draft_values())
+                    st.toast("Form data saved as draft", icon="✅")
+                elif st.session_state.mrn_draft_saved is None:
+                    # First render: remember the form as shown, write nothing
+                    st.session_state.mrn_draft_saved = {field: drafts.encode(value)
+                                                        for field, value in _draft_values().items()}
+                else:
+                    # Every rerun keeps the draft current with the fields that changed
+                    st.session_state.mrn_draft_saved = drafts.save_draft(
+                        st.session_state.customer_id, drafts.MRN, _draft_values(),
+                        previous=st.session_state.mrn_draft_saved)
                 
                 # Generate MRN button
                 st.markdown("<br>", unsafe_allow_html=True)
                 col1, col2, col3 = st.columns([3, 4, 3])
                 with col2:
                     if st.button("Generate MRN & Save Form", key="generate_mrn", use_container_width=True):
-                        # Generate MRN code
-                        mrn_code = generate_sequential_code("MRN")
-                        
-                        # Combine the form data with the MRN information
-                        mrn_data = st.session_state.mrn_form_data.copy()
-                        mrn_data.update({
-                            "customer_id": st.session_state.customer_id,
-                            "mrn_code": mrn_code,
-                            "created_at": datetime.datetime.now(),
-                            "code": mrn_code  # To help with the sequential code search
-                        })
-                        
-                        # Convert any non-serializable objects (like datetime.date) to strings
-                        for key, value in mrn_data.items():
-                            if isinstance(value, datetime.date):
-                                mrn_data[key] = value.isoformat()
-                        
-                        # Insert MRN data
-                        mrns.insert_one(mrn_data)
-                        
-                        # Update customer status
-                        customers.update_one(
-                            {"_id": ObjectId(st.session_state.customer_id)},
-                            {"$set": {
-                                "status.mrn_created": True,
-                                "mrn_code": mrn_code
-                            }}
-                        )
+                        # Generate the MRN code, store the MRN and mark the step done
+                        mrn_code = workflow.create_mrn(st.session_state.customer_id,
+                                                       st.session_state.mrn_form_data)["mrn_code"]
                         
                         st.session_state.mrn_code = mrn_code
                         st.success(f"MRN Generated: {mrn_code}")
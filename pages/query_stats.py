@@ -0,0 +1,79 @@
+import streamlit as st
+from utils.helpers import navigate_to_page
+from database.connection import client
+from database.monitoring import query_stats, explain_command
+
+def render():
+    """Render the query statistics admin page."""
+    st.header("Query Statistics")
+
+    # Instructions in a card
+    st.markdown("""
+    <div class="css-card">
+        <h3>Database Query Shapes</h3>
+        <p>Every database command is grouped by its query shape (field names and operators, literal values removed). Commands slower than the threshold are listed in the slow-query log.</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+    snapshot = query_stats.snapshot()
+
+    # Summary metrics
+    total_commands = sum(s["count"] for s in snapshot["shapes"])
+    total_time = sum(s["total_ms"] for s in snapshot["shapes"])
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Query Shapes", len(snapshot["shapes"]))
+    with col2:
+        st.metric("Commands", total_commands)
+    with col3:
+        st.metric("Total DB Time", f"{total_time:.0f} ms")
+
+    st.caption(f"Collecting since {snapshot['started_at']}. Slow-query threshold: {snapshot['slow_query_ms']:.0f} ms")
+
+    # Shape table, most expensive first
+    st.subheader("Shapes by Total Time")
+    if snapshot["shapes"]:
+        st.dataframe(
+            snapshot["shapes"],
+            column_config={
+                "shape": st.column_config.TextColumn("Shape", width="large"),
+                "bytes_returned": st.column_config.NumberColumn("Bytes", format="%d"),
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info("No queries recorded yet.")
+
+    # Slow-query log with explain on demand
+    st.subheader("Slow-Query Log")
+    if not snapshot["slow_queries"]:
+        st.info("No slow queries recorded.")
+    for i, entry in enumerate(snapshot["slow_queries"]):
+        with st.expander(f"{entry['duration_ms']:.1f} ms — {entry['shape']}", expanded=False):
+            st.write(f"Recorded at {entry['timestamp']} on `{entry['database']}`, {entry['docs_returned']} document(s) returned")
+            if entry["command"]:
+                st.code(entry["command"], language="json")
+                if st.button("Explain", key=f"explain_slow_query_{i}"):
+                    try:
+                        st.json(explain_command(client, entry["database"], entry["command"]))
+                    except Exception as e:
+                        st.error(f"Explain failed: {str(e)}")
+            else:
+                st.write("This command cannot be explained.")
+
+    # Management buttons
+    st.markdown("<br>", unsafe_allow_html=True)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("Return to Dashboard", key="query_stats_home", use_container_width=True):
+            navigate_to_page("home")
+            st.rerun()
+    with col2:
+        if st.button("💾 Write Snapshot", key="query_stats_dump", use_container_width=True):
+            query_stats.dump()
+            st.toast(f"Snapshot written to {query_stats.stats_path}", icon="✅")
+    with col3:
+        if st.button("🗑️ Reset Statistics", key="query_stats_reset", use_container_width=True):
+            query_stats.reset()
+            st.rerun()
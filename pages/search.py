@@ -0,0 +1,108 @@
+import streamlit as st
+import datetime
+import html
+from database import search
+
+# Hits per results page
+PER_PAGE = 20
+
+# Search scope options
+SCOPES = {
+    "Service reports and MRNs": None,
+    "Service reports": ["service_reports"],
+    "MRNs": ["mrns"],
+}
+
+# Labels of the searched fields
+FIELD_LABELS = {
+    "reported_fault": "Reported fault",
+    "problem_diagnosis": "Diagnosis",
+    "job_carried_out": "Job carried out",
+    "recommendations": "Recommendations",
+    "problem_reported": "Problem reported",
+    "accessories_received": "Accessories",
+}
+
+def _reset_page():
+    st.session_state.search_page = 1
+
+def render():
+    """Render the job search page."""
+    st.header("Job Search")
+
+    # Instructions in a card
+    st.markdown("""
+    <div class="css-card">
+        <h3>Find Past Jobs</h3>
+        <p>Search reported faults, diagnoses, work carried out and recommendations in service reports, and problems and accessories in MRNs. The best matches come first.</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("Symptom or keywords", key="search_query", on_change=_reset_page,
+                              placeholder="e.g. fan noise, no arc start")
+    with col2:
+        scope = st.selectbox("Search in", list(SCOPES), key="search_scope", on_change=_reset_page)
+
+    if not query.strip():
+        st.info("Type a symptom or keywords to search past jobs.")
+        return
+
+    if "search_page" not in st.session_state:
+        st.session_state.search_page = 1
+    results = search.search(query, page=st.session_state.search_page, per_page=PER_PAGE,
+                            collections=SCOPES[scope])
+    total = results["total"]
+    if not total:
+        st.warning("No matching jobs found.")
+        return
+
+    pages = -(-total // PER_PAGE)
+    first = (results["page"] - 1) * PER_PAGE + 1
+    st.caption(f"{total} matching documents, showing {first}–{first + len(results['hits']) - 1}")
+
+    for i, hit in enumerate(results["hits"]):
+        is_report = hit["collection"] == "service_reports"
+        code = hit.get("sr_code") if is_report else hit.get("mrn_code")
+        when = hit.get("service_date") if is_report else hit.get("created_at")
+        details = [hit.get("customer_name") or "Unknown customer"]
+        if isinstance(when, datetime.datetime):
+            details.append(when.strftime("%Y-%m-%d"))
+        if is_report:
+            machine = hit.get("type_of_machine")
+        else:
+            machine = " ".join(str(part) for part in (hit.get("model"), hit.get("serial_no")) if part)
+        if machine:
+            details.append(machine)
+        # Hit fields are user-entered and go into HTML, like the (already escaped) snippets
+        code = html.escape(str(code or ""))
+        details = [html.escape(str(detail)) for detail in details]
+
+        snippets = "".join(f"<p><strong>{FIELD_LABELS.get(field, field)}:</strong> {snippet}</p>"
+                           for field, snippet in hit["snippets"].items())
+        st.markdown(f"""
+        <div class="css-card">
+            <h4>{"Service Report" if is_report else "MRN"} {code}</h4>
+            <p>{" · ".join(details)}</p>
+            {snippets}
+        </div>
+        """, unsafe_allow_html=True)
+        if hit.get("customer_id") and st.button("View customer", key=f"search_view_{i}"):
+            st.session_state.view_customer_id = hit["customer_id"]
+            st.session_state.customer_view_mode = "view"
+            st.session_state.page = "customer_view"
+            st.rerun()
+
+    # Paging
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("← Previous", key="search_previous", disabled=results["page"] <= 1, use_container_width=True):
+            st.session_state.search_page -= 1
+            st.rerun()
+    with col2:
+        st.markdown(f"<div style='text-align: center;'>Page {results['page']} of {pages}</div>", unsafe_allow_html=True)
+    with col3:
+        if st.button("Next →", key="search_next", disabled=results["page"] >= pages, use_container_width=True):
+            st.session_state.search_page += 1
+            st.rerun()
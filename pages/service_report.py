@@ -1,9 +1,285 @@
 import streamlit as st
 import datetime
-import pandas as pd
 from bson.objectid import ObjectId
-from utils.helpers import navigate_to_page, reset_autosave_timer, generate_sequential_code, create_workflow_steps_indicator, validate_phone_number, validate_email
+from utils.helpers import navigate_to_page, autosave, create_workflow_steps_indicator, validate_phone_number, validate_email
+from utils.costs import MINOR_UNITS, line_totals, from_minor, format_money
 from database.connection import customers, service_reports, mrns
+from database import writeback, drafts
+
+# Sections of the service report form; only the active one is rendered
+SECTIONS = ["Basic Information", "Job Details", "Inspection Checklist", "Parts & Materials", "Labor & Costs", "Signatures"]
+
+# Inspection checklist items by category
+CHECKLIST_CATEGORIES = {
+    "Electrical Systems": [
+        "Power Supply Voltage",
+        "Control Circuits",
+        "Electronic Components",
+        "Wiring Condition",
+        "Emergency Stop Function"
+    ],
+    "Mechanical Systems": [
+        "Safety Guards and Covers",
+        "Lubrication of Moving Parts",
+        "Wear and Tear of Components",
+        "Belt/Chain Tension",
+        "Hydraulic Systems"
+    ],
+    "General Condition": [
+        "Hoses and Connections",
+        "Leaks (Oil/Water/Gas)",
+        "Operational Test Run",
+        "Sound/Vibration Test",
+        "Cleaning of Equipment"
+    ],
+    "Specialized Checks": [
+        "Cooling System",
+        "Heating Elements",
+        "Pressure Test",
+        "Calibration (if applicable)",
+        "Software/Firmware Version"
+    ]
+}
+
+CHECKLIST_STATUSES = ["Not Checked", "Pass", "Fail", "N/A", "Repaired"]
+SERVICE_STATUSES = ["Completed Successfully", "Completed with Issues", "Partially Completed", "Not Completed", "Pending Follow-up"]
+STAFF_JOB_STATUSES = ["Completed", "In Progress", "Pending", "Cancelled"]
+STAFF_JOB_TYPES = ["Repair", "Maintenance", "Installation", "Training", "Inspection", "Other"]
+PART_STATUSES = ["Used", "Replaced", "Pending", "On Order", "Recommended"]
+LABOR_TYPES = ["Standard Labor", "Overtime Labor", "Travel", "Accommodation", "Other"]
+OTHER_SERVICE_TYPES = ["Scheduled Maintenance", "Repair", "Installation", "Training", "Inspection", "Other"]
+
+# Seconds a manual save waits for the report to reach the database
+SAVE_WAIT_SECONDS = 3.0
+
+def _as_date(value, default):
+    """Dates come back from MongoDB as datetimes; date widgets need datetime.date."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return default
+
+def init_form(customer, mrn_data, existing_report):
+    """Build the compact form model: one value per scalar field, keyed like its widget.
+    
+    Args:
+        customer: Customer document (or None)
+        mrn_data: MRN document for prefilling machine details (or None)
+        existing_report: Saved service report (or None)
+        
+    Returns:
+        Dict of field values
+    """
+    customer = customer or {}
+    mrn_data = mrn_data or {}
+    report = existing_report or {}
+    today = datetime.date.today()
+    service_status = report.get('service_status', SERVICE_STATUSES[0])
+    
+    return {
+        # Basic information
+        "service_date": _as_date(report.get('service_date'), today),
+        "customer_name": customer.get('name', ''),
+        "contact_number": customer.get('contact_phone', ''),
+        "email_id": customer.get('email', ''),
+        "type_of_machine": mrn_data.get('machine_type', ''),
+        "jc_no": report.get('jc_no', ''),
+        "service_type_ws": report.get('service_type_ws', False),
+        "service_type_gs": report.get('service_type_gs', False),
+        "other_service_types": report.get('other_service_types', []),
+        "make_model": mrn_data.get('model', ''),
+        "serial_number": mrn_data.get('serial_no', ''),
+        "running_hours": report.get('running_hours', 0),
+        
+        # Job details
+        "reported_fault": report.get('reported_fault', '') if report else mrn_data.get('problem_reported', ''),
+        "problem_diagnosis": report.get('problem_diagnosis', ''),
+        "job_carried_out": report.get('job_carried_out', ''),
+        "technical_difficulties": report.get('technical_difficulties', ''),
+        "recommendations": report.get('recommendations', ''),
+        "job_status_comments": report.get('job_status_comments', ''),
+        
+        # Inspection checklist
+        "inspection_comments": report.get('inspection_comments', ''),
+        
+        # Labor & costs
+        "cost_notes": report.get('cost_notes', ''),
+        
+        # Signatures
+        "service_status": service_status if service_status in SERVICE_STATUSES else SERVICE_STATUSES[0],
+        "follow_up_required": report.get('follow_up_required', False),
+        "follow_up_details": report.get('follow_up_details', ''),
+        "follow_up_date": _as_date(report.get('follow_up_date'), today + datetime.timedelta(days=7)),
+        "service_advisor": report.get('service_advisor', ''),
+        "service_advisor_date": _as_date(report.get('service_advisor_date'), today),
+        "service_advisor_signature": report.get('service_advisor_signature', ''),
+        "customer_rep": report.get('customer_rep', ''),
+        "customer_rep_date": _as_date(report.get('customer_rep_date'), today),
+        "customer_rep_signature": report.get('customer_rep_signature', ''),
+        "satisfaction_level": report.get('satisfaction_level', 5),
+        "customer_feedback": report.get('customer_feedback', ''),
+    }
+
+# List tables edited with st.data_editor: report field and (column, default) pairs
+TABLES = {
+    "staff": ("staff_assigned", [("name", ""), ("service_date", None), ("travel_time", ""), ("job_start", "09:00"),
+                                 ("job_end", "17:00"), ("job_status", "Completed"), ("job_type", "Repair")]),
+    "parts": ("parts_list", [("part_number", ""), ("description", ""), ("make", ""), ("status", "Used"),
+                             ("quantity", 0), ("unit_price", 0.0), ("remark", "")]),
+    "labor": ("labor_costs", [("description", ""), ("type", "Standard Labor"), ("hours", 0.0), ("rate", 0.0),
+                              ("notes", "")]),
+}
+
+def _parse(value, fmt, kind, default):
+    """Staff dates and times are saved as strings; grid cells hold date/time objects."""
+    if isinstance(value, kind) and not isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.date() if kind is datetime.date else value.time()
+    try:
+        parsed = datetime.datetime.strptime(str(value), fmt)
+    except ValueError:
+        return default
+    return parsed.date() if kind is datetime.date else parsed.time()
+
+def _typed(kind, frame):
+    """Fill blanks (e.g. rows added in the grid) with defaults and fix column dtypes."""
+    import pandas as pd
+    
+    for column, default in TABLES[kind][1]:
+        if kind == "staff" and column == "service_date":
+            frame[column] = frame[column].map(lambda v: _parse(v, '%Y-%m-%d', datetime.date, datetime.date.today()))
+        elif kind == "staff" and column in ("job_start", "job_end"):
+            default_time = datetime.datetime.strptime(default, '%H:%M').time()
+            frame[column] = frame[column].map(lambda v: _parse(v, '%H:%M', datetime.time, default_time))
+        elif isinstance(default, int):
+            frame[column] = pd.to_numeric(frame[column], errors="coerce").fillna(default).astype("int64")
+        elif isinstance(default, float):
+            frame[column] = pd.to_numeric(frame[column], errors="coerce").fillna(default).astype("float64")
+        else:
+            frame[column] = frame[column].fillna(default).astype(str)
+    return frame
+
+def rows_to_frame(kind, rows):
+    """Load saved list entries into a typed DataFrame (empty entries are dropped)."""
+    import pandas as pd
+    
+    columns = [column for column, _ in TABLES[kind][1]]
+    records = [{column: row.get(column) for column in columns} for row in rows if row]
+    return _typed(kind, pd.DataFrame.from_records(records, columns=columns))
+
+def frame_to_rows(kind, frame):
+    """Turn an edited table back into the list entries stored on the report."""
+    frame = _typed(kind, frame.copy())
+    
+    # Line totals in minor units, computed for the whole column at once
+    if kind == "parts":
+        frame["total_price_minor"] = line_totals(frame["quantity"], frame["unit_price"])
+        frame["total_price"] = frame["total_price_minor"] / MINOR_UNITS
+    elif kind == "labor":
+        frame["total_cost_minor"] = line_totals(frame["hours"], frame["rate"])
+        frame["total_cost"] = frame["total_cost_minor"] / MINOR_UNITS
+    elif kind == "staff":
+        # BSON cannot encode date/time objects
+        frame["service_date"] = [d.strftime('%Y-%m-%d') for d in frame["service_date"]]
+        frame["job_start"] = [t.strftime('%H:%M') for t in frame["job_start"]]
+        frame["job_end"] = [t.strftime('%H:%M') for t in frame["job_end"]]
+    return frame.to_dict("records")
+
+def table_totals(parts, labor):
+    """Return (parts, labor, grand) totals in minor units from the parts and labor tables."""
+    total_parts_minor = int(line_totals(parts["quantity"], parts["unit_price"]).sum())
+    total_labor_minor = int(line_totals(labor["hours"], labor["rate"]).sum())
+    return total_parts_minor, total_labor_minor, total_parts_minor + total_labor_minor
+
+def array_update(field, saved_rows, current_rows):
+    """Return ($set, $push) operations that turn saved_rows into current_rows.
+    
+    Only changed rows are sent: edited rows as `field.<index>`, appended rows
+    as a $push. Deletions, or edits together with appends (a conflicting
+    update), replace the whole array.
+    """
+    if saved_rows is None or len(current_rows) < len(saved_rows):
+        return {field: current_rows}, {}
+    changed = {f"{field}.{i}": row for i, (old, row) in enumerate(zip(saved_rows, current_rows)) if old != row}
+    appended = current_rows[len(saved_rows):]
+    if changed and appended:
+        return {field: current_rows}, {}
+    if appended:
+        return {}, {field: {"$each": appended}}
+    return changed, {}
+
+def _init_tables(existing_report):
+    """Load the list tables and inspection checklist into session state."""
+    report = existing_report or {}
+    st.session_state.sr_tables = {}
+    st.session_state.sr_edited_tables = {}
+    st.session_state.sr_saved_rows = {}
+    for kind, (field, _) in TABLES.items():
+        raw_rows = report.get(field) or []
+        frame = rows_to_frame(kind, raw_rows)
+        st.session_state.sr_tables[kind] = frame
+        # Row-level updates need the saved array to match what was loaded
+        saved_rows = frame_to_rows(kind, frame)
+        st.session_state.sr_saved_rows[field] = saved_rows if saved_rows == raw_rows else None
+    
+    # New editor keys, so grid edits made against the previous tables are not replayed
+    st.session_state.sr_editor_version = st.session_state.get("sr_editor_version", 0) + 1
+    
+    if report.get('inspection_checklist'):
+        st.session_state.inspection_checklist = report['inspection_checklist']
+    else:
+        st.session_state.inspection_checklist = {
+            item: {"status": "Not Checked", "notes": ""}
+            for items in CHECKLIST_CATEGORIES.values() for item in items
+        }
+
+def form_snapshot(form):
+    """Copy of everything the report is built from, to detect changes between reruns."""
+    values = dict(form)
+    for kind, (field, _) in TABLES.items():
+        values[field] = frame_to_rows(kind, current_table(kind))
+    values["inspection_checklist"] = st.session_state.inspection_checklist
+    return drafts.encode(values)
+
+def current_table(kind):
+    """The table as last edited (the loaded table if its grid has not been edited)."""
+    return st.session_state.sr_edited_tables.get(kind, st.session_state.sr_tables[kind])
+
+def _table_editor(kind, column_config):
+    """Edit a list table in a data_editor grid; returns the edited DataFrame.
+    
+    The grid keeps its edits as a delta against the frame it was given, so
+    that frame must not change while the grid is shown. When the grid's
+    state is gone (its section was hidden), the last edits are folded into
+    the table first.
+    """
+    key = f"sr_{kind}_editor_{st.session_state.sr_editor_version}"
+    if key not in st.session_state and kind in st.session_state.sr_edited_tables:
+        st.session_state.sr_tables[kind] = st.session_state.sr_edited_tables.pop(kind)
+    
+    edited = st.data_editor(
+        st.session_state.sr_tables[kind],
+        column_config=column_config,
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        key=key
+    )
+    st.session_state.sr_edited_tables[kind] = edited
+    return edited
+
+def _bind(form, key):
+    """Seed a widget's state from the form model and return its key.
+    
+    Streamlit drops the state of widgets that were not rendered on the last
+    run, so a field in a hidden section is restored from the model when its
+    section is shown again.
+    """
+    if key not in st.session_state:
+        st.session_state[key] = form[key]
+    return key
 
 def render():
     # Display workflow steps indicator
@@ -24,64 +300,61 @@ def render():
         # Display MRN
         st.write(f"MRN Code: {st.session_state.mrn_code}")
         
-        # Get customer data for auto-filling
-        customer = customers.find_one({"_id": ObjectId(st.session_state.customer_id)})
-        # Get MRN data for prefilling machine details
-        mrn_data = mrns.find_one({"customer_id": st.session_state.customer_id, "is_draft": {"$ne": True}})
-        
         # Check if service report already exists
         existing_report = service_reports.find_one({"customer_id": st.session_state.customer_id})
         
-        # Create tabs for better organization of the form
-        tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Basic Information", "Job Details", "Inspection Checklist", "Parts & Materials", "Labor & Costs", "Signatures"])
+        # Reports created here are journaled and reach the database a moment later
+        pending_reports = st.session_state.setdefault("sr_pending_reports", {})
+        report_id = existing_report["_id"] if existing_report else pending_reports.get(st.session_state.customer_id)
+        
+        # Build the form model once per customer and report; reruns (and this
+        # session's own saves) edit it in place
+        form_version = (st.session_state.customer_id, report_id)
+        if st.session_state.get("sr_form_version") != form_version:
+            # Get customer data and MRN data for auto-filling
+            customer = customers.find_one({"_id": ObjectId(st.session_state.customer_id)})
+            mrn_data = mrns.find_one({"customer_id": st.session_state.customer_id})
+            
+            st.session_state.sr_form = init_form(customer, mrn_data, existing_report)
+            st.session_state.sr_form_version = form_version
+            _init_tables(existing_report)
+            
+            # Drop widget state left over from another report or revision
+            for key in st.session_state.sr_form:
+                if key in st.session_state:
+                    del st.session_state[key]
         
-        with tab1:
+        form = st.session_state.sr_form
+        
+        # Section navigator: only the selected section's widgets are built
+        section = st.radio("Section", SECTIONS, horizontal=True, key="sr_section", label_visibility="collapsed")
+        
+        if section == "Basic Information":
             st.subheader("Service Report Information")
             
             # Date field with format DD/MM/YYYY
-            service_date = st.date_input(
-                "Date", 
-                value=existing_report.get('service_date', datetime.datetime.now()) if existing_report else datetime.datetime.now(),
-                format="DD/MM/YYYY",
-                key="service_date"
-            )
+            form["service_date"] = st.date_input("Date", format="DD/MM/YYYY", key=_bind(form, "service_date"))
             
             # Customer information (auto-filled but editable)
-            customer_name = st.text_input(
-                "Customer Name", 
-                value=customer.get('name', '') if customer else '',
-                key="customer_name"
-            )
+            form["customer_name"] = st.text_input("Customer Name", key=_bind(form, "customer_name"))
             
-            contact_number = st.text_input(
-                "Contact Number", 
-                value=customer.get('contact_phone', '') if customer else '',
-                key="contact_number"
-            )
+            form["contact_number"] = st.text_input("Contact Number", key=_bind(form, "contact_number"))
             
             # Validate phone number format
-            if contact_number and not validate_phone_number(contact_number):
+            if form["contact_number"] and not validate_phone_number(form["contact_number"]):
                 st.warning("Please enter a valid phone number")
             
-            email_id = st.text_input(
-                "Email ID", 
-                value=customer.get('email', '') if customer else '',
-                key="email_id"
-            )
+            form["email_id"] = st.text_input("Email ID", key=_bind(form, "email_id"))
             
             # Validate email format
-            if email_id and not validate_email(email_id):
+            if form["email_id"] and not validate_email(form["email_id"]):
                 st.warning("Please enter a valid email address")
             
             # Machine information
             st.subheader("Machine Information")
             
             # Auto-fill from MRN if available
-            type_of_machine = st.text_input(
-                "Type Of Machine", 
-                value=mrn_data.get('machine_type', '') if mrn_data else '',
-                key="type_of_machine"
-            )
+            form["type_of_machine"] = st.text_input("Type Of Machine", key=_bind(form, "type_of_machine"))
             
             # MRN code (display only)
             st.text_input(
@@ -92,253 +365,79 @@ def render():
             )
             
             # Job Card Number
-            jc_no = st.text_input(
-                "JC No.", 
-                value=existing_report.get('jc_no', '') if existing_report else '',
-                key="jc_no"
-            )
+            form["jc_no"] = st.text_input("JC No.", key=_bind(form, "jc_no"))
             
             # Types of Service (checkboxes)
             st.subheader("Type of Service")
             col1, col2 = st.columns(2)
             with col1:
-                ws_selected = st.checkbox(
-                    "WS (Warranty Service)", 
-                    value=existing_report.get('service_type_ws', False) if existing_report else False,
-                    key="service_type_ws"
-                )
+                form["service_type_ws"] = st.checkbox("WS (Warranty Service)", key=_bind(form, "service_type_ws"))
             with col2:
-                gs_selected = st.checkbox(
-                    "GS (General Service)", 
-                    value=existing_report.get('service_type_gs', False) if existing_report else False,
-                    key="service_type_gs"
-                )
+                form["service_type_gs"] = st.checkbox("GS (General Service)", key=_bind(form, "service_type_gs"))
             
             # Additional service types
-            other_service_types = st.multiselect(
+            form["other_service_types"] = st.multiselect(
                 "Other Service Types",
-                ["Scheduled Maintenance", "Repair", "Installation", "Training", "Inspection", "Other"],
-                default=existing_report.get('other_service_types', []) if existing_report else [],
-                key="other_service_types"
+                OTHER_SERVICE_TYPES,
+                key=_bind(form, "other_service_types")
             )
             
             # Machine details
-            make_model = st.text_input(
-                "Make & Model", 
-                value=mrn_data.get('model', '') if mrn_data else '',
-                key="make_model"
-            )
+            form["make_model"] = st.text_input("Make & Model", key=_bind(form, "make_model"))
             
-            serial_number = st.text_input(
-                "Serial Number", 
-                value=mrn_data.get('serial_no', '') if mrn_data else '',
-                key="serial_number"
-            )
+            form["serial_number"] = st.text_input("Serial Number", key=_bind(form, "serial_number"))
             
-            running_hours = st.number_input(
-                "Running Hours", 
-                min_value=0, 
-                value=existing_report.get('running_hours', 0) if existing_report else 0,
-                key="running_hours"
-            )
+            form["running_hours"] = st.number_input("Running Hours", min_value=0, key=_bind(form, "running_hours"))
         
-        with tab2:
+        elif section == "Job Details":
             st.subheader("Service Details")
             
             # Reported fault
-            reported_fault = st.text_area(
-                "Reported Fault", 
-                value=existing_report.get('reported_fault', '') if existing_report else (mrn_data.get('problem_reported', '') if mrn_data else ''),
-                height=100,
-                key="reported_fault"
-            )
+            form["reported_fault"] = st.text_area("Reported Fault", height=100, key=_bind(form, "reported_fault"))
             
             # Problem diagnosis
-            problem_diagnosis = st.text_area(
-                "Problem Diagnosis", 
-                value=existing_report.get('problem_diagnosis', '') if existing_report else '',
-                height=100,
-                key="problem_diagnosis"
-            )
+            form["problem_diagnosis"] = st.text_area("Problem Diagnosis", height=100, key=_bind(form, "problem_diagnosis"))
             
             # Job carried out
-            job_carried_out = st.text_area(
-                "Job Carried Out", 
-                value=existing_report.get('job_carried_out', '') if existing_report else '',
-                height=150,
-                key="job_carried_out"
-            )
+            form["job_carried_out"] = st.text_area("Job Carried Out", height=150, key=_bind(form, "job_carried_out"))
             
             # Technical difficulties encountered
-            technical_difficulties = st.text_area(
+            form["technical_difficulties"] = st.text_area(
                 "Technical Difficulties Encountered", 
-                value=existing_report.get('technical_difficulties', '') if existing_report else '',
                 height=100,
-                key="technical_difficulties"
+                key=_bind(form, "technical_difficulties")
             )
             
             # Recommendations
-            recommendations = st.text_area(
-                "Recommendations for Future", 
-                value=existing_report.get('recommendations', '') if existing_report else '',
-                height=100,
-                key="recommendations"
-            )
+            form["recommendations"] = st.text_area("Recommendations for Future", height=100, key=_bind(form, "recommendations"))
             
             # Staff assigned section
             st.subheader("Staff Assigned / Job Details")
             
-            # Initialize staff list if not in session state
-            if "staff_list" not in st.session_state:
-                if existing_report and "staff_assigned" in existing_report:
-                    st.session_state.staff_list = existing_report.get('staff_assigned', [])
-                else:
-                    st.session_state.staff_list = [{}]  # Start with one empty entry
-            
-            # Function to add a new staff entry
-            def add_staff_entry():
-                st.session_state.staff_list.append({})
-            
-            # Function to remove a staff entry
-            def remove_staff_entry(index):
-                if len(st.session_state.staff_list) > 1:  # Keep at least one entry
-                    st.session_state.staff_list.pop(index)
-            
-            # Display each staff entry
-            for i, staff_entry in enumerate(st.session_state.staff_list):
-                with st.container():
-                    st.markdown(f"**Staff Entry #{i+1}**")
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        staff_entry['name'] = st.text_input(
-                            "Staff Assigned", 
-                            value=staff_entry.get('name', ''),
-                            key=f"staff_name_{i}"
-                        )
-                        
-                        staff_entry['service_date'] = st.date_input(
-                            "Service Date", 
-                            value=datetime.datetime.strptime(staff_entry.get('service_date', datetime.datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date() 
-                                if isinstance(staff_entry.get('service_date', ''), str) and staff_entry.get('service_date', '') 
-                                else datetime.datetime.now(),
-                            key=f"staff_service_date_{i}"
-                        )
-                        
-                        staff_entry['travel_time'] = st.text_input(
-                            "Travel Time (hours)", 
-                            value=staff_entry.get('travel_time', ''),
-                            key=f"staff_travel_time_{i}"
-                        )
-                    
-                    with col2:
-                        # Job start and end times
-                        staff_entry['job_start'] = st.time_input(
-                            "Job Start", 
-                            value=datetime.datetime.strptime(staff_entry.get('job_start', '09:00'), '%H:%M').time() 
-                                if isinstance(staff_entry.get('job_start', ''), str) and staff_entry.get('job_start', '') 
-                                else datetime.time(9, 0),
-                            key=f"staff_job_start_{i}"
-                        )
-                        
-                        staff_entry['job_end'] = st.time_input(
-                            "Job End", 
-                            value=datetime.datetime.strptime(staff_entry.get('job_end', '17:00'), '%H:%M').time() 
-                                if isinstance(staff_entry.get('job_end', ''), str) and staff_entry.get('job_end', '') 
-                                else datetime.time(17, 0),
-                            key=f"staff_job_end_{i}"
-                        )
-                        
-                        staff_entry['job_status'] = st.selectbox(
-                            "Job Status", 
-                            options=["Completed", "In Progress", "Pending", "Cancelled"],
-                            index=["Completed", "In Progress", "Pending", "Cancelled"].index(staff_entry.get('job_status', 'Completed')) 
-                                if staff_entry.get('job_status', '') in ["Completed", "In Progress", "Pending", "Cancelled"] 
-                                else 0,
-                            key=f"staff_job_status_{i}"
-                        )
-                    
-                    staff_entry['job_type'] = st.selectbox(
-                        "Job Type", 
-                        options=["Repair", "Maintenance", "Installation", "Training", "Inspection", "Other"],
-                        index=["Repair", "Maintenance", "Installation", "Training", "Inspection", "Other"].index(staff_entry.get('job_type', 'Repair')) 
-                            if staff_entry.get('job_type', '') in ["Repair", "Maintenance", "Installation", "Training", "Inspection", "Other"] 
-                            else 0,
-                        key=f"staff_job_type_{i}"
-                    )
-                    
-                    # Remove button for this entry
-                    if len(st.session_state.staff_list) > 1:  # Only show remove button if there's more than one entry
-                        if st.button("Remove Entry", key=f"remove_staff_{i}"):
-                            remove_staff_entry(i)
-                            st.rerun()
-                    
-                    st.markdown("---")
-            
-            # Button to add more staff entries
-            if st.button("Add Another Staff Entry", key="add_staff"):
-                add_staff_entry()
-                st.rerun()
+            # One grid row per staff entry; add or remove rows from the grid
+            _table_editor("staff", {
+                "name": st.column_config.TextColumn("Staff Assigned"),
+                "service_date": st.column_config.DateColumn("Service Date", format="DD/MM/YYYY"),
+                "travel_time": st.column_config.TextColumn("Travel Time (hours)"),
+                "job_start": st.column_config.TimeColumn("Job Start", format="HH:mm"),
+                "job_end": st.column_config.TimeColumn("Job End", format="HH:mm"),
+                "job_status": st.column_config.SelectboxColumn("Job Status", options=STAFF_JOB_STATUSES),
+                "job_type": st.column_config.SelectboxColumn("Job Type", options=STAFF_JOB_TYPES),
+            })
             
             # Job status/customer comments
             st.subheader("Job Status / Customer Comments")
-            job_status_comments = st.text_area(
+            form["job_status_comments"] = st.text_area(
                 "Customer Feedback and Status Notes", 
-                value=existing_report.get('job_status_comments', '') if existing_report else '',
                 height=100,
-                key="job_status_comments"
+                key=_bind(form, "job_status_comments")
             )
         
-        with tab3:
+        elif section == "Inspection Checklist":
             st.subheader("Equipment Inspection Checklist")
             
-            # Inspection checklist items with status options
-            checklist_categories = {
-                "Electrical Systems": [
-                    "Power Supply Voltage",
-                    "Control Circuits",
-                    "Electronic Components",
-                    "Wiring Condition",
-                    "Emergency Stop Function"
-                ],
-                "Mechanical Systems": [
-                    "Safety Guards and Covers",
-                    "Lubrication of Moving Parts",
-                    "Wear and Tear of Components",
-                    "Belt/Chain Tension",
-                    "Hydraulic Systems"
-                ],
-                "General Condition": [
-                    "Hoses and Connections",
-                    "Leaks (Oil/Water/Gas)",
-                    "Operational Test Run",
-                    "Sound/Vibration Test",
-                    "Cleaning of Equipment"
-                ],
-                "Specialized Checks": [
-                    "Cooling System",
-                    "Heating Elements",
-                    "Pressure Test",
-                    "Calibration (if applicable)",
-                    "Software/Firmware Version"
-                ]
-            }
-            
-            # Initialize checklist status in session state if not already done
-            if "inspection_checklist" not in st.session_state:
-                if existing_report and "inspection_checklist" in existing_report:
-                    st.session_state.inspection_checklist = existing_report.get('inspection_checklist', {})
-                else:
-                    st.session_state.inspection_checklist = {}
-                    for category, items in checklist_categories.items():
-                        for item in items:
-                            st.session_state.inspection_checklist[item] = {
-                                "status": "Not Checked",
-                                "notes": ""
-                            }
-            
             # Display each category with its checklist items
-            for category, items in checklist_categories.items():
+            for category, items in CHECKLIST_CATEGORIES.items():
                 st.markdown(f"#### {category}")
                 
                 for item in items:
@@ -353,18 +452,15 @@ def render():
                         if item in st.session_state.inspection_checklist:
                             current_status = st.session_state.inspection_checklist[item].get("status", "Not Checked")
                         
-                        # Status options
-                        status_options = ["Not Checked", "Pass", "Fail", "N/A", "Repaired"]
-                        
                         # Get the index of the current status
                         status_index = 0
-                        if current_status in status_options:
-                            status_index = status_options.index(current_status)
+                        if current_status in CHECKLIST_STATUSES:
+                            status_index = CHECKLIST_STATUSES.index(current_status)
                         
                         # Display the status select box
                         selected_status = st.selectbox(
                             "Status",
-                            options=status_options,
+                            options=CHECKLIST_STATUSES,
                             index=status_index,
                             key=f"checklist_status_{item}"
                         )
@@ -393,286 +489,94 @@ def render():
                 st.markdown("---")
             
             # Comments or additional notes for the inspection
-            inspection_comments = st.text_area(
+            form["inspection_comments"] = st.text_area(
                 "Additional Comments or Findings", 
-                value=existing_report.get('inspection_comments', '') if existing_report else '',
                 height=100,
-                key="inspection_comments"
+                key=_bind(form, "inspection_comments")
             )
         
-        with tab4:
+        elif section == "Parts & Materials":
             st.subheader("Parts & Materials Used / Recommended")
             
-            # Initialize parts list if not in session state
-            if "parts_list" not in st.session_state:
-                if existing_report and "parts_list" in existing_report:
-                    st.session_state.parts_list = existing_report.get('parts_list', [])
-                else:
-                    st.session_state.parts_list = [{}]  # Start with one empty entry
-            
-            # Function to add a new part entry
-            def add_part_entry():
-                st.session_state.parts_list.append({})
-            
-            # Function to remove a part entry
-            def remove_part_entry(index):
-                if len(st.session_state.parts_list) > 1:  # Keep at least one entry
-                    st.session_state.parts_list.pop(index)
-            
-            # Display each part entry
-            for i, part_entry in enumerate(st.session_state.parts_list):
-                with st.container():
-                    st.markdown(f"**Part/Material Entry #{i+1}**")
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        part_entry['part_number'] = st.text_input(
-                            "Part Number", 
-                            value=part_entry.get('part_number', ''),
-                            key=f"part_number_{i}"
-                        )
-                        
-                        part_entry['description'] = st.text_input(
-                            "Item Description", 
-                            value=part_entry.get('description', ''),
-                            key=f"part_description_{i}"
-                        )
-                        
-                        part_entry['make'] = st.text_input(
-                            "Make", 
-                            value=part_entry.get('make', ''),
-                            key=f"part_make_{i}"
-                        )
-                        
-                        part_entry['status'] = st.selectbox(
-                            "Status",
-                            options=["Used", "Replaced", "Pending", "On Order", "Recommended"],
-                            index=["Used", "Replaced", "Pending", "On Order", "Recommended"].index(part_entry.get('status', 'Used')) 
-                                if part_entry.get('status', '') in ["Used", "Replaced", "Pending", "On Order", "Recommended"] 
-                                else 0,
-                            key=f"part_status_{i}"
-                        )
-                    
-                    with col2:
-                        part_entry['quantity'] = st.number_input(
-                            "Quantity", 
-                            min_value=0, 
-                            value=int(part_entry.get('quantity', 0)) if part_entry.get('quantity', 0) else 0,
-                            key=f"part_quantity_{i}"
-                        )
-                        
-                        part_entry['unit_price'] = st.number_input(
-                            "Unit Price", 
-                            min_value=0.0, 
-                            value=float(part_entry.get('unit_price', 0.0)) if part_entry.get('unit_price', 0) else 0.0,
-                            format="%.2f",
-                            key=f"part_unit_price_{i}"
-                        )
-                        
-                        part_entry['remark'] = st.text_input(
-                            "Remark", 
-                            value=part_entry.get('remark', ''),
-                            key=f"part_remark_{i}"
-                        )
-                    
-                    # Calculate total price for this part
-                    part_entry['total_price'] = part_entry['quantity'] * part_entry['unit_price']
-                    st.write(f"Total Price: ${part_entry['total_price']:.2f}")
-                    
-                    # Remove button for this entry
-                    if len(st.session_state.parts_list) > 1:  # Only show remove button if there's more than one entry
-                        if st.button("Remove Part", key=f"remove_part_{i}"):
-                            remove_part_entry(i)
-                            st.rerun()
-                    
-                    st.markdown("---")
-            
-            # Button to add more part entries
-            if st.button("Add Another Part", key="add_part"):
-                add_part_entry()
-                st.rerun()
+            parts = _table_editor("parts", {
+                "part_number": st.column_config.TextColumn("Part Number"),
+                "description": st.column_config.TextColumn("Item Description"),
+                "make": st.column_config.TextColumn("Make"),
+                "status": st.column_config.SelectboxColumn("Status", options=PART_STATUSES),
+                "quantity": st.column_config.NumberColumn("Quantity", min_value=0, step=1),
+                "unit_price": st.column_config.NumberColumn("Unit Price", min_value=0.0, format="%.2f"),
+                "remark": st.column_config.TextColumn("Remark"),
+            })
             
             # Calculate and display total cost
-            total_parts_cost = sum(part['total_price'] for part in st.session_state.parts_list)
-            st.subheader(f"Total Parts Cost: ${total_parts_cost:.2f}")
+            total_parts_minor, _, _ = table_totals(parts, current_table("labor"))
+            st.subheader(f"Total Parts Cost: {format_money(total_parts_minor)}")
         
-        with tab5:
+        elif section == "Labor & Costs":
             st.subheader("Labor & Additional Costs")
             
-            # Initialize labor costs if not in session state
-            if "labor_costs" not in st.session_state:
-                if existing_report and "labor_costs" in existing_report:
-                    st.session_state.labor_costs = existing_report.get('labor_costs', [])
-                else:
-                    st.session_state.labor_costs = [{}]  # Start with one empty entry
-            
-            # Function to add a new labor entry
-            def add_labor_entry():
-                st.session_state.labor_costs.append({})
-            
-            # Function to remove a labor entry
-            def remove_labor_entry(index):
-                if len(st.session_state.labor_costs) > 1:  # Keep at least one entry
-                    st.session_state.labor_costs.pop(index)
-            
-            # Display each labor entry
-            for i, labor_entry in enumerate(st.session_state.labor_costs):
-                with st.container():
-                    st.markdown(f"**Labor/Cost Entry #{i+1}**")
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        labor_entry['description'] = st.text_input(
-                            "Description", 
-                            value=labor_entry.get('description', ''),
-                            key=f"labor_description_{i}"
-                        )
-                        
-                        labor_entry['type'] = st.selectbox(
-                            "Type",
-                            options=["Standard Labor", "Overtime Labor", "Travel", "Accommodation", "Other"],
-                            index=["Standard Labor", "Overtime Labor", "Travel", "Accommodation", "Other"].index(labor_entry.get('type', 'Standard Labor')) 
-                                if labor_entry.get('type', '') in ["Standard Labor", "Overtime Labor", "Travel", "Accommodation", "Other"] 
-                                else 0,
-                            key=f"labor_type_{i}"
-                        )
-                    
-                    with col2:
-                        labor_entry['hours'] = st.number_input(
-                            "Hours/Quantity", 
-                            min_value=0.0, 
-                            value=float(labor_entry.get('hours', 0.0)) if labor_entry.get('hours', 0) else 0.0,
-                            format="%.2f",
-                            key=f"labor_hours_{i}"
-                        )
-                        
-                        labor_entry['rate'] = st.number_input(
-                            "Rate", 
-                            min_value=0.0, 
-                            value=float(labor_entry.get('rate', 0.0)) if labor_entry.get('rate', 0) else 0.0,
-                            format="%.2f",
-                            key=f"labor_rate_{i}"
-                        )
-                        
-                        labor_entry['notes'] = st.text_input(
-                            "Notes", 
-                            value=labor_entry.get('notes', ''),
-                            key=f"labor_notes_{i}"
-                        )
-                    
-                    # Calculate total cost for this labor entry
-                    labor_entry['total_cost'] = labor_entry['hours'] * labor_entry['rate']
-                    st.write(f"Total Cost: ${labor_entry['total_cost']:.2f}")
-                    
-                    # Remove button for this entry
-                    if len(st.session_state.labor_costs) > 1:  # Only show remove button if there's more than one entry
-                        if st.button("Remove Entry", key=f"remove_labor_{i}"):
-                            remove_labor_entry(i)
-                            st.rerun()
-                    
-                    st.markdown("---")
-            
-            # Button to add more labor entries
-            if st.button("Add Another Labor/Cost Entry", key="add_labor"):
-                add_labor_entry()
-                st.rerun()
-            
-            # Calculate and display total labor cost
-            total_labor_cost = sum(labor['total_cost'] for labor in st.session_state.labor_costs)
-            st.subheader(f"Total Labor & Additional Costs: ${total_labor_cost:.2f}")
+            labor = _table_editor("labor", {
+                "description": st.column_config.TextColumn("Description"),
+                "type": st.column_config.SelectboxColumn("Type", options=LABOR_TYPES),
+                "hours": st.column_config.NumberColumn("Hours/Quantity", min_value=0.0, format="%.2f"),
+                "rate": st.column_config.NumberColumn("Rate", min_value=0.0, format="%.2f"),
+                "notes": st.column_config.TextColumn("Notes"),
+            })
             
-            # Calculate grand total
-            grand_total = total_parts_cost + total_labor_cost
-            st.subheader(f"Grand Total: ${grand_total:.2f}")
+            # Calculate and display total labor cost and grand total
+            _, total_labor_minor, grand_total_minor = table_totals(current_table("parts"), labor)
+            st.subheader(f"Total Labor & Additional Costs: {format_money(total_labor_minor)}")
+            st.subheader(f"Grand Total: {format_money(grand_total_minor)}")
             
             # Additional cost notes
-            cost_notes = st.text_area(
-                "Additional Cost Notes", 
-                value=existing_report.get('cost_notes', '') if existing_report else '',
-                height=100,
-                key="cost_notes"
-            )
+            form["cost_notes"] = st.text_area("Additional Cost Notes", height=100, key=_bind(form, "cost_notes"))
         
-        with tab6:
+        elif section == "Signatures":
             st.subheader("Signatures and Approval")
             
             # Service completion status
-            service_status = st.selectbox(
+            form["service_status"] = st.selectbox(
                 "Service Completion Status",
-                options=["Completed Successfully", "Completed with Issues", "Partially Completed", "Not Completed", "Pending Follow-up"],
-                index=["Completed Successfully", "Completed with Issues", "Partially Completed", "Not Completed", "Pending Follow-up"].index(existing_report.get('service_status', 'Completed Successfully')) 
-                    if existing_report and existing_report.get('service_status', '') in ["Completed Successfully", "Completed with Issues", "Partially Completed", "Not Completed", "Pending Follow-up"] 
-                    else 0,
-                key="service_status"
+                options=SERVICE_STATUSES,
+                key=_bind(form, "service_status")
             )
             
             # Follow-up required?
-            follow_up_required = st.checkbox(
-                "Follow-up Required", 
-                value=existing_report.get('follow_up_required', False) if existing_report else False,
-                key="follow_up_required"
-            )
+            form["follow_up_required"] = st.checkbox("Follow-up Required", key=_bind(form, "follow_up_required"))
             
             # Follow-up details
-            if follow_up_required:
-                follow_up_details = st.text_area(
-                    "Follow-up Details", 
-                    value=existing_report.get('follow_up_details', '') if existing_report else '',
-                    height=100,
-                    key="follow_up_details"
-                )
+            if form["follow_up_required"]:
+                form["follow_up_details"] = st.text_area("Follow-up Details", height=100, key=_bind(form, "follow_up_details"))
                 
-                follow_up_date = st.date_input(
-                    "Follow-up Date", 
-                    value=existing_report.get('follow_up_date', datetime.datetime.now() + datetime.timedelta(days=7)) if existing_report else (datetime.datetime.now() + datetime.timedelta(days=7)),
-                    key="follow_up_date"
-                )
+                form["follow_up_date"] = st.date_input("Follow-up Date", key=_bind(form, "follow_up_date"))
             
             st.markdown("---")
             
             # Service advisor information
-            service_advisor = st.text_input(
-                "Service Advisor", 
-                value=existing_report.get('service_advisor', '') if existing_report else '',
-                key="service_advisor"
-            )
+            form["service_advisor"] = st.text_input("Service Advisor", key=_bind(form, "service_advisor"))
             
-            service_advisor_date = st.date_input(
-                "Service Advisor Date", 
-                value=existing_report.get('service_advisor_date', datetime.datetime.now()) if existing_report else datetime.datetime.now(),
-                key="service_advisor_date"
-            )
+            form["service_advisor_date"] = st.date_input("Service Advisor Date", key=_bind(form, "service_advisor_date"))
             
             # For signature, we could use text input as a placeholder
             # In a real app, you might want to implement a signature pad
             st.write("Service Advisor Signature")
-            service_advisor_signature = st.text_input(
+            form["service_advisor_signature"] = st.text_input(
                 "Type name to acknowledge", 
-                value=existing_report.get('service_advisor_signature', '') if existing_report else '',
-                key="service_advisor_signature",
+                key=_bind(form, "service_advisor_signature"),
                 help="In a production environment, this would be replaced with a proper signature pad."
             )
             
             # Customer representative information
             st.markdown("---")
-            customer_rep = st.text_input(
-                "Customer Representative", 
-                value=existing_report.get('customer_rep', '') if existing_report else '',
-                key="customer_rep"
-            )
+            form["customer_rep"] = st.text_input("Customer Representative", key=_bind(form, "customer_rep"))
             
-            customer_rep_date = st.date_input(
-                "Customer Representative Date", 
-                value=existing_report.get('customer_rep_date', datetime.datetime.now()) if existing_report else datetime.datetime.now(),
-                key="customer_rep_date"
-            )
+            form["customer_rep_date"] = st.date_input("Customer Representative Date", key=_bind(form, "customer_rep_date"))
             
             # For signature, we could use text input as a placeholder
             st.write("Customer Representative Signature")
-            customer_rep_signature = st.text_input(
+            form["customer_rep_signature"] = st.text_input(
                 "Type name to acknowledge", 
-                value=existing_report.get('customer_rep_signature', '') if existing_report else '',
-                key="customer_rep_signature",
+                key=_bind(form, "customer_rep_signature"),
                 help="In a production environment, this would be replaced with a proper signature pad."
             )
             
@@ -680,127 +584,74 @@ def render():
             st.markdown("---")
             st.subheader("Customer Satisfaction")
             
-            satisfaction_level = st.slider(
+            form["satisfaction_level"] = st.slider(
                 "Customer Satisfaction Level", 
                 min_value=1, 
                 max_value=5, 
-                value=existing_report.get('satisfaction_level', 5) if existing_report else 5,
-                key="satisfaction_level",
+                key=_bind(form, "satisfaction_level"),
                 help="1: Very Dissatisfied, 5: Very Satisfied"
             )
             
             # Display satisfaction level as stars
-            satisfaction_stars = "⭐" * satisfaction_level
+            satisfaction_stars = "⭐" * form["satisfaction_level"]
             st.write(f"Rating: {satisfaction_stars}")
             
             # Customer feedback
-            customer_feedback = st.text_area(
-                "Customer Feedback", 
-                value=existing_report.get('customer_feedback', '') if existing_report else '',
-                height=100,
-                key="customer_feedback"
-            )
+            form["customer_feedback"] = st.text_area("Customer Feedback", height=100, key=_bind(form, "customer_feedback"))
         
         # Function to save the service report
-        def save_service_report():
-            # Convert date objects to datetime for MongoDB
-            service_datetime = datetime.datetime.combine(service_date, datetime.time())
-            service_advisor_datetime = datetime.datetime.combine(service_advisor_date, datetime.time())
-            customer_rep_datetime = datetime.datetime.combine(customer_rep_date, datetime.time())
-            
-            # Follow-up date if it exists
-            follow_up_datetime = None
-            if follow_up_required:
-                follow_up_datetime = datetime.datetime.combine(follow_up_date, datetime.time())
-            
-            # Prepare the report data
-            report_data = {
-                "customer_id": st.session_state.customer_id,
-                "mrn_code": st.session_state.mrn_code,
-                "service_date": service_datetime,
-                "customer_name": customer_name,
-                "contact_number": contact_number,
-                "email_id": email_id,
-                "type_of_machine": type_of_machine,
-                "jc_no": jc_no,
-                "service_type_ws": ws_selected,
-                "service_type_gs": gs_selected,
-                "other_service_types": other_service_types,
-                "make_model": make_model,
-                "serial_number": serial_number,
-                "running_hours": running_hours,
-                
-                # Job details tab
-                "reported_fault": reported_fault,
-                "problem_diagnosis": problem_diagnosis,
-                "job_carried_out": job_carried_out,
-                "technical_difficulties": technical_difficulties,
-                "recommendations": recommendations,
-                "staff_assigned": st.session_state.staff_list,
-                "job_status_comments": job_status_comments,
-                
-                # Inspection checklist tab
-                "inspection_checklist": st.session_state.inspection_checklist,
-                "inspection_comments": inspection_comments,
-                
-                # Parts & Materials tab
-                "parts_list": st.session_state.parts_list,
-                "total_parts_cost": total_parts_cost,
-                
-                # Labor & Costs tab
-                "labor_costs": st.session_state.labor_costs,
-                "total_labor_cost": total_labor_cost,
-                "grand_total": grand_total,
-                "cost_notes": cost_notes,
-                
-                # Signatures tab
-                "service_status": service_status,
-                "follow_up_required": follow_up_required,
-                "follow_up_details": follow_up_details if follow_up_required else "",
-                "follow_up_date": follow_up_datetime,
-                "service_advisor": service_advisor,
-                "service_advisor_date": service_advisor_datetime,
-                "service_advisor_signature": service_advisor_signature,
-                "customer_rep": customer_rep,
-                "customer_rep_date": customer_rep_datetime,
-                "customer_rep_signature": customer_rep_signature,
-                "satisfaction_level": satisfaction_level,
-                "customer_feedback": customer_feedback,
-                
-                "updated_at": datetime.datetime.now()
-            }
-            
-            if existing_report:
-                # Update existing report
-                service_reports.update_one(
-                    {"_id": existing_report["_id"]},
-                    {"$set": report_data}
-                )
-                st.toast("Service report updated", icon="✅")
-                
-                # Ensure we have the sr_code in session state
-                st.session_state.sr_code = existing_report.get("sr_code")
+        def save_service_report(wait=True):
+            """Journal the report write; with `wait`, give it a moment to reach the database."""
+            customer_id = st.session_state.customer_id
+            
+            # List entries and totals come from the tables, whichever section is showing
+            rows = {field: frame_to_rows(kind, current_table(kind)) for kind, (field, _) in TABLES.items()}
+            values = dict(form)
+            values["total_parts_minor"], values["total_labor_minor"], values["grand_total_minor"] = table_totals(
+                current_table("parts"), current_table("labor"))
+            
+            report_data = build_report_data(
+                customer_id,
+                st.session_state.mrn_code,
+                values,
+                rows["staff_assigned"],
+                st.session_state.inspection_checklist,
+                rows["parts_list"],
+                rows["labor_costs"],
+            )
+            
+            target_id = existing_report["_id"] if existing_report else pending_reports.get(customer_id)
+            if target_id:
+                # Update the report, sending only the list rows that changed since the last save
+                set_fields = {k: v for k, v in report_data.items() if k not in rows}
+                push_fields = {}
+                for field, current_rows in rows.items():
+                    array_set, array_push = array_update(field, st.session_state.sr_saved_rows[field], current_rows)
+                    set_fields.update(array_set)
+                    push_fields.update(array_push)
+                payload = {"customer_id": customer_id, "report_id": target_id, "new": False,
+                           "report": report_data, "set": set_fields, "push": push_fields}
             else:
-                # Generate SR code
-                sr_code = generate_sequential_code("SR")
-                report_data["sr_code"] = sr_code
+                # The id is chosen here, so later saves can update the report before it is written
+                target_id = pending_reports[customer_id] = ObjectId()
+                # Same report, so the form model stays
+                st.session_state.sr_form_version = (customer_id, target_id)
                 report_data["created_at"] = datetime.datetime.now()
-                report_data["code"] = sr_code  # For sequential code generation
-                
-                # Insert new report
-                service_reports.insert_one(report_data)
-                
-                # Update customer status
-                customers.update_one(
-                    {"_id": ObjectId(st.session_state.customer_id)},
-                    {"$set": {
-                        "status.service_report_created": True,
-                        "sr_code": sr_code
-                    }}
-                )
-                
-                st.session_state.sr_code = sr_code
-                st.toast("Service report created", icon="✅")
+                payload = {"customer_id": customer_id, "report_id": target_id, "new": True, "report": report_data}
+            seq = writeback.submit(writeback.SERVICE_REPORT, payload)
+            st.session_state.sr_saved_rows = rows
+            # Autosave compares later reruns with what was just saved
+            st.session_state.setdefault("autosave_snapshots", {})[f"service_report/{customer_id}"] = form_snapshot(form)
+            if not wait:
+                return
+            
+            if writeback.flush(seq, timeout=SAVE_WAIT_SECONDS):
+                saved = service_reports.find_one({"_id": target_id}, {"sr_code": 1})
+                st.session_state.sr_code = saved.get("sr_code") if saved else None
+                st.toast("Service report saved", icon="✅")
+            else:
+                st.toast("Service report saved on this server; it will be written to the database "
+                         "as soon as it is reachable", icon="💾")
         
         # Manual save button (more prominent)
         st.markdown("<br>", unsafe_allow_html=True)
@@ -809,23 +660,8 @@ def render():
             if st.button("💾 Save Service Report", key="manual_save", use_container_width=True):
                 save_service_report()
         
-        # Set up input change detection for autosave
-        # List of keys to monitor for changes
-        input_keys = [
-            "service_date", "customer_name", "contact_number", "email_id", 
-            "type_of_machine", "jc_no", "service_type_ws", "service_type_gs",
-            "make_model", "serial_number", "running_hours", "reported_fault",
-            "problem_diagnosis", "job_carried_out", "technical_difficulties", 
-            "recommendations", "job_status_comments", "inspection_comments",
-            "cost_notes", "service_status", "follow_up_required", "follow_up_details",
-            "service_advisor", "service_advisor_signature", "customer_rep", 
-            "customer_rep_signature", "satisfaction_level", "customer_feedback"
-        ]
-        
-        # Check if any of these keys are in the session state and have changed
-        for key in input_keys:
-            if key in st.session_state:
-                reset_autosave_timer(save_service_report)
+        # Autosave: journal the report whenever an edit changed the form
+        autosave(f"service_report/{st.session_state.customer_id}", form_snapshot(form), save_service_report, wait=False)
         
         # Navigation buttons
         st.markdown("<br>", unsafe_allow_html=True)
@@ -842,3 +678,99 @@ def render():
         st.error("MRN not generated. Please complete the previous steps.")
         if st.button("Back to MRN Creation"):
             navigate_to_page("mrn_creation")
+
+def build_report_data(customer_id, mrn_code, values, staff_list, inspection_checklist, parts_list, labor_costs):
+    """Build the service report document saved to MongoDB.
+    
+    Args:
+        customer_id: ID of the customer the report belongs to
+        mrn_code: MRN code of the machine being serviced
+        values: Form values keyed by report field (dates as datetime.date,
+            report totals as *_minor integer cents)
+        staff_list: Staff entries from the Job Details tab
+        inspection_checklist: Checklist dict from the Inspection Checklist tab
+        parts_list: Part entries from the Parts & Materials tab
+        labor_costs: Labor entries from the Labor & Costs tab
+        
+    Returns:
+        Dict of report fields
+    """
+    # Convert date objects to datetime for MongoDB
+    service_datetime = datetime.datetime.combine(values["service_date"], datetime.time())
+    service_advisor_datetime = datetime.datetime.combine(values["service_advisor_date"], datetime.time())
+    customer_rep_datetime = datetime.datetime.combine(values["customer_rep_date"], datetime.time())
+    
+    # Follow-up date if it exists
+    follow_up_datetime = None
+    if values["follow_up_required"]:
+        follow_up_datetime = datetime.datetime.combine(values["follow_up_date"], datetime.time())
+    
+    # Store staff dates and times as strings (BSON cannot encode date/time objects)
+    staff_assigned = []
+    for staff_entry in staff_list:
+        staff_entry = dict(staff_entry)
+        if isinstance(staff_entry.get('service_date'), datetime.date):
+            staff_entry['service_date'] = staff_entry['service_date'].strftime('%Y-%m-%d')
+        for field in ('job_start', 'job_end'):
+            if isinstance(staff_entry.get(field), datetime.time):
+                staff_entry[field] = staff_entry[field].strftime('%H:%M')
+        staff_assigned.append(staff_entry)
+    
+    return {
+        "customer_id": customer_id,
+        "mrn_code": mrn_code,
+        "service_date": service_datetime,
+        "customer_name": values["customer_name"],
+        "contact_number": values["contact_number"],
+        "email_id": values["email_id"],
+        "type_of_machine": values["type_of_machine"],
+        "jc_no": values["jc_no"],
+        "service_type_ws": values["service_type_ws"],
+        "service_type_gs": values["service_type_gs"],
+        "other_service_types": values["other_service_types"],
+        "make_model": values["make_model"],
+        "serial_number": values["serial_number"],
+        "running_hours": values["running_hours"],
+        
+        # Job details tab
+        "reported_fault": values["reported_fault"],
+        "problem_diagnosis": values["problem_diagnosis"],
+        "job_carried_out": values["job_carried_out"],
+        "technical_difficulties": values["technical_difficulties"],
+        "recommendations": values["recommendations"],
+        "staff_assigned": staff_assigned,
+        "job_status_comments": values["job_status_comments"],
+        
+        # Inspection checklist tab
+        "inspection_checklist": inspection_checklist,
+        "inspection_comments": values["inspection_comments"],
+        
+        # Parts & Materials tab
+        "parts_list": parts_list,
+        "total_parts_minor": values["total_parts_minor"],
+        "total_parts_cost": from_minor(values["total_parts_minor"]),
+        
+        # Labor & Costs tab
+        "labor_costs": labor_costs,
+        "total_labor_minor": values["total_labor_minor"],
+        "total_labor_cost": from_minor(values["total_labor_minor"]),
+        "grand_total_minor": values["grand_total_minor"],
+        "grand_total": from_minor(values["grand_total_minor"]),
+        "cost_notes": values["cost_notes"],
+        
+        # Signatures tab
+        "service_status": values["service_status"],
+        "follow_up_required": values["follow_up_required"],
+        "follow_up_details": values["follow_up_details"] if values["follow_up_required"] else "",
+        "follow_up_date": follow_up_datetime,
+        "service_advisor": values["service_advisor"],
+        "service_advisor_date": service_advisor_datetime,
+        "service_advisor_signature": values["service_advisor_signature"],
+        "customer_rep": values["customer_rep"],
+        "customer_rep_date": customer_rep_datetime,
+        "customer_rep_signature": values["customer_rep_signature"],
+        "satisfaction_level": values["satisfaction_level"],
+        "customer_feedback": values["customer_feedback"],
+        
+        "updated_at": datetime.datetime.now()
+    }
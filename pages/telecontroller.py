@@ -1,8 +1,8 @@
 import streamlit as st
-import datetime
 from bson.objectid import ObjectId
 from utils.helpers import navigate_to_page, create_workflow_steps_indicator
 from database.connection import customers
+from database import workflow
 
 def render():
     # Display workflow steps indicator
@@ -41,21 +41,13 @@ def render():
                 uploaded_file = st.file_uploader("Upload telecontroller PDF", type="pdf")
                 
                 if uploaded_file is not None:
-                    # Save file information
-                    file_info = {
-                        "filename": uploaded_file.name,
-                        "content_type": "application/pdf",
-                        "upload_date": datetime.datetime.now()
-                    }
+                    existing_info = customer.get("telecontroller_file_info") or {}
                     
-                    # Update customer status and file info
-                    customers.update_one(
-                        {"_id": ObjectId(st.session_state.customer_id)},
-                        {"$set": {
-                            "status.telecontroller_done": True,
-                            "telecontroller_file_info": file_info
-                        }}
-                    )
+                    # The uploader keeps its file across reruns, so only store it once
+                    if existing_info.get("filename") != uploaded_file.name or existing_info.get("size") != uploaded_file.size:
+                        # Store the PDF itself in GridFS and complete the step
+                        workflow.attach_telecontroller(st.session_state.customer_id, uploaded_file.name,
+                                                       uploaded_file.getvalue())
                     
                     st.success("Telecontroller PDF uploaded successfully")
                     telecontroller_done = True
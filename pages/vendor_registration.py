@@ -2,6 +2,7 @@ import streamlit as st
 from bson.objectid import ObjectId
 from utils.helpers import navigate_to_page, create_workflow_steps_indicator
 from database.connection import customers
+from database import workflow
 
 def render():
     # Display workflow steps indicator
@@ -32,10 +33,7 @@ def render():
             
             # Save function for vendor registration
             def save_vendor_status(status):
-                customers.update_one(
-                    {"_id": ObjectId(st.session_state.customer_id)},
-                    {"$set": {"status.vendor_registered": status}}
-                )
+                workflow.set_vendor_registered(st.session_state.customer_id, status)
                 st.toast("Vendor status updated", icon="✅")
             
             # Check if checkbox was changed
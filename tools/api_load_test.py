@@ -0,0 +1,283 @@
+"""Load test of the HTTP JSON API (api/server.py).
+
+Client processes each keep `--concurrency` requests in flight for
+`--seconds`, in the mix a fleet of tablets produces: mostly polling the
+customer list (re-sending the ETag they got, so unchanged pages are 304s),
+opening customers and the dashboard, and a share of writes (create a
+customer, then register its vendor). Prints requests per second and
+latency percentiles per request kind as JSON.
+
+Without --url an embedded server is started on a free port: --server-processes
+API processes on the embedded backend, each seeded with the same
+--customers customers (writes stay in the process that took them).
+
+Usage:
+    python -m tools.api_load_test [--url http://localhost:8600] [--token TOKEN]
+                                  [--seconds 10] [--clients 2] [--concurrency 32] [--write-share 0.05]
+                                  [--server-processes 2] [--customers 2000] [--min-rps 1000]
+"""
+import argparse
+import asyncio
+import datetime
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+from tools.load_test import summarize
+
+# Share of read requests by kind
+READ_MIX = (("list", 0.6), ("customer", 0.25), ("dashboard", 0.15))
+
+# Customers per list page the clients poll
+PAGE_SIZE = 50
+
+
+def _embedded_server(connection, customers, journal_dir, port, seed):
+    """One API process on the embedded backend (in a spawned process)."""
+    os.environ.update(MONGO_CONNECTION_STRING="mongomock://", JOURNAL_DIR=journal_dir,
+                      METRICS_PORT="0", QUERY_STATS_PATH="")
+    from database.connection import db
+    from tools.seed_data import seed_database
+
+    seed_database(db, customers, seed=seed, workers=1)
+    from api import server
+    server.start(port, "127.0.0.1", ready=connection.send, reuse_port=True)
+
+
+def start_embedded(processes, customers, seed=42):
+    """Start `processes` embedded API processes on one port.
+
+    Returns:
+        (base URL, list of processes to terminate)
+    """
+    context = multiprocessing.get_context("spawn")
+    journal_dir = tempfile.mkdtemp(prefix="api-load-journal-")
+    started, port = [], 0
+    for _ in range(processes):
+        parent, child = context.Pipe()
+        process = context.Process(target=_embedded_server, daemon=True,
+                                  args=(child, customers, journal_dir, port, seed))
+        process.start()
+        started.append(process)
+        if not parent.poll(600):
+            raise RuntimeError("embedded API server did not start")
+        # The first process picks a free port and the others share it
+        port = parent.recv()
+    return f"http://127.0.0.1:{port}", started
+
+
+def _get_json(url, token):
+    request = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"} if token else {})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def discover(base, token, max_pages=200):
+    """Customer ids and list page cursors, by walking the list once."""
+    ids, cursors, after = [], [""], ""
+    for _ in range(max_pages):
+        page = _get_json(f"{base}/api/customers?limit={PAGE_SIZE}&after={after}", token)
+        ids.extend(item["_id"] for item in page["items"])
+        if not page["next"]:
+            break
+        after = page["next"]
+        cursors.append(after)
+    return ids, cursors
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection, as a tablet's HTTP client keeps.
+
+    A client opening a connection per request would mostly measure TCP
+    set-up and teardown.
+    """
+
+    def __init__(self, base):
+        parts = urllib.parse.urlsplit(base)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.reader = self.writer = None
+
+    async def fetch(self, method, path, headers, body=b""):
+        """Send one request; returns (status, lower-cased headers, decoded body)."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", "Accept-Encoding: gzip",
+                 f"Content-Length: {len(body)}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            status_line = await self.reader.readline()
+            if not status_line:
+                raise ConnectionError("connection closed by the server")
+            status = int(status_line.split()[1])
+            response_headers = {}
+            while True:
+                line = await self.reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+            length = int(response_headers.get("content-length", "0"))
+            data = await self.reader.readexactly(length) if length else b""
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            self.close()
+            raise
+        if response_headers.get("content-encoding") == "gzip":
+            data = gzip.decompress(data)
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, response_headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def _client(base, token, seconds, concurrency, write_share, seed, ids, cursors):
+    rng = random.Random(seed)
+    latencies, statuses, errors = {}, {}, []
+    etags = {}
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    deadline = time.perf_counter() + seconds
+
+    async def request(connection, kind, path, method="GET", body=None):
+        request_headers = dict(headers)
+        if method == "GET" and path in etags:
+            request_headers["If-None-Match"] = etags[path]
+        if body is not None:
+            request_headers["Content-Type"] = "application/json"
+            body = json.dumps(body).encode()
+        started = time.perf_counter()
+        try:
+            status, response_headers, data = await connection.fetch(method, path, request_headers, body or b"")
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as error:
+            statuses["error"] = statuses.get("error", 0) + 1
+            errors.append(f"{method} {path}: {error!r}")
+            return None, None
+        latencies.setdefault(kind, []).append(time.perf_counter() - started)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if status >= 500:
+            errors.append(f"{method} {path}: {status} {data[:200]!r}")
+        elif method == "GET" and "etag" in response_headers:
+            etags[path] = response_headers["etag"]
+        return status, data
+
+    async def worker():
+        connection = Connection(base)
+        while time.perf_counter() < deadline:
+            if rng.random() < write_share:
+                n = rng.randrange(10 ** 6)
+                status, data = await request(connection, "create_customer", "/api/customers", "POST", {
+                    "name": f"Load Test {n}", "contact_name": "Field Tablet",
+                    "contact_phone": f"555{n:07d}", "machine_count": 1})
+                if status in (201, 202):
+                    customer_id = json.loads(data)["id"]
+                    await request(connection, "vendor_registration",
+                                  f"/api/customers/{customer_id}/vendor-registration", "POST", {"done": True})
+                continue
+            roll, kind = rng.random(), READ_MIX[-1][0]
+            for name, share in READ_MIX:
+                if roll < share:
+                    kind = name
+                    break
+                roll -= share
+            if kind == "list":
+                await request(connection, kind, f"/api/customers?limit={PAGE_SIZE}&after={rng.choice(cursors)}")
+            elif kind == "customer" and ids:
+                await request(connection, kind, f"/api/customers/{rng.choice(ids)}")
+            else:
+                await request(connection, "dashboard", "/api/dashboard")
+        connection.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"latencies": latencies, "statuses": statuses, "errors": errors}
+
+
+def run_client(base, token, seconds, concurrency, write_share, seed, ids, cursors):
+    """One client process's requests; latencies by kind, status counts and errors."""
+    return asyncio.run(_client(base, token, seconds, concurrency, write_share, seed, ids, cursors))
+
+
+def run_api_load_test(base, token=None, seconds=10.0, clients=2, concurrency=32, write_share=0.05, seed=0):
+    """Run the load test against a running API and return the report dict."""
+    ids, cursors = discover(base, token)
+    started = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=clients, mp_context=context) as pool:
+        futures = [pool.submit(run_client, base, token, seconds, concurrency, write_share, seed * 7919 + index,
+                               ids, cursors)
+                   for index in range(clients)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    latencies, statuses, errors = {}, {}, []
+    for result in results:
+        for kind, values in result["latencies"].items():
+            latencies.setdefault(kind, []).extend(values)
+        for status, count in result["statuses"].items():
+            statuses[status] = statuses.get(status, 0) + count
+        errors.extend(result["errors"])
+    total = sum(statuses.values())
+
+    return {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {"url": base, "seconds": seconds, "clients": clients, "concurrency": concurrency,
+                   "write_share": write_share, "customers_seen": len(ids)},
+        # Includes client process start-up, so slightly below the rate while running
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "requests_per_s": round(total / seconds, 1) if seconds else 0.0,
+        "not_modified_share": round(statuses.get("304", 0) / total, 3) if total else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+        "latency": summarize([value for values in latencies.values() for value in values]),
+        "kinds": {kind: summarize(values) for kind, values in sorted(latencies.items())},
+        "errors": errors[:20],
+        "error_count": len(errors),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP JSON API load test")
+    parser.add_argument("--url", default=None, help="Base URL of a running API (default: start an embedded one)")
+    parser.add_argument("--token", default=os.environ.get("API_TOKEN", ""), help="API token (default: $API_TOKEN)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of the run")
+    parser.add_argument("--clients", type=int, default=2, help="Client processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight per client process")
+    parser.add_argument("--write-share", type=float, default=0.05, help="Share of requests that write")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server-processes", type=int, default=2, help="Embedded API processes")
+    parser.add_argument("--customers", type=int, default=2000, help="Customers seeded into the embedded API")
+    parser.add_argument("--min-rps", type=float, default=0.0, help="Fail below this many requests per second")
+    args = parser.parse_args(argv)
+
+    servers = []
+    base = args.url.rstrip("/") if args.url else None
+    try:
+        if base is None:
+            base, servers = start_embedded(args.server_processes, args.customers)
+        report = run_api_load_test(base, args.token, args.seconds, args.clients, args.concurrency,
+                                   args.write_share, args.seed)
+    finally:
+        for process in servers:
+            process.terminate()
+            process.join(timeout=10)
+    print(json.dumps(report, indent=2))
+    if report["error_count"]:
+        return 1
+    if report["requests_per_s"] < args.min_rps:
+        print(f"FAILED: {report['requests_per_s']} requests/s is below {args.min_rps}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
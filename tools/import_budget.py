@@ -0,0 +1,150 @@
+"""Import-time report for app startup, checked against a budget.
+
+Each module in the budget is imported in a fresh interpreter with
+`-X importtime`, after the baseline module (streamlit, which every page
+needs anyway). The report shows the time each module adds on top of the
+baseline, its most expensive imports, and any forbidden heavy dependency
+(pandas, pymongo, ...) it pulls in. A cold first paint of one page is also
+timed with AppTest.
+
+Usage:
+    python -m tools.import_budget [--budget tools/import_budget.json] [--repeat 3] [--top 8]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_budget.json")
+
+FIRST_PAINT_SCRIPT = """
+import sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.session_state["page"] = sys.argv[2]
+ready = time.perf_counter()
+at.run()
+if at.exception:
+    raise SystemExit(at.exception[0].value)
+print(round((time.perf_counter() - ready) * 1000, 1))
+"""
+
+
+def _environment():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("METRICS_PORT", "0")
+    env.setdefault("QUERY_STATS_PATH", "")
+    return env
+
+
+def parse_importtime(stderr, after):
+    """Parse `-X importtime` output, keeping only imports that finished after `after`.
+
+    Returns:
+        (total_us, entries) where entries are (name, self_us, cumulative_us, depth)
+    """
+    entries = []
+    seen_baseline = False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # One space after the bar, then two per nesting level
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        name = name.strip()
+        if not seen_baseline:
+            seen_baseline = depth == 0 and name == after
+            continue
+        entries.append((name, int(self_us), int(cumulative_us), depth))
+    total_us = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+    return total_us, entries
+
+
+def measure_import(module, baseline, repeat):
+    """Import time of `module` on top of `baseline`, best of `repeat` fresh interpreters."""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {baseline}; import {module}"],
+                                cwd=ROOT, env=_environment(), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+        total_us, entries = parse_importtime(result.stderr, baseline)
+        if best is None or total_us < best[0]:
+            best = (total_us, entries)
+    return best
+
+
+def measure_first_paint(page):
+    """Cold process start to the first completed script run of `page`, in ms."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", FIRST_PAINT_SCRIPT, os.path.join(ROOT, "streamlit_app.py"), page],
+                            cwd=ROOT, env=_environment(), capture_output=True, text=True)
+    cold_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"first paint of {page} failed:\n{result.stderr[-2000:]}")
+    run_ms = float(result.stdout.strip().splitlines()[-1])
+    return cold_ms, run_ms
+
+
+def check(budget, repeat, top):
+    """Print the report; returns a list of budget violations."""
+    violations = []
+    baseline = budget.get("baseline", "streamlit")
+
+    print(f"Import time on top of '{baseline}' (best of {repeat})\n")
+    for module, limits in budget["modules"].items():
+        total_us, entries = measure_import(module, baseline, repeat)
+        total_ms = total_us / 1000
+        max_ms = limits.get("max_ms")
+        status = "OK" if max_ms is None or total_ms <= max_ms else "OVER"
+        print(f"{module:<28} {total_ms:>8.1f} ms  (budget {max_ms} ms)  {status}")
+        if status == "OVER":
+            violations.append(f"{module} imports in {total_ms:.1f} ms, budget {max_ms} ms")
+
+        names = {name for name, _, _, _ in entries}
+        for forbidden in limits.get("forbidden", []):
+            if forbidden in names:
+                violations.append(f"{module} imports {forbidden} at module level")
+                print(f"    forbidden import: {forbidden}")
+
+        for name, self_us, cumulative_us, depth in sorted(entries, key=lambda e: e[1], reverse=True)[:top]:
+            print(f"    {self_us / 1000:>7.1f} ms self  {cumulative_us / 1000:>7.1f} ms cumulative  {name}")
+
+    first_paint = budget.get("first_paint")
+    if first_paint:
+        cold_ms, run_ms = measure_first_paint(first_paint["page"])
+        print(f"\nFirst paint of '{first_paint['page']}': {run_ms:.0f} ms script run, "
+              f"{cold_ms:.0f} ms from process start")
+        if run_ms > first_paint["max_run_ms"]:
+            violations.append(f"first paint run {run_ms:.0f} ms, budget {first_paint['max_run_ms']} ms")
+        if cold_ms > first_paint["max_cold_ms"]:
+            violations.append(f"cold start {cold_ms:.0f} ms, budget {first_paint['max_cold_ms']} ms")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time report checked against a budget")
+    parser.add_argument("--budget", default=BUDGET_PATH)
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module (best is kept)")
+    parser.add_argument("--top", type=int, default=8, help="Most expensive imports shown per module")
+    args = parser.parse_args(argv)
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+
+    violations = check(budget, args.repeat, args.top)
+    if violations:
+        print("\nFAIL")
+        for violation in violations:
+            print(f"  {violation}")
+        return 1
+    print("\nOK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
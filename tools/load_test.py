@@ -0,0 +1,307 @@
+"""Concurrent-session load test built on Streamlit's AppTest.
+
+Each simulated technician drives streamlit_app.py through a realistic journey:
+new visit -> CRM entry -> vendor registration -> MRN creation -> service
+report (with autosave) -> telecontroller, or browses the dashboard. Sessions
+run concurrently, one worker process each, against a local MongoDB or the
+embedded mongomock backend (which is private to each worker).
+
+Usage:
+    python -m tools.load_test --sessions 8 --journeys 5 [--mongo-uri mongomock://]
+                              [--save-baseline load_baseline.json] [--compare load_baseline.json]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+# Share of journeys that only browse the dashboard
+DASHBOARD_SHARE = 0.3
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies):
+    """p50/p95/p99 summary of a list of latencies in seconds, reported in ms."""
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+class Session:
+    """One simulated technician driving an AppTest instance."""
+
+    def __init__(self, index, timeout, recorder):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.recorder = recorder
+        self.rng = random.Random()
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def run(self, step):
+        """Rerun the script and record the latency under `step`."""
+        started = time.perf_counter()
+        self.at.run()
+        self.recorder.record(step, time.perf_counter() - started)
+        if self.at.exception:
+            raise RuntimeError(f"{step}: {self.at.exception[0].value}")
+
+    def goto(self, page, step):
+        """Navigate the way the page buttons do (set the page and rerun)."""
+        self.at.session_state["page"] = page
+        self.run(step)
+
+    def widget(self, kind, key):
+        return getattr(self.at, kind)(key=key)
+
+    def workflow_journey(self):
+        """Create a visit and take it through every workflow step."""
+        n = self.rng.randint(1, 10 ** 6)
+        self.goto("home", "home")
+
+        # Start a new visit the way the "New Service Visit" buttons do. Their
+        # st.rerun() leaves AppTest with a stale element tree, so the state
+        # change is applied directly instead of clicking.
+        for key in ("customer_id", "mrn_code", "sr_code"):
+            self.at.session_state[key] = None
+        self.goto("crm_entry", "new_visit")
+
+        # CRM entry
+        self.widget("text_input", "company_name").input(f"Load Test Co {self.index}-{n}")
+        self.widget("text_input", "contact_name").input("Load Tester")
+        self.widget("text_input", "contact_phone").input(f"+1 555 {n:07d}")
+        self.widget("number_input", "machine_count").set_value(self.rng.randint(1, 5))
+        self.run("crm_entry_input")
+        self.widget("button", "save_customer_info").click()
+        self.run("crm_entry_save")
+
+        # Vendor registration
+        self.goto("vendor_registration", "vendor_registration")
+        self.widget("checkbox", "vendor_registered").check()
+        self.run("vendor_registration_check")
+
+        # MRN creation
+        self.goto("mrn_creation", "mrn_creation")
+        self.widget("text_input", "mrn_received_by").input("Load Tester")
+        self.widget("text_input", "mrn_model").input(f"MIG-{self.rng.choice([200, 250, 350, 500])}")
+        self.widget("text_input", "mrn_machine_type").input("Welding Machine")
+        self.widget("text_input", "mrn_serial_no").input(f"SN{n:08d}")
+        self.widget("text_area", "mrn_problem_reported").input("No arc start, fan noisy")
+        self.run("mrn_creation_input")
+        self.widget("button", "generate_mrn").click()
+        self.run("mrn_generate")
+
+        # Service report, typing and saving (the typing reruns are also autosaved)
+        self.goto("service_report", "service_report")
+        self.widget("radio", "sr_section").set_value("Job Details")
+        self.run("service_report_section")
+        self.widget("text_area", "problem_diagnosis").input("Worn contactor, clogged fan")
+        self.run("service_report_input")
+        self.widget("text_area", "job_carried_out").input("Replaced contactor, cleaned fan and vents")
+        self.run("service_report_input")
+        self.widget("button", "manual_save").click()
+        self.run("service_report_save")
+
+        # Telecontroller
+        self.goto("telecontroller", "telecontroller")
+        self.widget("radio", "telecontroller_option").set_value("Yes")
+        self.run("telecontroller_option")
+
+    def dashboard_journey(self):
+        """Browse the dashboard: search, sort and filter."""
+        self.goto("home", "home")
+        search = next(t for t in self.at.text_input if t.label == "Search by company, contact or phone")
+        search.input(self.rng.choice(["Load", "Co", "Test", "zz"]))
+        self.run("dashboard_search")
+        sort = next(s for s in self.at.selectbox if s.label == "Sort by:")
+        sort.set_value(self.rng.choice(sort.options))
+        self.run("dashboard_sort")
+        serial = next(t for t in self.at.text_input if t.label == "Search by machine serial number:")
+        serial.input("SN0")
+        self.run("dashboard_serial_search")
+
+
+class Recorder:
+    """Latency collection per step."""
+
+    def __init__(self):
+        self.latencies = {}
+
+    def record(self, step, seconds):
+        self.latencies.setdefault(step, []).append(seconds)
+
+
+def db_command_count():
+    """Total commands seen by the query monitor (real MongoDB only)."""
+    from database.monitoring import query_stats
+    return sum(shape["count"] for shape in query_stats.snapshot()["shapes"])
+
+
+def simulate(index, journeys, timeout, seed, mongo_uri):
+    """Run one simulated session's journeys (in a worker process).
+
+    AppTest installs a process-global runtime for the duration of each run,
+    so concurrent sessions cannot share a process; each gets its own.
+    """
+    if mongo_uri:
+        os.environ["MONGO_CONNECTION_STRING"] = mongo_uri
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("QUERY_STATS_PATH", "")
+    from database.connection import get_client
+
+    embedded = get_client().__class__.__module__.startswith("mongomock")
+    recorder = Recorder()
+    completed = {"workflow": 0, "dashboard": 0}
+    errors = []
+    rng = random.Random(seed * 7919 + index)
+
+    ops_before = None if embedded else db_command_count()
+    for _ in range(journeys):
+        kind = "dashboard" if rng.random() < DASHBOARD_SHARE else "workflow"
+        # Each journey starts from a fresh browser session
+        session = Session(index, timeout, recorder)
+        try:
+            getattr(session, f"{kind}_journey")()
+            completed[kind] += 1
+        except Exception as e:
+            errors.append(f"session {index} {kind}: {e}")
+
+    return {
+        "latencies": recorder.latencies,
+        "completed": completed,
+        "errors": errors,
+        "embedded": embedded,
+        "db_ops": None if embedded else db_command_count() - ops_before,
+    }
+
+
+def run_load_test(sessions, journeys_per_session, timeout, seed=0, mongo_uri=None, think_time=2.0):
+    """Run the load test and return the report dict."""
+    started = time.perf_counter()
+    # Spawned workers avoid forking an open MongoClient
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=sessions, mp_context=context) as pool:
+        futures = [pool.submit(simulate, index, journeys_per_session, timeout, seed, mongo_uri)
+                   for index in range(sessions)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    latencies = {}
+    completed = {"workflow": 0, "dashboard": 0}
+    errors = []
+    db_ops = 0
+    for result in results:
+        for step, values in result["latencies"].items():
+            latencies.setdefault(step, []).extend(values)
+        for kind, count in result["completed"].items():
+            completed[kind] += count
+        errors.extend(result["errors"])
+        db_ops = None if result["db_ops"] is None or db_ops is None else db_ops + result["db_ops"]
+
+    embedded = any(result["embedded"] for result in results)
+    total_journeys = sum(completed.values())
+    all_latencies = [value for values in latencies.values() for value in values]
+    rerun = summarize(all_latencies)
+
+    # One server process runs reruns one at a time under the GIL; with a
+    # technician pausing `think_time` between interactions, a process keeps
+    # up with roughly (rerun + think) / rerun sessions.
+    mean_rerun_s = rerun.get("mean_ms", 0) / 1000.0
+    sessions_per_process = round((mean_rerun_s + think_time) / mean_rerun_s, 1) if mean_rerun_s else None
+
+    return {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "sessions": sessions,
+            "journeys_per_session": journeys_per_session,
+            "backend": "embedded" if embedded else "mongodb",
+            "seed": seed,
+            "think_time_s": think_time,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "journeys": dict(completed, total=total_journeys),
+        "errors": errors,
+        "throughput": {
+            "journeys_per_s": round(total_journeys / elapsed, 3) if elapsed else 0.0,
+            "reruns_per_s": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        },
+        # Command monitoring does not see the embedded backend
+        "db_ops_per_journey": round(db_ops / total_journeys, 1) if db_ops is not None and total_journeys else None,
+        "rerun_latency": rerun,
+        "estimated_sessions_per_process": sessions_per_process,
+        "steps": {step: summarize(values) for step, values in sorted(latencies.items())},
+    }
+
+
+def compare(report, baseline):
+    """Print the change of the headline numbers against a saved baseline."""
+    def delta(new, old):
+        if not old:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print("\nComparison with baseline from", baseline.get("generated_at"))
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        new, old = report["rerun_latency"].get(key, 0), baseline["rerun_latency"].get(key, 0)
+        print(f"  rerun {key:<7} {old:>9.2f} -> {new:>9.2f}  ({delta(new, old)})")
+    for key in ("journeys_per_s", "reruns_per_s"):
+        new, old = report["throughput"][key], baseline["throughput"][key]
+        print(f"  {key:<13} {old:>9.2f} -> {new:>9.2f}  ({delta(new, old)})")
+    if report.get("db_ops_per_journey") is not None and baseline.get("db_ops_per_journey"):
+        new, old = report["db_ops_per_journey"], baseline["db_ops_per_journey"]
+        print(f"  db ops/journey {old:>8.1f} -> {new:>9.1f}  ({delta(new, old)})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test")
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent simulated technicians")
+    parser.add_argument("--journeys", type=int, default=3, help="Journeys per session")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-rerun timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--think-time", type=float, default=2.0,
+                        help="Seconds a technician pauses between interactions (capacity estimate)")
+    parser.add_argument("--mongo-uri", default=None,
+                        help="MongoDB connection string, or mongomock:// for the embedded backend")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the report as a baseline JSON")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a baseline JSON")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(args.sessions, args.journeys, args.timeout, seed=args.seed,
+                           mongo_uri=args.mongo_uri, think_time=args.think_time)
+    print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Print the query-shape report written by database/monitoring.py.
+
+Usage:
+    python -m tools.query_report [--file .query_stats.json] [--sort total|count|p95|p99] [--limit 20] [--explain]
+"""
+import argparse
+import json
+import sys
+
+from database.monitoring import QUERY_STATS_PATH
+
+SORT_KEYS = {
+    "total": "total_ms",
+    "count": "count",
+    "p95": "p95_ms",
+    "p99": "p99_ms",
+    "bytes": "bytes_returned",
+}
+
+def print_shapes(shapes, limit):
+    """Print the shape table."""
+    header = f"{'count':>8} {'total ms':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'docs':>9} {'bytes':>11}  shape"
+    print(header)
+    print("-" * len(header))
+    for s in shapes[:limit]:
+        print(f"{s['count']:>8} {s['total_ms']:>10.1f} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} "
+              f"{s['p99_ms']:>8.2f} {s['docs_returned']:>9} {s['bytes_returned']:>11}  {s['shape']}")
+
+def print_slow_queries(slow_queries, limit, explain=False):
+    """Print the slow-query log, optionally with explain plans."""
+    client = None
+    if explain:
+        # Only connect when plans are requested
+        from database.connection import client
+        from database.monitoring import explain_command
+
+    for entry in slow_queries[:limit]:
+        print(f"[{entry['timestamp']}] {entry['duration_ms']:.1f} ms, {entry['docs_returned']} docs  {entry['shape']}")
+        if explain and entry.get("command"):
+            plan = explain_command(client, entry["database"], entry["command"])
+            winning = plan.get("queryPlanner", {}).get("winningPlan", {})
+            print("    winning plan: " + json.dumps(winning, default=str))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query-shape statistics report")
+    parser.add_argument("--file", default=QUERY_STATS_PATH or ".query_stats.json",
+                        help="Snapshot file written by the app")
+    parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="total")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--explain", action="store_true",
+                        help="Run explain for each slow query against the configured database")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.file) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        print(f"No snapshot at {args.file}. Run the app (or use 'Write Snapshot' on the Query Stats page) first.",
+              file=sys.stderr)
+        return 1
+
+    shapes = sorted(snapshot["shapes"], key=lambda s: s[SORT_KEYS[args.sort]], reverse=True)
+    print(f"Query shapes since {snapshot['started_at']} (snapshot {snapshot['generated_at']})\n")
+    print_shapes(shapes, args.limit)
+
+    print(f"\nSlow queries (>= {snapshot['slow_query_ms']:.0f} ms)\n")
+    print_slow_queries(snapshot["slow_queries"], args.limit, explain=args.explain)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""Clean up temporary "New Customer" placeholders left by earlier versions.
+
+Placeholders that were filled in lose their is_temporary flag, so the
+dashboard and statistics count them again; untouched placeholders older
+than --ttl-hours are deleted and taken back out of the rollups, the
+workflow event log and the drafts. Run it once after upgrading and then
+periodically (e.g. hourly from cron). Running app processes drop deleted
+placeholders from their autocomplete index on their next lookup, through
+the sync tombstones the deletes leave.
+
+Usage:
+    python -m tools.reap_temporary [--mongo-uri URI] [--database service_workflow] [--ttl-hours 24]
+"""
+import argparse
+import sys
+import time
+
+
+def main(argv=None):
+    from database.temporary import TEMPORARY_TTL_HOURS, reap
+
+    parser = argparse.ArgumentParser(description="Promote or delete temporary customer placeholders")
+    parser.add_argument("--mongo-uri", default=None,
+                        help="MongoDB connection string (default: the app's MONGO_CONNECTION_STRING)")
+    parser.add_argument("--database", default="service_workflow")
+    parser.add_argument("--ttl-hours", type=float, default=TEMPORARY_TTL_HOURS,
+                        help="Age after which an untouched placeholder is deleted")
+    args = parser.parse_args(argv)
+
+    if args.mongo_uri:
+        import pymongo
+        db = pymongo.MongoClient(args.mongo_uri)[args.database]
+    else:
+        from database.connection import get_client
+        db = get_client()[args.database]
+
+    started = time.perf_counter()
+    promoted, deleted = reap(db, ttl_hours=args.ttl_hours)
+    print(f"Kept {promoted} filled-in placeholders and deleted {deleted} untouched ones "
+          f"in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Recompute the daily_rollups collection from customers, MRNs and service reports.
+
+Use it to backfill rollups for data written before they existed, or after a
+bulk import. The new rollups replace the old ones in one rename, so the
+dashboard never reads a half-built collection, but writes made while the
+rebuild runs may be lost from the rollups, so run it when the app is idle.
+
+--backfill-events first writes workflow events for customers that have none
+(data from before the event log). --from-events rewrites the customers'
+status and step timestamps by replaying workflow_events before the rollups
+are recomputed from them. --backfill-search writes the customer search
+grams for customers saved before they existed. --machines also rebuilds the
+machine registry from the MRNs and service reports. --migrate-drafts first
+moves MRN drafts saved in the mrns collection (is_draft) to the drafts
+collection; run it once after upgrading, since MRN reads no longer skip them.
+
+Usage:
+    python -m tools.rebuild_rollups [--mongo-uri URI] [--database service_workflow]
+                                    [--backfill-events] [--from-events] [--backfill-search]
+                                    [--machines] [--migrate-drafts]
+"""
+import argparse
+import sys
+import time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild daily_rollups from the raw collections")
+    parser.add_argument("--mongo-uri", default=None,
+                        help="MongoDB connection string (default: the app's MONGO_CONNECTION_STRING)")
+    parser.add_argument("--database", default="service_workflow")
+    parser.add_argument("--backfill-events", action="store_true",
+                        help="Write workflow events for customers without any first")
+    parser.add_argument("--from-events", action="store_true",
+                        help="Replay workflow_events into customer status and step timestamps first")
+    parser.add_argument("--backfill-search", action="store_true",
+                        help="Write customer search grams for customers without them")
+    parser.add_argument("--machines", action="store_true", help="Rebuild the machines registry too")
+    parser.add_argument("--migrate-drafts", action="store_true",
+                        help="Move MRN drafts out of the mrns collection first")
+    args = parser.parse_args(argv)
+
+    if args.mongo_uri:
+        import pymongo
+        db = pymongo.MongoClient(args.mongo_uri)[args.database]
+    else:
+        from database.connection import get_client
+        db = get_client()[args.database]
+
+    from database import events, customer_search, machines, drafts
+    from database.rollups import rebuild
+
+    if args.migrate_drafts:
+        moved = drafts.migrate_mrn_drafts(db)
+        print(f"Moved {moved} MRN drafts to the drafts collection")
+    if args.backfill_events:
+        started = time.perf_counter()
+        written = events.backfill(db)
+        print(f"Wrote {written} workflow events in {time.perf_counter() - started:.1f}s")
+    if args.from_events:
+        started = time.perf_counter()
+        updated = events.rebuild_projections(db)
+        print(f"Replayed workflow events into {updated} customers in {time.perf_counter() - started:.1f}s")
+    if args.backfill_search:
+        started = time.perf_counter()
+        updated = customer_search.backfill(db)
+        print(f"Wrote search grams for {updated} customers in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    rows = rebuild(db)
+    print(f"Wrote {rows} rollup rows in {time.perf_counter() - started:.1f}s")
+    if args.machines:
+        started = time.perf_counter()
+        count = machines.rebuild(db)
+        print(f"Wrote {count} machines in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
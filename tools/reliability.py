@@ -0,0 +1,191 @@
+"""Batch reliability statistics (MTBF, repeat visits, top faults) by machine model.
+
+Each run reads only the service reports created since the previous run,
+through a projected cursor. It appends them to each machine's visit history
+in reliability_serials (keyed by normalized serial number) and recomputes
+the models those machines belong to, one model per worker process. Results
+go to the reliability collection, which the analytics page shows. The
+watermark lives in the jobs collection.
+
+Reports created in the last few minutes are left for the next run, so
+writes still in flight are not skipped. Edits to reports that were already
+processed are picked up by --full, which rebuilds every history from all
+reports. Reports without a serial number are skipped.
+
+Usage:
+    python -m tools.reliability [--mongo-uri URI] [--database service_workflow]
+                                [--repeat-days 30] [--workers N] [--full]
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from database.machines import normalize_serial
+from utils.reliability import DEFAULT_REPEAT_DAYS, fault_category, model_reliability
+
+# Document in the jobs collection holding the watermark
+JOB_ID = "reliability"
+
+# Reports younger than this wait for the next run
+SETTLE_TIME = datetime.timedelta(minutes=5)
+
+# Service report fields the job reads
+REPORT_PROJECTION = {"_id": 0, "serial_number": 1, "make_model": 1, "service_date": 1, "running_hours": 1,
+                     "reported_fault": 1}
+
+# Model of reports without make_model
+UNKNOWN_MODEL = "Unknown"
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _running_hours(value):
+    try:
+        hours = float(value)
+    except (TypeError, ValueError):
+        return None
+    return hours if hours >= 0 else None
+
+
+def collect_visits(db, since, until, batch_size=5000):
+    """New visits per machine from the reports created in (since, until].
+
+    Returns:
+        {serial: {"model", "days", "hours", "categories"}}; the model is
+        the one named by the machine's latest new report
+    """
+    created = {"$lte": until}
+    if since:
+        created["$gt"] = since
+    visits = {}
+    latest = {}
+    cursor = db.service_reports.find({"created_at": created}, REPORT_PROJECTION, batch_size=batch_size)
+    for report in cursor:
+        serial = normalize_serial(report.get("serial_number"))
+        service_date = report.get("service_date")
+        if not serial or not isinstance(service_date, datetime.datetime):
+            continue
+        day = (service_date - _EPOCH).days
+        entry = visits.setdefault(serial, {"days": [], "hours": [], "categories": []})
+        entry["days"].append(day)
+        entry["hours"].append(_running_hours(report.get("running_hours")))
+        entry["categories"].append(fault_category(report.get("reported_fault")))
+        if day >= latest.get(serial, day):
+            latest[serial] = day
+            entry["model"] = (report.get("make_model") or "").strip() or UNKNOWN_MODEL
+    return visits
+
+
+def _compute(partition):
+    model, histories, repeat_days = partition
+    return model_reliability(model, histories, repeat_days)
+
+
+def compute_models(partitions, workers):
+    """model_reliability() for each (model, histories, repeat_days), across worker processes."""
+    if workers <= 0 or len(partitions) < 2:
+        return [_compute(partition) for partition in partitions]
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(len(partitions) // (workers * 4), 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return list(executor.map(_compute, partitions, chunksize=chunksize))
+
+
+def run(db, repeat_days=DEFAULT_REPEAT_DAYS, workers=0, full=False, now=None):
+    """Process the reports created since the last run and refresh the models they touch.
+
+    Args:
+        db: Database handle
+        repeat_days: Repeat-visit window; changing it recomputes every model
+        workers: Worker processes (0 computes in this process)
+        full: Forget the histories and the watermark and start over
+        now: Current time (default: now)
+
+    Returns:
+        Dict with "machines" (histories updated), "models" (recomputed) and "watermark"
+    """
+    from pymongo import ReplaceOne
+
+    now = now or datetime.datetime.now()
+    db.service_reports.create_index("created_at")
+    db.reliability_serials.create_index("model")
+    if full:
+        db.reliability_serials.drop()
+        db.reliability.drop()
+        db.jobs.delete_one({"_id": JOB_ID})
+        db.reliability_serials.create_index("model")
+    state = db.jobs.find_one({"_id": JOB_ID}) or {}
+    watermark = now - SETTLE_TIME
+
+    # Append the new visits to the machines' histories
+    visits = collect_visits(db, state.get("watermark"), watermark)
+    touched = set()
+    requests = []
+    stored = {history["_id"]: history for history in db.reliability_serials.find({"_id": {"$in": list(visits)}})}
+    for serial, new in visits.items():
+        history = stored.get(serial) or {"_id": serial, "days": [], "hours": [], "categories": []}
+        if history.get("model"):
+            touched.add(history["model"])
+        entries = sorted(zip(history["days"] + new["days"], history["hours"] + new["hours"],
+                             history["categories"] + new["categories"]), key=lambda entry: entry[0])
+        history.update(model=new["model"], days=[e[0] for e in entries], hours=[e[1] for e in entries],
+                       categories=[e[2] for e in entries])
+        touched.add(new["model"])
+        requests.append(ReplaceOne({"_id": serial}, history, upsert=True))
+    for i in range(0, len(requests), 1000):
+        db.reliability_serials.bulk_write(requests[i:i + 1000], ordered=False)
+
+    if state.get("repeat_days", repeat_days) != repeat_days:
+        touched.update(db.reliability_serials.distinct("model"))
+
+    # One partition per model, from the stored histories only
+    partitions = []
+    for model in sorted(touched):
+        histories = list(db.reliability_serials.find({"model": model}, {"_id": 0, "days": 1, "hours": 1,
+                                                                        "categories": 1}))
+        if histories:
+            partitions.append((model, histories, repeat_days))
+        else:
+            # Every machine of the model now reports another model
+            db.reliability.delete_one({"_id": model})
+    for result in compute_models(partitions, workers):
+        db.reliability.replace_one({"_id": result["_id"]}, dict(result, computed_at=now), upsert=True)
+
+    db.jobs.update_one({"_id": JOB_ID}, {"$set": {"watermark": watermark, "repeat_days": repeat_days, "ran_at": now}},
+                       upsert=True)
+    return {"machines": len(requests), "models": len(partitions), "watermark": watermark}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute reliability statistics by machine model")
+    parser.add_argument("--mongo-uri", default=None,
+                        help="MongoDB connection string (default: the app's MONGO_CONNECTION_STRING)")
+    parser.add_argument("--database", default="service_workflow")
+    parser.add_argument("--repeat-days", type=int, default=DEFAULT_REPEAT_DAYS,
+                        help="Days within which a second visit counts as a repeat")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                        help="Worker processes (0 computes in this process)")
+    parser.add_argument("--full", action="store_true", help="Rebuild all histories from every report")
+    args = parser.parse_args(argv)
+
+    if args.mongo_uri:
+        import pymongo
+        db = pymongo.MongoClient(args.mongo_uri)[args.database]
+    else:
+        from database.connection import get_client
+        db = get_client()[args.database]
+
+    started = time.perf_counter()
+    result = run(db, repeat_days=args.repeat_days, workers=args.workers, full=args.full)
+    print(f"Updated {result['machines']} machine histories and {result['models']} models "
+          f"(reports up to {result['watermark']:%Y-%m-%d %H:%M}) in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,573 @@
+"""Deterministic synthetic dataset generator for benchmarks and load tests.
+
+Generates customers, MRNs (with the inspection fields of pages/mrn_creation.py),
+service reports (staff, parts, labour and checklist arrays as saved by
+pages/service_report.py), audit logs and document versions. Every batch is
+generated from its own seeded RNG and documents get deterministic ObjectIds,
+so the same seed and sizes always produce the same data, whatever the number
+of workers.
+
+Usage:
+    python -m tools.seed_data --customers 10000 [--seed 42] [--workers 4] [--drop]
+                              [--profile profile.json] [--mongo-uri mongodb://localhost:27017/]
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from bson.objectid import ObjectId
+
+from database.customer_search import search_fields
+from database.events import backfill as backfill_events
+from database.machines import rebuild as rebuild_machines
+from database.rollups import rebuild as rebuild_rollups
+from utils.costs import report_costs
+
+DEFAULT_DATABASE = "service_workflow"
+
+# Distributions and sizes; any key can be overridden with --profile
+DEFAULT_PROFILE = {
+    "start_date": "2024-01-01",
+    "days": 730,
+    "mrns_per_customer": 1.5,
+    "reports_per_mrn": 0.9,
+    "audit_logs_per_customer": 2,
+    "versions_per_report": 1,
+    "machine_count_zipf_s": 1.6,     # machines per customer ~ Zipf(s), capped at max_machines
+    "max_machines": 40,
+    "parts_per_report_mean": 3.0,    # Poisson
+    "labor_rows_mean": 2.0,          # Poisson (at least one row)
+    "staff_per_report_mean": 1.5,    # Poisson (at least one entry)
+    "unit_price_lognormal": [3.5, 1.0],
+    "labor_rate_range": [35.0, 120.0],
+    "checklist_fail_rate": 0.08,
+    "vendor_registered_rate": 0.6,   # for customers without an MRN yet
+    "telecontroller_rate": 0.8,      # for customers with a service report
+    "follow_up_rate": 0.15,
+    "satisfaction_weights": [0.03, 0.05, 0.12, 0.35, 0.45],
+    "service_status_weights": {
+        "Completed Successfully": 0.75,
+        "Completed with Issues": 0.1,
+        "Partially Completed": 0.06,
+        "Not Completed": 0.03,
+        "Pending Follow-up": 0.06,
+    },
+}
+
+COMPANY_WORDS = ["Apex", "Delta", "Prime", "Vector", "Summit", "Orion", "Atlas", "Nova", "Titan", "Zenith",
+                 "Falcon", "Harbor", "Iron", "Silver", "Granite", "Blue", "Metro", "Pioneer", "Union", "Coastal"]
+COMPANY_SUFFIXES = ["Fabrication", "Engineering", "Steel Works", "Industries", "Marine", "Construction",
+                    "Metalcraft", "Welding Services", "Manufacturing", "Shipyard"]
+FIRST_NAMES = ["Arun", "Maria", "John", "Fatima", "Wei", "Priya", "Carlos", "Aisha", "David", "Elena",
+               "Ravi", "Sara", "Omar", "Lena", "Kofi", "Yuki", "Nikhil", "Anna", "Tariq", "Grace"]
+LAST_NAMES = ["Nair", "Garcia", "Smith", "Khan", "Chen", "Patel", "Silva", "Ali", "Brown", "Rossi",
+              "Menon", "Okafor", "Tanaka", "Müller", "Haddad", "Kumar", "Jones", "Lopez", "Ivanova", "Thomas"]
+MACHINES = [
+    ("MIG Welder", ["Lincoln Power MIG 256", "Miller Millermatic 255", "ESAB Rebel EMP 235ic", "Kemppi Kempact 253R"]),
+    ("TIG Welder", ["Miller Dynasty 210", "Lincoln Aspect 230", "Fronius MagicWave 230i", "ESAB Renegade ET 300i"]),
+    ("Plasma Cutter", ["Hypertherm Powermax 45", "Lincoln Tomahawk 1000", "Miller Spectrum 875"]),
+    ("Stick Welder", ["Lincoln AC225", "ESAB Buddy Arc 145", "Miller Maxstar 161"]),
+    ("Multi-process Welder", ["Miller XMT 350", "Lincoln Flextec 350X", "Kemppi X8 MIG Welder"]),
+]
+FAULTS = [
+    ("No arc start", "Faulty trigger switch and worn contact tip"),
+    ("Wire feed erratic", "Worn drive rolls and kinked liner"),
+    ("Machine trips breaker", "Shorted primary rectifier"),
+    ("Overheating warning", "Cooling fan seized, vents clogged with dust"),
+    ("Display blank", "Failed control board power supply"),
+    ("Porosity in welds", "Gas solenoid valve leaking"),
+    ("Unstable arc", "Loose torch connection and damaged cable"),
+    ("No gas flow", "Blocked gas hose connector"),
+    ("Burning smell", "Burnt output inductor winding"),
+    ("Intermittent output", "Cracked solder joints on inverter board"),
+]
+JOBS = ["Replaced faulty component and tested under load", "Cleaned internals and re-terminated cables",
+        "Recalibrated output and updated firmware", "Replaced consumables and serviced wire feeder",
+        "Repaired PCB and performed safety test"]
+RECOMMENDATIONS = ["Clean vents monthly", "Replace torch consumables regularly", "Use a dedicated circuit",
+                   "Schedule preventive maintenance every 6 months", "Store machine in a dry place"]
+PARTS = [
+    ("CT-045", "Contact tip 0.045", "Lincoln", 4.5), ("DR-030", "Drive roll set", "Miller", 38.0),
+    ("LN-15", "Torch liner 15ft", "ESAB", 42.0), ("FAN-120", "Cooling fan 120mm", "Generic", 25.0),
+    ("PCB-CTRL", "Control board", "Fronius", 420.0), ("SOL-GAS", "Gas solenoid valve", "Miller", 65.0),
+    ("RECT-P", "Primary rectifier", "Lincoln", 180.0), ("TRG-SW", "Trigger switch", "Kemppi", 22.0),
+    ("CBL-50", "Work cable 50mm2", "Generic", 95.0), ("IND-OUT", "Output inductor", "ESAB", 240.0),
+]
+ACCESSORIES = ["Torch", "Earth clamp", "Gas regulator", "Power cable", "Foot pedal", "Wire spool", "Manual"]
+MRN_INSPECTION_ITEMS = ["power_cable", "front_panel", "control_knobs_button", "display_screen",
+                        "gas_hose_connectors", "cooling_fan_vents", "welding_torch_socket"]
+CHECKLIST_ITEMS = [
+    "Power Supply Voltage", "Control Circuits", "Electronic Components", "Wiring Condition",
+    "Emergency Stop Function", "Safety Guards and Covers", "Lubrication of Moving Parts",
+    "Wear and Tear of Components", "Belt/Chain Tension", "Hydraulic Systems", "Hoses and Connections",
+    "Leaks (Oil/Water/Gas)", "Operational Test Run", "Sound/Vibration Test", "Cleaning of Equipment",
+    "Cooling System", "Heating Elements", "Pressure Test", "Calibration (if applicable)",
+    "Software/Firmware Version",
+]
+LABOR_TYPES = ["Standard Labor", "Overtime Labor", "Travel", "Accommodation", "Other"]
+JOB_TYPES = ["Repair", "Maintenance", "Installation", "Training", "Inspection", "Other"]
+OTHER_SERVICE_TYPES = ["Scheduled Maintenance", "Repair", "Installation", "Training", "Inspection", "Other"]
+
+# Namespaces keep deterministic ObjectIds of different collections apart
+NAMESPACES = {"customers": 1, "mrns": 2, "service_reports": 3, "audit_logs": 4, "document_versions": 5}
+
+
+class Plan:
+    """Sizes and index arithmetic shared by every batch.
+
+    MRN j belongs to customer j % customers and service report r documents
+    MRN r, so every relationship is computable from indexes alone.
+    """
+
+    def __init__(self, customers, profile):
+        self.profile = profile
+        self.customers = customers
+        self.mrns = int(customers * profile["mrns_per_customer"])
+        self.reports = int(self.mrns * profile["reports_per_mrn"])
+        self.audit_logs = int(customers * profile["audit_logs_per_customer"])
+        self.versions = int(self.reports * profile["versions_per_report"])
+        self.start = datetime.datetime.fromisoformat(profile["start_date"])
+        self.days = profile["days"]
+
+    def sizes(self):
+        return {"customers": self.customers, "mrns": self.mrns, "service_reports": self.reports,
+                "audit_logs": self.audit_logs, "document_versions": self.versions}
+
+    def mrn_day(self, j):
+        """MRN dates increase with the index so daily sequence numbers are computable."""
+        return j * self.days // max(self.mrns, 1)
+
+    def mrn_sequence(self, j):
+        """1-based position of MRN j within its day."""
+        day = self.mrn_day(j)
+        first = -(-day * self.mrns // self.days)  # ceil(day * mrns / days)
+        return j - first + 1
+
+    def code(self, prefix, j):
+        day = self.start + datetime.timedelta(days=self.mrn_day(j))
+        return f"{prefix}-{day.strftime('%Y%m%d')}-{self.mrn_sequence(j):04d}"
+
+
+def object_id(collection, index, when):
+    """Deterministic ObjectId: creation timestamp, collection namespace and index."""
+    seconds = int(when.replace(tzinfo=datetime.timezone.utc).timestamp()) & 0xFFFFFFFF
+    tail = (NAMESPACES[collection] << 56) | index
+    return ObjectId(seconds.to_bytes(4, "big") + tail.to_bytes(8, "big"))
+
+
+def batch_rng(seed, collection, batch):
+    return random.Random(f"{seed}:{collection}:{batch}")
+
+
+def index_rng(seed, collection, index):
+    """RNG for values that other collections must agree on (names, serials)."""
+    return random.Random(f"{seed}:{collection}:item:{index}")
+
+
+def _zipf(rng, s, cap):
+    # Inverse-transform sampling over 1..cap
+    weights = [1.0 / (k ** s) for k in range(1, cap + 1)]
+    return rng.choices(range(1, cap + 1), weights=weights)[0]
+
+
+def _poisson(rng, mean):
+    # Knuth's method; means here are small
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def customer_identity(seed, plan, i):
+    """Name, contact, machines and creation date of customer i."""
+    rng = index_rng(seed, "customers", i)
+    name = f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_SUFFIXES)} {i}"
+    contact = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    phone = f"+91 9{rng.randint(100000000, 999999999)}"
+    machine_count = _zipf(rng, plan.profile["machine_count_zipf_s"], plan.profile["max_machines"])
+    machine_type, models = rng.choice(MACHINES)
+    if i < plan.mrns:
+        # Registered shortly before the first MRN
+        created = (plan.start + datetime.timedelta(days=plan.mrn_day(i))
+                   - datetime.timedelta(hours=rng.randint(1, 72)))
+    else:
+        created = plan.start + datetime.timedelta(minutes=rng.randint(0, plan.days * 1440))
+    return {"name": name, "contact_name": contact, "contact_phone": phone, "machine_count": machine_count,
+            "machine_type": machine_type, "models": models, "created_at": created}
+
+
+def machine_for_mrn(seed, plan, j, identity):
+    """Serial, model and type of the machine MRN j is about (repeat visits reuse serials)."""
+    rng = index_rng(seed, "mrns", j)
+    customer_index = j % plan.customers
+    machine_no = rng.randint(1, identity["machine_count"])
+    model = identity["models"][machine_no % len(identity["models"])]
+    return {"serial_no": f"SN{customer_index:07d}{machine_no:02d}", "model": model,
+            "machine_type": identity["machine_type"]}
+
+
+def mrn_created_at(seed, plan, j):
+    rng = index_rng(seed, "mrn_dates", j)
+    return plan.start + datetime.timedelta(days=plan.mrn_day(j), minutes=rng.randint(8 * 60, 18 * 60))
+
+
+def report_dates(seed, plan, r):
+    """Service date and creation time of service report r (a few days after its MRN)."""
+    rng = index_rng(seed, "report_dates", r)
+    mrn_created = mrn_created_at(seed, plan, r)
+    service_date = datetime.datetime.combine((mrn_created + datetime.timedelta(days=rng.randint(0, 5))).date(),
+                                             datetime.time())
+    created = max(service_date + datetime.timedelta(hours=rng.randint(9, 18)),
+                  mrn_created + datetime.timedelta(hours=1))
+    return service_date, created
+
+
+def build_customer(seed, plan, i, rng):
+    identity = customer_identity(seed, plan, i)
+    profile = plan.profile
+    has_mrn = i < plan.mrns
+    has_report = i < plan.reports
+    telecontroller = has_report and rng.random() < profile["telecontroller_rate"]
+    vendor = has_mrn or rng.random() < profile["vendor_registered_rate"]
+    created = identity["created_at"]
+
+    customer = {
+        "_id": object_id("customers", i, created),
+        "name": identity["name"],
+        "contact_name": identity["contact_name"],
+        "contact_phone": identity["contact_phone"],
+        "machine_count": identity["machine_count"],
+        "created_at": created,
+        "status": {
+            "vendor_registered": vendor,
+            "mrn_created": has_mrn,
+            "service_report_created": has_report,
+            "telecontroller_done": telecontroller,
+        },
+    }
+    customer.update(search_fields(customer))
+    if vendor:
+        customer["vendor_registered_at"] = created + datetime.timedelta(minutes=rng.randint(5, 600))
+    # Step timestamps match the MRN and service report documents
+    if has_mrn:
+        customer["mrn_code"] = plan.code("MRN", i)
+        customer["mrn_created_at"] = mrn_created_at(seed, plan, i)
+        customer["vendor_registered_at"] = min(customer["vendor_registered_at"], customer["mrn_created_at"])
+    if has_report:
+        customer["sr_code"] = plan.code("SR", i)
+        customer["service_report_created_at"] = report_dates(seed, plan, i)[1]
+    if telecontroller:
+        customer["telecontroller_done_at"] = (customer["service_report_created_at"]
+                                              + datetime.timedelta(hours=rng.randint(4, 14 * 24)))
+    return customer
+
+
+def build_mrn(seed, plan, j, rng):
+    customer_index = j % plan.customers
+    identity = customer_identity(seed, plan, customer_index)
+    machine = machine_for_mrn(seed, plan, j, identity)
+    created = mrn_created_at(seed, plan, j)
+    code = plan.code("MRN", j)
+    receiver = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    fault = rng.choice(FAULTS)[0]
+
+    mrn = {
+        "_id": object_id("mrns", j, created),
+        "customer_id": str(object_id("customers", customer_index, identity["created_at"])),
+        "received_by": receiver,
+        "date_of_receipt": created.date().isoformat(),
+        "customer_name": identity["name"],
+        "contact_number": identity["contact_phone"],
+        "delivered_by": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "email_id": f"stores{customer_index}@example.com",
+        "deliverer_contact": f"+91 8{rng.randint(100000000, 999999999)}",
+        "model": machine["model"],
+        "machine_type": machine["machine_type"],
+        "serial_no": machine["serial_no"],
+        "accessories_received": ", ".join(rng.sample(ACCESSORIES, rng.randint(1, 4))),
+        "overall_condition": rng.choices(["Good", "Fair", "Poor"], weights=[0.5, 0.35, 0.15])[0],
+        "problem_reported": f"{fault}. {rng.choice(['Started last week', 'Happens under load', 'Intermittent', 'Since relocation'])}",
+        "signature_received_by": receiver,
+        "signature_date": created.date().isoformat(),
+        "customer_signature": rng.random() < 0.9,
+        "office_use_notes": "",
+        "mrn_code": code,
+        "code": code,
+        "created_at": created,
+    }
+    for item in MRN_INSPECTION_ITEMS:
+        status = rng.choices(["Good", "Fair", "Poor", "Not Applicable"], weights=[0.7, 0.18, 0.07, 0.05])[0]
+        mrn[f"{item}_status"] = status
+        mrn[f"{item}_remarks"] = "" if status == "Good" else rng.choice(["Scratched", "Loose", "Worn", "Dusty"])
+    return mrn
+
+
+def build_service_report(seed, plan, r, rng):
+    profile = plan.profile
+    customer_index = r % plan.customers
+    identity = customer_identity(seed, plan, customer_index)
+    machine = machine_for_mrn(seed, plan, r, identity)
+    service_date, created = report_dates(seed, plan, r)
+    fault, diagnosis = rng.choice(FAULTS)
+    code = plan.code("SR", r)
+
+    staff = []
+    for _ in range(max(1, _poisson(rng, profile["staff_per_report_mean"]))):
+        start_hour = rng.randint(8, 13)
+        staff.append({
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "service_date": service_date.strftime("%Y-%m-%d"),
+            "travel_time": str(rng.choice([0, 0.5, 1, 1.5, 2])),
+            "job_start": f"{start_hour:02d}:00",
+            "job_end": f"{start_hour + rng.randint(1, 6):02d}:{rng.choice(['00', '30'])}",
+            "job_status": rng.choices(["Completed", "In Progress", "Pending", "Cancelled"],
+                                      weights=[0.85, 0.08, 0.05, 0.02])[0],
+            "job_type": rng.choice(JOB_TYPES),
+        })
+
+    mu, sigma = profile["unit_price_lognormal"]
+    parts = []
+    for _ in range(_poisson(rng, profile["parts_per_report_mean"])):
+        number, description, make, base = rng.choice(PARTS)
+        quantity = rng.randint(1, 4)
+        unit_price = round(base * rng.lognormvariate(0, 0.15) if rng.random() < 0.8 else rng.lognormvariate(mu, sigma), 2)
+        parts.append({"part_number": number, "description": description, "make": make,
+                      "status": rng.choices(["Used", "Replaced", "Pending", "On Order", "Recommended"],
+                                            weights=[0.4, 0.4, 0.07, 0.08, 0.05])[0],
+                      "quantity": quantity, "unit_price": unit_price, "remark": ""})
+
+    low, high = profile["labor_rate_range"]
+    labor = []
+    for _ in range(max(1, _poisson(rng, profile["labor_rows_mean"]))):
+        labor_type = rng.choices(LABOR_TYPES, weights=[0.6, 0.1, 0.2, 0.05, 0.05])[0]
+        hours = round(rng.choice([0.5, 1, 1.5, 2, 3, 4, 6, 8]), 2)
+        rate = round(rng.uniform(low, high), 2)
+        labor.append({"description": labor_type, "type": labor_type, "hours": hours, "rate": rate,
+                      "notes": ""})
+    parts, labor, totals = report_costs(parts, labor)
+
+    checklist = {}
+    for item in CHECKLIST_ITEMS:
+        failed = rng.random() < profile["checklist_fail_rate"]
+        status = rng.choice(["Fail", "Repaired"]) if failed else rng.choices(["Pass", "N/A", "Not Checked"],
+                                                                              weights=[0.8, 0.15, 0.05])[0]
+        checklist[item] = {"status": status, "notes": rng.choice(["Replaced", "Adjusted"]) if failed else ""}
+
+    follow_up = rng.random() < profile["follow_up_rate"]
+    statuses = profile["service_status_weights"]
+    advisor = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    return {
+        "_id": object_id("service_reports", r, created),
+        "customer_id": str(object_id("customers", customer_index, identity["created_at"])),
+        "mrn_code": plan.code("MRN", r),
+        "service_date": service_date,
+        "customer_name": identity["name"],
+        "contact_number": identity["contact_phone"],
+        "email_id": f"stores{customer_index}@example.com",
+        "type_of_machine": machine["machine_type"],
+        "jc_no": f"JC{r:07d}",
+        "service_type_ws": rng.random() < 0.3,
+        "service_type_gs": rng.random() < 0.6,
+        "other_service_types": rng.sample(OTHER_SERVICE_TYPES, rng.randint(0, 2)),
+        "make_model": machine["model"],
+        "serial_number": machine["serial_no"],
+        "running_hours": rng.randint(50, 20000),
+        "reported_fault": fault,
+        "problem_diagnosis": diagnosis,
+        "job_carried_out": rng.choice(JOBS),
+        "technical_difficulties": rng.choice(["", "", "Spare parts delayed", "Access to site restricted"]),
+        "recommendations": rng.choice(RECOMMENDATIONS),
+        "staff_assigned": staff,
+        "job_status_comments": rng.choice(["", "Customer satisfied", "Awaiting parts"]),
+        "inspection_checklist": checklist,
+        "inspection_comments": "",
+        "parts_list": parts,
+        "labor_costs": labor,
+        **totals,
+        "cost_notes": "",
+        "service_status": rng.choices(list(statuses), weights=list(statuses.values()))[0],
+        "follow_up_required": follow_up,
+        "follow_up_details": "Check after 100 running hours" if follow_up else "",
+        "follow_up_date": service_date + datetime.timedelta(days=30) if follow_up else None,
+        "service_advisor": advisor,
+        "service_advisor_date": service_date,
+        "service_advisor_signature": advisor,
+        "customer_rep": identity["contact_name"],
+        "customer_rep_date": service_date,
+        "customer_rep_signature": identity["contact_name"],
+        "satisfaction_level": rng.choices([1, 2, 3, 4, 5], weights=profile["satisfaction_weights"])[0],
+        "customer_feedback": rng.choice(["", "Quick turnaround", "Good service", "Took too long"]),
+        "sr_code": code,
+        "code": code,
+        "created_at": created,
+        "updated_at": created + datetime.timedelta(minutes=rng.randint(1, 240)),
+    }
+
+
+def build_audit_log(seed, plan, a, rng):
+    customer_index = a % plan.customers
+    identity = customer_identity(seed, plan, customer_index)
+    when = identity["created_at"] + datetime.timedelta(hours=rng.randint(1, 24 * 60))
+    field, value = rng.choice([("contact_phone", identity["contact_phone"]), ("contact_name", identity["contact_name"]),
+                               ("machine_count", identity["machine_count"]), ("name", identity["name"])])
+    return {
+        "_id": object_id("audit_logs", a, when),
+        "collection": "customers",
+        "document_id": str(object_id("customers", customer_index, identity["created_at"])),
+        "action": "update",
+        "changed_fields": {field: value},
+        "user_id": "system",
+        "timestamp": when,
+    }
+
+
+def build_document_version(seed, plan, v, rng):
+    r = v % max(plan.reports, 1)
+    report = build_service_report(seed, plan, r, batch_rng(seed, "service_reports_version_source", r))
+    version = {key: value for key, value in report.items() if key != "_id"}
+    version_date = report["created_at"] + datetime.timedelta(hours=rng.randint(1, 72) * (1 + v // max(plan.reports, 1)))
+    version["_id"] = object_id("document_versions", v, version_date)
+    version["_original_id"] = str(report["_id"])
+    version["_collection"] = "service_reports"
+    version["_version_date"] = version_date
+    return version
+
+
+BUILDERS = {
+    "customers": build_customer,
+    "mrns": build_mrn,
+    "service_reports": build_service_report,
+    "audit_logs": build_audit_log,
+    "document_versions": build_document_version,
+}
+
+
+def generate_batch(seed, plan, collection, batch, batch_size):
+    """Build documents [batch * batch_size, ...) of a collection."""
+    rng = batch_rng(seed, collection, batch)
+    first = batch * batch_size
+    last = min(first + batch_size, plan.sizes()[collection])
+    return [BUILDERS[collection](seed, plan, index, rng) for index in range(first, last)]
+
+
+_worker_db = None
+
+
+def _init_worker(mongo_uri, database):
+    global _worker_db
+    import pymongo
+    _worker_db = pymongo.MongoClient(mongo_uri)[database]
+
+
+def _insert_batch(seed, customers, profile, collection, batch, batch_size):
+    plan = Plan(customers, profile)
+    documents = generate_batch(seed, plan, collection, batch, batch_size)
+    if documents:
+        _worker_db[collection].insert_many(documents, ordered=False)
+    return len(documents)
+
+
+def seed_database(db, customers, seed=42, profile=None, batch_size=1000, workers=4,
+                  mongo_uri=None, database=DEFAULT_DATABASE, drop=False, progress=None):
+    """Generate and insert a dataset.
+
+    Args:
+        db: Database to insert into (used directly when mongo_uri is None)
+        customers: Number of customers; other collections scale from the profile
+        seed: RNG seed, the same seed gives the same documents
+        profile: Overrides for DEFAULT_PROFILE
+        batch_size: Documents per insert_many
+        workers: Parallel workers (processes with mongo_uri, threads otherwise)
+        mongo_uri: When set, each worker process opens its own client
+        database: Database name for worker processes
+        drop: Drop the generated collections first
+        progress: Optional callback(collection, inserted, total)
+
+    Returns:
+        Dict of collection name to inserted document count (workflow_events,
+        daily_rollups and machines are derived from the generated data)
+    """
+    profile = dict(DEFAULT_PROFILE, **(profile or {}))
+    plan = Plan(customers, profile)
+    counts = {}
+
+    if drop:
+        for collection in list(BUILDERS) + ["workflow_events", "machines"]:
+            db[collection].drop()
+
+    if mongo_uri:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(mongo_uri, database))
+    else:
+        # In-process (e.g. embedded backend): threads share the given database
+        global _worker_db
+        _worker_db = db
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    with executor:
+        for collection, total in plan.sizes().items():
+            batches = -(-total // batch_size)
+            futures = [executor.submit(_insert_batch, seed, customers, profile, collection, batch, batch_size)
+                       for batch in range(batches)]
+            inserted = 0
+            for future in futures:
+                inserted += future.result()
+                if progress:
+                    progress(collection, inserted, total)
+            counts[collection] = inserted
+
+    counts["workflow_events"] = backfill_events(db)
+    counts["daily_rollups"] = rebuild_rollups(db)
+    counts["machines"] = rebuild_machines(db)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic dataset")
+    parser.add_argument("--customers", type=int, default=1000, help="Number of customers (1k to 10M)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--profile", help="JSON file overriding distribution parameters")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_CONNECTION_STRING", "mongodb://localhost:27017/"))
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument("--drop", action="store_true", help="Drop generated collections first")
+    args = parser.parse_args(argv)
+
+    profile = {}
+    if args.profile:
+        with open(args.profile) as f:
+            profile = json.load(f)
+
+    if args.mongo_uri.startswith("mongomock://"):
+        print("The embedded backend lives inside one process; seed it from the benchmark or load-test process instead.",
+              file=sys.stderr)
+        return 1
+
+    import pymongo
+    db = pymongo.MongoClient(args.mongo_uri)[args.database]
+
+    def progress(collection, inserted, total):
+        print(f"\r{collection:<18} {inserted:>10}/{total}", end="" if inserted < total else "\n", flush=True)
+
+    started = time.perf_counter()
+    counts = seed_database(db, args.customers, seed=args.seed, profile=profile, batch_size=args.batch_size,
+                           workers=args.workers, mongo_uri=args.mongo_uri, database=args.database,
+                           drop=args.drop, progress=progress)
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"Inserted {total} documents in {elapsed:.1f}s ({total / elapsed:.0f} docs/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
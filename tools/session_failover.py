@@ -0,0 +1,147 @@
+"""Multi-process check of the shared session store.
+
+Starts several app "server" processes against one session store and walks
+simulated browser sessions through the workflow pages, sending every rerun
+to a different process the way a load balancer without sticky sessions
+would. Each process sees only the session token from the URL; the check
+fails when the workflow context a process restores differs from what the
+previous process left. The first rerun of a session gets its token from the
+app, like a browser opening the site.
+
+By default the store is a SQLite file in a temporary directory and every
+process uses the embedded backend, so customers created on one process are
+not visible on the others; pass --mongo-uri and --store mongo to run against
+a shared MongoDB.
+
+Usage:
+    python -m tools.session_failover [--processes 3] [--sessions 4]
+                                     [--store sqlite:///tmp/sessions.db | mongo] [--mongo-uri URI]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+# (page, session state the page's buttons would set) for each hop of a session
+HOPS = [
+    ("crm_entry", {"customer_id": None, "mrn_code": None, "sr_code": None}),
+    ("vendor_registration", {"customer_id": "{customer_id}"}),
+    ("mrn_creation", {}),
+    ("service_report", {"mrn_code": "MRN-{n}"}),
+    ("telecontroller", {"sr_code": "SR-{n}"}),
+    ("customer_view", {"view_customer_id": "{customer_id}", "customer_view_mode": "edit"}),
+    ("home", {}),
+]
+
+
+def _context(at, keys):
+    return {key: at.session_state[key] if key in at.session_state else None for key in keys}
+
+
+def serve(connection, store, mongo_uri, journal_dir, timeout):
+    """One app process: runs the reruns sent to it until it receives None."""
+    os.environ["SESSION_STORE"] = store
+    os.environ["JOURNAL_DIR"] = journal_dir
+    if mongo_uri:
+        os.environ["MONGO_CONNECTION_STRING"] = mongo_uri
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("QUERY_STATS_PATH", "")
+    from streamlit.testing.v1 import AppTest
+    from utils.session_store import TOKEN_PARAM, WORKFLOW_KEYS
+
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        token, page, changes = request
+        # A browser reconnecting to this process: a new Streamlit session with only the URL
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        if token:
+            at.query_params[TOKEN_PARAM] = token
+        at.run()
+        restored = _context(at, WORKFLOW_KEYS)
+        for key, value in dict(changes, page=page).items():
+            at.session_state[key] = value
+        at.run()
+        connection.send({
+            "pid": os.getpid(),
+            "token": (at.query_params.get(TOKEN_PARAM) or [None])[0],
+            "restored": restored,
+            "left": _context(at, WORKFLOW_KEYS),
+            "errors": [str(e.value) for e in at.exception],
+        })
+
+
+def run_check(processes, sessions, store, mongo_uri=None, timeout=30.0):
+    """Walk `sessions` sessions through HOPS across `processes` app processes.
+
+    Returns:
+        {"hops", "failovers" (hops served by another process than the
+        previous one), "mismatches" and "errors" (lists of messages)}
+    """
+    from bson.objectid import ObjectId
+
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    journal_root = tempfile.mkdtemp(prefix="session-failover-")
+    for index in range(processes):
+        parent, child = context.Pipe()
+        process = context.Process(target=serve, daemon=True,
+                                  args=(child, store, mongo_uri, os.path.join(journal_root, str(index)), timeout))
+        process.start()
+        workers.append((parent, process))
+
+    result = {"hops": 0, "failovers": 0, "mismatches": [], "errors": []}
+    try:
+        for n in range(sessions):
+            token, expected, previous_pid = None, None, None
+            customer_id = str(ObjectId())
+            for hop, (page, changes) in enumerate(HOPS):
+                changes = {key: value.format(customer_id=customer_id, n=n) if isinstance(value, str) else value
+                           for key, value in changes.items()}
+                connection = workers[(n + hop) % processes][0]
+                connection.send((token, page, changes))
+                reply = connection.recv()
+                result["hops"] += 1
+                result["failovers"] += previous_pid is not None and reply["pid"] != previous_pid
+                if expected is not None and reply["restored"] != expected:
+                    result["mismatches"].append(f"session {n} hop {hop} ({page}): restored {reply['restored']}, "
+                                                f"expected {expected}")
+                result["errors"].extend(f"session {n} hop {hop} ({page}): {e}" for e in reply["errors"])
+                token = token or reply["token"]
+                expected, previous_pid = reply["left"], reply["pid"]
+    finally:
+        for connection, process in workers:
+            connection.send(None)
+            process.join(timeout=10)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that sessions resume on any app process")
+    parser.add_argument("--processes", type=int, default=3, help="App processes behind the simulated balancer")
+    parser.add_argument("--sessions", type=int, default=4, help="Simulated browser sessions")
+    parser.add_argument("--store", default=None,
+                        help="SESSION_STORE for every process (default: a temporary SQLite file)")
+    parser.add_argument("--mongo-uri", default=None,
+                        help="MongoDB connection string (default: the embedded backend)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-rerun timeout in seconds")
+    args = parser.parse_args(argv)
+
+    store = args.store or "sqlite://" + os.path.join(tempfile.mkdtemp(prefix="sessions-"), "sessions.db")
+    result = run_check(args.processes, args.sessions, store, args.mongo_uri or "mongomock://", args.timeout)
+    print(f"{result['hops']} reruns, {result['failovers']} served by another process than the previous one")
+    for message in result["mismatches"] + result["errors"]:
+        print(message)
+    if result["mismatches"] or result["errors"]:
+        print("FAILED")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
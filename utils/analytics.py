@@ -0,0 +1,133 @@
+# Analytics figures built from daily rollup rows
+#
+# Everything here is plain data in, JSON out, so it can run in a worker
+# process: pages/analytics.py loads the rows and renders the figures.
+import datetime
+import json
+
+# Drilldown levels, coarsest first
+GRANULARITIES = ("month", "week", "day")
+
+# Workflow stages with cycle times, in order
+CYCLE_STAGES = {
+    "vendor_registered": "Vendor registration",
+    "mrn_created": "MRN",
+    "service_report_created": "Service report",
+    "telecontroller_done": "Telecontroller",
+    "completed": "Completed",
+}
+
+
+def period_of(day, granularity):
+    """Label of the month ("2024-03"), week (its Monday) or day containing `day` ("YYYY-MM-DD")."""
+    if granularity == "month":
+        return day[:7]
+    if granularity == "week":
+        date = datetime.date.fromisoformat(day)
+        return (date - datetime.timedelta(days=date.weekday())).isoformat()
+    return day
+
+
+def period_range(period, granularity):
+    """First and last day ("YYYY-MM-DD") of a month or week period."""
+    if granularity == "month":
+        first = datetime.date.fromisoformat(period + "-01")
+        following = (first.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        return first.isoformat(), (following - datetime.timedelta(days=1)).isoformat()
+    if granularity == "week":
+        first = datetime.date.fromisoformat(period)
+        return first.isoformat(), (first + datetime.timedelta(days=6)).isoformat()
+    return period, period
+
+
+def _frame(rows, granularity):
+    import pandas as pd
+
+    frame = pd.json_normalize(rows, sep=".") if rows else pd.DataFrame()
+    if frame.empty:
+        return frame
+    frame["period"] = [period_of(day, granularity) for day in frame["day"]]
+    return frame.fillna(0)
+
+
+def _column(frame, name):
+    return frame[name] if name in frame else 0
+
+
+def build_figures(rows, workflow_rows, granularity):
+    """Build the analytics figures for one filter selection.
+
+    Args:
+        rows: Rollup rows matching the filters (report and workflow rows)
+        workflow_rows: Workflow rows for the same days (cycle times)
+        granularity: "month", "week" or "day"
+
+    Returns:
+        Dict with "totals" (headline numbers) and "figures" ({name: plotly JSON})
+    """
+    import pandas as pd
+    import plotly.express as px
+
+    figures = {}
+    totals = {"reports": 0, "parts": 0.0, "labor": 0.0, "labor_hours": 0.0, "satisfaction": None}
+
+    frame = _frame(rows, granularity)
+    if not frame.empty and "reports" in frame:
+        reports = frame[frame["reports"] != 0].copy()
+        reports["parts"] = _column(reports, "parts_minor") / 100
+        reports["labor"] = _column(reports, "labor_minor") / 100
+        reports["labor_hours"] = _column(reports, "labor_hours_hundredths") / 100
+        scores = [f"satisfaction.{level}" for level in range(1, 6) if f"satisfaction.{level}" in reports]
+        reports["rated"] = reports[scores].sum(axis=1) if scores else 0
+        reports["score_sum"] = sum(reports[name] * int(name.rsplit(".", 1)[1]) for name in scores) if scores else 0
+
+        totals.update(reports=int(reports["reports"].sum()), parts=float(reports["parts"].sum()),
+                      labor=float(reports["labor"].sum()), labor_hours=float(reports["labor_hours"].sum()))
+        if float(reports["rated"].sum()) > 0:
+            totals["satisfaction"] = float(reports["score_sum"].sum() / reports["rated"].sum())
+
+        by_period = reports.groupby("period", as_index=False)[["parts", "labor", "reports", "rated", "score_sum"]].sum()
+        spend = by_period.melt(id_vars="period", value_vars=["parts", "labor"], var_name="cost", value_name="amount")
+        figures["spend"] = px.bar(spend, x="period", y="amount", color="cost", barmode="stack",
+                                  title="Parts and labour spend", labels={"period": granularity.title(),
+                                                                          "amount": "Amount ($)"})
+
+        rated = by_period[by_period["rated"] > 0].assign(average=lambda f: f["score_sum"] / f["rated"])
+        figures["satisfaction"] = px.line(rated, x="period", y="average", markers=True, range_y=[1, 5],
+                                          title="Average customer satisfaction",
+                                          labels={"period": granularity.title(), "average": "Rating"})
+
+        by_machine = (reports.groupby("machine_type", as_index=False)[["parts", "labor", "reports"]].sum()
+                      .assign(total=lambda f: f["parts"] + f["labor"]).sort_values("total", ascending=False))
+        figures["machine_types"] = px.bar(by_machine, x="machine_type", y=["parts", "labor"],
+                                          title="Spend by machine type",
+                                          labels={"machine_type": "Machine type", "value": "Amount ($)"})
+
+        by_engineer = (reports.groupby("engineer", as_index=False)[["labor_hours", "reports"]].sum()
+                       .sort_values("labor_hours", ascending=False).head(20))
+        figures["engineers"] = px.bar(by_engineer, x="labor_hours", y="engineer", orientation="h",
+                                      color="reports", title="Engineer utilization (labour hours, top 20)",
+                                      labels={"labor_hours": "Labour hours", "engineer": "Engineer",
+                                              "reports": "Reports"})
+
+    workflow = _frame(workflow_rows, granularity)
+    cycle_columns = [stage for stage in CYCLE_STAGES if f"cycle.{stage}.count" in workflow]
+    if cycle_columns:
+        grouped = workflow.groupby("period")
+        cycles = []
+        for stage in cycle_columns:
+            seconds = grouped[f"cycle.{stage}.seconds"].sum()
+            count = grouped[f"cycle.{stage}.count"].sum()
+            hours = (seconds[count > 0] / count[count > 0] / 3600).rename("hours").reset_index()
+            hours["stage"] = CYCLE_STAGES[stage]
+            cycles.append(hours)
+        figures["cycle_time"] = px.line(pd.concat(cycles), x="period", y="hours", color="stage", markers=True,
+                                        title="Average time from customer entry to each step",
+                                        labels={"period": granularity.title(), "hours": "Hours"})
+
+    return {"totals": totals, "figures": {name: figure.to_json() for name, figure in figures.items()}}
+
+
+def figure_dict(figure_json):
+    """Plotly figure JSON as the dict st.plotly_chart accepts."""
+    return json.loads(figure_json)
@@ -0,0 +1,228 @@
+# Money arithmetic for service reports in integer minor units (cents)
+import datetime
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+
+from database.connection import service_reports
+
+# Minor units per currency unit
+MINOR_UNITS = 100
+
+# Fields read for the cross-report aggregations
+AGGREGATE_PROJECTION = {
+    "_id": 0,
+    "customer_id": 1,
+    "customer_name": 1,
+    "service_date": 1,
+    "total_parts_minor": 1,
+    "total_labor_minor": 1,
+    "total_parts_cost": 1,
+    "total_labor_cost": 1,
+    "labor_costs.type": 1,
+    "labor_costs.total_cost_minor": 1,
+    "labor_costs.total_cost": 1,
+}
+
+
+def to_minor(amount):
+    """Convert an amount (float, str, Decimal or None) to integer minor units.
+
+    The amount is read through its decimal string, so 12.345 rounds half up
+    to 1235 instead of following its binary float value.
+    """
+    if amount is None or amount == "":
+        return 0
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation:
+        return 0
+    if not value.is_finite():
+        return 0
+    return int((value * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_minor_array(amounts):
+    """to_minor() over a whole column, as a numpy int64 array.
+
+    Numbers are scaled and rounded by numpy. Only entries numpy cannot round
+    the way to_minor() does go through it one by one: a column that does not
+    convert to floats (blank strings, text), and floats within rounding
+    error of half a cent, where the decimal digits decide.
+    """
+    import numpy as np
+
+    if not hasattr(amounts, "__len__"):
+        amounts = list(amounts)
+    try:
+        values = np.asarray(amounts, dtype=np.float64).reshape(-1)
+    except (TypeError, ValueError):
+        return np.fromiter((to_minor(amount) for amount in amounts), dtype=np.int64)
+    scaled = values * MINOR_UNITS
+    # None, NaN and infinities count as zero, as in to_minor()
+    scaled[~np.isfinite(scaled)] = 0.0
+    minor = np.rint(scaled).astype(np.int64)
+    tolerance = np.maximum(np.abs(scaled) * 1e-12, 1e-9)
+    near_half = np.flatnonzero(np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) <= tolerance)
+    if near_half.size:
+        originals = np.asarray(amounts, dtype=object).reshape(-1)
+        for index in near_half:
+            minor[index] = to_minor(originals[index])
+    return minor
+
+
+def from_minor(minor):
+    """Amount in currency units for display and the legacy float fields."""
+    return float(Decimal(int(minor)) / MINOR_UNITS)
+
+
+def format_money(minor):
+    """Format minor units as "$1,234.50"."""
+    sign = "-" if minor < 0 else ""
+    units, cents = divmod(abs(int(minor)), MINOR_UNITS)
+    return f"{sign}${units:,}.{cents:02d}"
+
+
+def line_totals(quantities, prices):
+    """Line totals in minor units for whole columns at once.
+
+    Quantities may be fractional (labour hours); they are taken to two
+    decimals and the product is rounded half up to the cent.
+
+    Args:
+        quantities: Iterable of quantities or hours
+        prices: Iterable of unit prices or rates
+
+    Returns:
+        numpy int64 array of line totals
+    """
+    import numpy as np
+
+    # Quantities in hundredths and prices in cents keep the product exact
+    quantity_hundredths = to_minor_array(quantities)
+    price_minor = to_minor_array(prices)
+    product = quantity_hundredths * price_minor
+    return np.sign(product) * ((np.abs(product) + MINOR_UNITS // 2) // MINOR_UNITS)
+
+
+def report_costs(parts_list, labor_costs):
+    """Compute line and report totals for one service report.
+
+    Each part gets `total_price_minor` (and the float `total_price`), each
+    labour entry `total_cost_minor` (and `total_cost`).
+
+    Args:
+        parts_list: Part entries with quantity and unit_price
+        labor_costs: Labour entries with hours and rate
+
+    Returns:
+        (parts_list, labor_costs, totals) where totals holds the
+        *_minor report totals and their float equivalents
+    """
+    part_minor = line_totals([p.get("quantity") for p in parts_list], [p.get("unit_price") for p in parts_list])
+    labor_minor = line_totals([l.get("hours") for l in labor_costs], [l.get("rate") for l in labor_costs])
+
+    parts = [dict(part, total_price_minor=int(m), total_price=from_minor(m)) for part, m in zip(parts_list, part_minor)]
+    labor = [dict(entry, total_cost_minor=int(m), total_cost=from_minor(m)) for entry, m in zip(labor_costs, labor_minor)]
+
+    total_parts_minor = int(part_minor.sum())
+    total_labor_minor = int(labor_minor.sum())
+    grand_total_minor = total_parts_minor + total_labor_minor
+    totals = {
+        "total_parts_minor": total_parts_minor,
+        "total_labor_minor": total_labor_minor,
+        "grand_total_minor": grand_total_minor,
+        "total_parts_cost": from_minor(total_parts_minor),
+        "total_labor_cost": from_minor(total_labor_minor),
+        "grand_total": from_minor(grand_total_minor),
+    }
+    return parts, labor, totals
+
+
+def _group_sum(keys, amounts):
+    """Sum int64 amounts per key; returns {key: total} in key order."""
+    import numpy as np
+
+    if not keys:
+        return {}
+    labels, inverse = np.unique(np.asarray(keys, dtype=object), return_inverse=True)
+    sums = np.zeros(len(labels), dtype=np.int64)
+    np.add.at(sums, inverse, np.asarray(amounts, dtype=np.int64))
+    return {label: int(total) for label, total in zip(labels, sums)}
+
+
+def aggregate_revenue(start=None, end=None):
+    """Revenue by month, by customer and by labour type over service reports.
+
+    One projected scan feeds all three breakdowns. Reports saved before
+    minor units were stored fall back to their float totals.
+
+    Args:
+        start: Optional first service date (datetime, inclusive)
+        end: Optional last service date (datetime, exclusive)
+
+    Returns:
+        Dict with "by_month" ({"YYYY-MM": {"parts", "labor", "total", "reports"}}),
+        "by_customer" ({customer_id: {"name", "total", "reports"}}),
+        "by_labor_type" ({type: total}) and "total", amounts in minor units
+    """
+    query = {}
+    if start or end:
+        query["service_date"] = {}
+        if start:
+            query["service_date"]["$gte"] = start
+        if end:
+            query["service_date"]["$lt"] = end
+
+    months, customer_ids, parts, labor = [], [], [], []
+    customer_names = {}
+    labor_types, labor_amounts = [], []
+    for report in service_reports.find(query, AGGREGATE_PROJECTION):
+        service_date = report.get("service_date")
+        months.append(service_date.strftime("%Y-%m") if isinstance(service_date, datetime.date) else "unknown")
+        customer_id = report.get("customer_id") or "unknown"
+        customer_ids.append(customer_id)
+        customer_names.setdefault(customer_id, report.get("customer_name", ""))
+
+        parts_minor = report.get("total_parts_minor")
+        parts.append(parts_minor if parts_minor is not None else to_minor(report.get("total_parts_cost")))
+        labor_minor = report.get("total_labor_minor")
+        labor.append(labor_minor if labor_minor is not None else to_minor(report.get("total_labor_cost")))
+
+        for entry in report.get("labor_costs") or []:
+            if not entry:
+                continue
+            labor_types.append(entry.get("type") or "Unspecified")
+            line_minor = entry.get("total_cost_minor")
+            labor_amounts.append(line_minor if line_minor is not None else to_minor(entry.get("total_cost")))
+
+    import numpy as np
+
+    parts = np.asarray(parts, dtype=np.int64)
+    labor = np.asarray(labor, dtype=np.int64)
+    totals = parts + labor
+
+    by_month = {}
+    month_parts = _group_sum(months, parts)
+    month_labor = _group_sum(months, labor)
+    month_reports = _group_sum(months, np.ones(len(months), dtype=np.int64))
+    for month in month_parts:
+        by_month[month] = {
+            "parts": month_parts[month],
+            "labor": month_labor[month],
+            "total": month_parts[month] + month_labor[month],
+            "reports": month_reports[month],
+        }
+
+    customer_totals = _group_sum(customer_ids, totals)
+    customer_reports = _group_sum(customer_ids, np.ones(len(customer_ids), dtype=np.int64))
+    by_customer = {
+        customer_id: {"name": customer_names.get(customer_id, ""), "total": total,
+                      "reports": customer_reports[customer_id]}
+        for customer_id, total in sorted(customer_totals.items(), key=lambda item: item[1], reverse=True)
+    }
+
+    return {
+        "by_month": by_month,
+        "by_customer": by_customer,
+        "by_labor_type": _group_sum(labor_types, labor_amounts),
+        "total": int(totals.sum()),
+    }
@@ -1,9 +1,9 @@
 import streamlit as st
 import datetime
 import time
-import threading
-import pymongo
 from database.connection import db
+from database import writeback
+from utils import metrics
 
 # Function to navigate between pages
 def navigate_to_page(page_name: str):
@@ -11,16 +11,32 @@ def navigate_to_page(page_name: str):
     st.session_state.page = page_name
 
 # Autosave functionality
-def reset_autosave_timer(callback, *args, **kwargs):
-    """Reset the autosave timer."""
-    if "autosave_timer" in st.session_state and st.session_state.autosave_timer:
-        st.session_state.autosave_timer.cancel()
+def autosave(name, snapshot, callback, *args, **kwargs):
+    """Save a form when its values changed since the last rerun.
     
-    # Set a shorter timer for faster saving (1 second)
-    st.session_state.autosave_timer = threading.Timer(1.0, callback, args=args, kwargs=kwargs)
-    st.session_state.autosave_timer.daemon = True
-    st.session_state.autosave_timer.start()
+    Runs in the script thread, so the callback can read the session and
+    widgets; callbacks journal their write (database/writeback.py), so this
+    costs a local fsync, not a database round trip. The first snapshot of a
+    form in a session is its baseline and is not saved.
+    
+    Args:
+        name: Form and record the snapshot belongs to (e.g. "service_report/<customer_id>")
+        snapshot: Comparable copy of the form's values
+        callback: Saves the form
+    """
+    snapshots = st.session_state.setdefault("autosave_snapshots", {})
+    changed = name in snapshots and snapshots[name] != snapshot
+    snapshots[name] = snapshot
+    if not changed:
+        return
+    callback_name = getattr(callback, "__name__", "autosave")
+    metrics.autosave_runs.inc(callback=callback_name)
     st.session_state.last_input_time = time.time()
+    try:
+        callback(*args, **kwargs)
+    except Exception:
+        metrics.autosave_failures.inc(callback=callback_name)
+        raise
 
 def generate_sequential_code(prefix: str) -> str:
     """Generate a sequential code with format PREFIX-YYYYMMDD-XXXX."""
@@ -30,7 +46,7 @@ def generate_sequential_code(prefix: str) -> str:
     regex_pattern = f"^{prefix}-{today}-"
     highest_doc = db[f"{prefix.lower()}s"].find_one(
         {"code": {"$regex": regex_pattern}},
-        sort=[("code", pymongo.DESCENDING)]
+        sort=[("code", -1)]  # Descending
     )
     
     if highest_doc:
@@ -55,6 +71,43 @@ def calculate_workflow_progress(status: dict) -> float:
     ])
     return (completed_steps / 4) * 100
 
+# Build the dashboard table rows
+def build_dashboard_rows(customer_docs) -> list:
+    """Build one dashboard row per customer document.
+
+    Args:
+        customer_docs: Iterable of customer documents
+
+    Returns:
+        List of row dicts for the Client Overview dataframe
+    """
+    dashboard_data = []
+    for cust in customer_docs:
+        # Calculate completion percentage
+        status = cust.get('status', {})
+        completion_percentage = calculate_workflow_progress(status)
+
+        dashboard_data.append({
+            "Company": cust.get('name', ''),
+            "Contact": cust.get('contact_name', ''),
+            "# Machines": cust.get('machine_count', 0),
+            "Vendor": "✓" if status.get('vendor_registered', False) else "❌",
+            "MRN": f"✓ ({cust.get('mrn_code', '')})" if status.get('mrn_created', False) else "❌",
+            "SR": f"✓ ({cust.get('sr_code', '')})" if status.get('service_report_created', False) else "❌",
+            "Telecontroller": "✓" if status.get('telecontroller_done', False) else "❌",
+            "Completion": f"{completion_percentage:.0f}%",
+            "Actions": "🔍📝",  # Edit/View action icons
+            "_id": str(cust.get('_id', ''))
+        })
+    return dashboard_data
+
+# Search machines by serial number
+def find_customer_ids_by_serial(serial_search: str) -> list:
+    """Return the customer IDs of MRNs whose serial number matches a pattern (case-insensitive)."""
+    from database.connection import mrns
+    matching_mrns = mrns.find({"serial_no": {"$regex": serial_search, "$options": "i"}}, {"customer_id": 1})
+    return [mrn.get("customer_id") for mrn in matching_mrns]
+
 # Create a horizontal workflow progress bar
 def create_workflow_steps_indicator(current_step):
     """Create a horizontal workflow steps indicator."""
@@ -127,16 +180,12 @@ def init_session_state():
     if "sr_code" not in st.session_state:
         st.session_state.sr_code = None
     
-    if "autosave_timer" not in st.session_state:
-        st.session_state.autosave_timer = None
-    
     if "last_input_time" not in st.session_state:
         st.session_state.last_input_time = time.time()
 
-# Handle cleanup of timer when app reruns
+# Flush journaled writes to disk when the process exits
 def cleanup():
-    if hasattr(st.session_state, 'autosave_timer') and st.session_state.autosave_timer:
-        st.session_state.autosave_timer.cancel()
+    writeback.close()
 
 # Create sidebar menu
 def create_sidebar():
@@ -162,34 +211,12 @@ def create_sidebar():
             st.rerun()
         
         if st.button("🆕 New Service Visit", use_container_width=True):
-            import datetime
-            from database.connection import customers
-            
-            # Reset session state for a new customer
+            # Reset session state for a new customer; the record is created
+            # by its first valid save on the CRM entry page
             st.session_state.customer_id = None
             st.session_state.mrn_code = None
             st.session_state.sr_code = None
             
-            # Create a temporary customer record to ensure we have an ID
-            temp_customer_data = {
-                "name": "New Customer",
-                "contact_name": "",
-                "contact_phone": "",
-                "machine_count": 0,
-                "created_at": datetime.datetime.now(),
-                "is_temporary": True,  # Flag to identify this as a new record
-                "status": {
-                    "vendor_registered": False,
-                    "mrn_created": False,
-                    "service_report_created": False,
-                    "telecontroller_done": False
-                }
-            }
-            
-            # Insert the temporary customer and store the ID
-            result = customers.insert_one(temp_customer_data)
-            st.session_state.customer_id = str(result.inserted_id)
-            
             # Reset any form input values that might be in session state
             if "company_name" in st.session_state:
                 del st.session_state.company_name
@@ -202,7 +229,6 @@ def create_sidebar():
                 
             # Navigate to the CRM entry page
             navigate_to_page("crm_entry")
-            st.toast("New customer record created. Please fill in the details.", icon="✅")
             st.rerun()
             
             # Show success message
@@ -211,6 +237,30 @@ def create_sidebar():
             navigate_to_page("crm_entry")
             st.rerun()
         
+        if st.button("🔎 Job Search", use_container_width=True):
+            navigate_to_page("search")
+            st.rerun()
+        
+        if st.button("📈 Analytics", use_container_width=True):
+            navigate_to_page("analytics")
+            st.rerun()
+        
+        if st.button("🐢 Query Stats", use_container_width=True):
+            navigate_to_page("query_stats")
+            st.rerun()
+
+        # Saved changes still waiting in the local journal
+        sync = writeback.status()
+        if sync["error"]:
+            st.error(f"Database unreachable since {sync['failing_since']:%H:%M}. "
+                     f"{sync['pending']} saved change(s) are kept on this server and will sync automatically.")
+        elif sync["pending"]:
+            st.info(f"Syncing {sync['pending']} saved change(s)...")
+        else:
+            st.caption("✅ All changes saved")
+        if sync["rejected"]:
+            st.warning(f"{sync['rejected']} change(s) could not be saved; see {writeback.REJECTED} in the journal.")
+
         # Display current workflow progress if in a workflow
         if st.session_state.customer_id:
             from database.connection import customers
@@ -302,6 +352,7 @@ def create_audit_log(collection_name, document_id, action, changed_fields=None,
     
     # Insert into audit collection
     db.audit_logs.insert_one(audit_entry)
+    metrics.audit_inserts.inc(collection=collection_name)
     
 def create_document_version(collection_name, document_id, document_data):
     """Create a version record of a document at a point in time.
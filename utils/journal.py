@@ -0,0 +1,201 @@
+# Append-only on-disk journal of pending writes
+#
+# Records are JSON lines {"seq": n, "record": ...} in segment files named
+# by the sequence number of their first record (000000000001.log, ...); a
+# segment is closed and a new one started once it passes segment_bytes.
+# append() returns once its record is on disk. Appenders that arrive while
+# an fsync runs are covered together by the next one (group commit), so a
+# burst of saves from many sessions costs a few fsyncs, not one each.
+#
+# The consumer takes records from pending() in order and acknowledges them
+# with commit(seq). The last committed sequence number is kept in the
+# checkpoint file, and segments holding only committed records are deleted.
+# The checkpoint is not fsynced: after a crash the last few records may be
+# handed out again, so consumers must be idempotent. A torn last line left
+# by a crash mid-append is cut off when the journal is opened. Only one
+# process may use a directory at a time; lock_directory() enforces that.
+import collections
+import json
+import os
+import threading
+
+# Size after which the current segment is closed
+SEGMENT_BYTES = 1 << 20
+
+CHECKPOINT = "checkpoint"
+LOCK = "lock"
+_SUFFIX = ".log"
+
+
+def _fsync_directory(directory):
+    # Makes new and deleted segment names durable (not supported on Windows)
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def lock_directory(directory):
+    """Take the directory's lock file for this process.
+
+    Returns:
+        The open lock file (keep it for as long as the directory is used),
+        or None when another process holds the lock
+    """
+    os.makedirs(directory, exist_ok=True)
+    lock = open(os.path.join(directory, LOCK), "a")
+    try:
+        import fcntl
+    except ImportError:
+        # No advisory locks (Windows): one process per directory is up to the deployment
+        return lock
+    try:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+class Journal:
+    """Append-only journal in one directory (one Journal per directory per process)."""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, dumps=json.dumps, loads=json.loads):
+        """Open or create the journal; records after the checkpoint become pending.
+
+        Args:
+            directory: Journal directory, created if missing
+            segment_bytes: Size after which a segment is rotated
+            dumps, loads: Record codec (one line of text per record)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._dumps = dumps
+        self._loads = loads
+        self._lock = threading.Lock()       # appends, rotation and the pending queue
+        self._sync_lock = threading.Lock()  # one fsync at a time
+        self._file = None
+        self._pending = collections.deque()
+        self.committed = self._read_checkpoint()
+        self.last_seq = self.committed
+        self.synced_seq = self.committed
+        self._load()
+        self.synced_seq = self.last_seq
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _segments(self):
+        """Segment file names, oldest first."""
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(_SUFFIX))
+
+    def _read_checkpoint(self):
+        try:
+            with open(self._path(CHECKPOINT)) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _load(self):
+        """Read the segments into the pending queue, cutting off a torn last line."""
+        segments = self._segments()
+        for name in segments:
+            good = 0
+            with open(self._path(name), "rb") as f:
+                for line in f:
+                    try:
+                        entry = self._loads(line.decode("utf-8"))
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    good += len(line)
+                    self.last_seq = max(self.last_seq, entry["seq"])
+                    if entry["seq"] > self.committed:
+                        self._pending.append((entry["seq"], entry["record"]))
+            if good < os.path.getsize(self._path(name)):
+                with open(self._path(name), "r+b") as f:
+                    f.truncate(good)
+                    os.fsync(f.fileno())
+        if segments:
+            self._file = open(self._path(segments[-1]), "a", encoding="utf-8")
+
+    def _rotate(self, first_seq):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._file = open(self._path(f"{first_seq:012d}{_SUFFIX}"), "a", encoding="utf-8")
+        _fsync_directory(self.directory)
+
+    def append(self, record):
+        """Write one record and return its sequence number once it is on disk."""
+        with self._lock:
+            seq = self.last_seq + 1
+            line = self._dumps({"seq": seq, "record": record})
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._rotate(seq)
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.last_seq = seq
+            self._pending.append((seq, record))
+        self._sync(seq)
+        return seq
+
+    def _sync(self, seq):
+        with self._sync_lock:
+            # An fsync started after our write already covered it
+            if self.synced_seq >= seq:
+                return
+            with self._lock:
+                target = self.last_seq
+                # A duplicate descriptor stays valid if the segment is rotated meanwhile
+                fd = os.dup(self._file.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.synced_seq = target
+
+    def pending(self):
+        """Uncommitted (seq, record) pairs, oldest first."""
+        with self._lock:
+            return list(self._pending)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def commit(self, seq):
+        """Acknowledge every record up to `seq` and drop segments that are fully committed."""
+        with self._lock:
+            while self._pending and self._pending[0][0] <= seq:
+                self._pending.popleft()
+            self.committed = max(self.committed, seq)
+            current = os.path.basename(self._file.name) if self._file is not None else None
+        temporary = self._path(CHECKPOINT + ".tmp")
+        with open(temporary, "w") as f:
+            f.write(str(self.committed))
+        os.replace(temporary, self._path(CHECKPOINT))
+
+        # A segment is done when the next one starts at or below the checkpoint + 1
+        segments = self._segments()
+        for name, following in zip(segments, segments[1:]):
+            if name != current and int(following[:-len(_SUFFIX)]) <= self.committed + 1:
+                os.remove(self._path(name))
+
+    def close(self):
+        """Flush and close the current segment."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
@@ -0,0 +1,322 @@
+# In-process metrics registry with a Prometheus text exporter
+import os
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Port for the /metrics endpoint ("0" or empty disables the exporter)
+METRICS_PORT = os.environ.get("METRICS_PORT", "9464")
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class for a named metric family with optional labels.
+
+    Each metric owns one lock that is held only for a dict update, so
+    recording a value costs a few hundred nanoseconds even under contention.
+    """
+
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if not self.labelnames:
+            return ()
+        return tuple([labels.get(name, "") for name in self.labelnames])
+
+    def labels(self, **labels):
+        """Return a handle bound to one label set, for hot paths that record repeatedly."""
+        return _Bound(self, self._key(labels))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    """A monotonically increasing value."""
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        self._inc_key(self._key(labels), amount)
+
+    def _inc_key(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, or be read from a callback."""
+
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        self._inc_key(self._key(labels), amount)
+
+    def _inc_key(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Read the (unlabelled) value from `function` at scrape time."""
+        self._function = function
+
+    def value(self, **labels):
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        if self._function is None:
+            return super().render()
+        try:
+            value = self._function()
+        except Exception:
+            value = float("nan")
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram(_Metric):
+    """Bucketed observations (cumulative buckets are built at scrape time)."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        self._observe_key(self._key(labels), value)
+
+    def _observe_key(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [per-bucket counts..., +Inf count, sum]
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        """Context manager that observes the elapsed wall time in seconds."""
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Bound:
+    """A metric with its label values resolved once."""
+
+    __slots__ = ("metric", "key")
+
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount=1):
+        self.metric._inc_key(self.key, amount)
+
+    def dec(self, amount=1):
+        self.metric._inc_key(self.key, -amount)
+
+    def observe(self, value):
+        self.metric._observe_key(self.key, value)
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Collection of metric families rendered together."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            # Re-registering (e.g. on a Streamlit module reload) returns the existing metric
+            if name in self._metrics:
+                return self._metrics[name]
+            metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry
+REGISTRY = MetricsRegistry()
+
+# Application metrics
+page_rerun_seconds = REGISTRY.histogram(
+    "app_page_rerun_seconds", "Script rerun duration per page", ("page",))
+mongo_pool_checkout_seconds = REGISTRY.histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting to check a connection out of the pool",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+mongo_pool_checked_out = REGISTRY.gauge(
+    "mongo_pool_checked_out_connections", "Connections currently checked out of the pool")
+mongo_pool_checkout_failures = REGISTRY.counter(
+    "mongo_pool_checkout_failures_total", "Connection checkouts that failed", ("reason",))
+autosave_runs = REGISTRY.counter(
+    "app_autosave_runs_total", "Changed forms saved by autosave", ("callback",))
+autosave_failures = REGISTRY.counter(
+    "app_autosave_failures_total", "Autosave callbacks that raised", ("callback",))
+journal_pending = REGISTRY.gauge(
+    "app_journal_pending_writes", "Journaled writes not yet applied to the database")
+journal_retries = REGISTRY.counter(
+    "app_journal_retries_total", "Journaled writes retried after a connection error", ("kind",))
+journal_rejected = REGISTRY.counter(
+    "app_journal_rejected_total", "Journaled writes set aside after a non-connection error", ("kind",))
+session_checkpoints = REGISTRY.counter(
+    "app_session_checkpoints_total", "Workflow contexts written to the session store")
+session_checkpoint_failures = REGISTRY.counter(
+    "app_session_checkpoint_failures_total", "Session store writes that raised")
+session_restores = REGISTRY.counter(
+    "app_session_restores_total", "Sessions resumed from the session store")
+audit_inserts = REGISTRY.counter(
+    "app_audit_log_inserts_total", "Audit log entries written", ("collection",))
+gridfs_bytes = REGISTRY.counter(
+    "app_gridfs_bytes_total", "Bytes stored in GridFS")
+cache_requests = REGISTRY.counter(
+    "app_cache_requests_total", "Cache lookups by cache name and result (hit/shared_hit/miss)", ("cache", "result"))
+local_cache_bytes = REGISTRY.gauge(
+    "app_local_cache_bytes", "Pickled size of the values in this process's L1 cache")
+sync_push_edits = REGISTRY.counter(
+    "app_sync_push_edits_total", "Client edits received by sync push, by result", ("status",))
+api_request_seconds = REGISTRY.histogram(
+    "api_request_seconds", "HTTP API request duration by route and status", ("route", "status"))
+
+
+def record_cache_lookup(cache, hit):
+    """Count a cache lookup; the hit ratio is hits / (hits + misses), plus shared_hit for two-level caches."""
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; keep the Streamlit console quiet
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None):
+    """Serve /metrics from a daemon thread (once per process).
+
+    Args:
+        port: Port to listen on, defaults to METRICS_PORT
+
+    Returns:
+        The HTTP server, or None if the exporter is disabled or the port is taken
+    """
+    global _server
+    port = int(port if port is not None else (METRICS_PORT or 0))
+    if not port:
+        return None
+    with _server_lock:
+        if _server is not None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError:
+            # Another process on this host already exports on this port
+            return None
+        _server.daemon_threads = True
+        thread = threading.Thread(target=_server.serve_forever, name="metrics-exporter", daemon=True)
+        thread.start()
+        return _server
@@ -0,0 +1,100 @@
+# Machine reliability by model from service report history
+#
+# tools/reliability.py keeps every machine's visit history (service day,
+# running hours, fault category) and recomputes the models it touched with
+# model_reliability(). That function is plain data in, plain data out, so
+# the job can hand one model to each worker process.
+import re
+
+from database.connection import db
+
+# Fault categories by keyword in `reported_fault`, first match wins
+FAULT_CATEGORIES = (
+    ("Arc / ignition", ("arc", "ignit", "spark")),
+    ("Wire feed", ("wire", "feed", "liner", "drive roll")),
+    ("Gas", ("gas", "porosity", "solenoid")),
+    ("Overheating", ("overheat", "heat", "thermal", "fan", "burn", "smell")),
+    ("Display / controls", ("display", "screen", "button", "knob", "panel", "control")),
+    ("Power / electrical", ("breaker", "trip", "power", "fuse", "short", "output", "voltage")),
+)
+
+# Category of faults matching no keyword
+OTHER_FAULT = "Other"
+
+# Days within which a second visit to the same machine counts as a repeat
+DEFAULT_REPEAT_DAYS = 30
+
+# Fault categories listed per model
+TOP_FAULTS = 3
+
+_WORD = re.compile(r"[a-z]+")
+
+
+def fault_category(fault):
+    """Category of a reported fault ("Wire feed erratic" -> "Wire feed")."""
+    text = " ".join(_WORD.findall(str(fault or "").lower()))
+    for category, keywords in FAULT_CATEGORIES:
+        if any(keyword in text for keyword in keywords):
+            return category
+    return OTHER_FAULT
+
+
+def model_reliability(model, histories, repeat_days=DEFAULT_REPEAT_DAYS):
+    """Reliability numbers of one model from its machines' visit histories.
+
+    A visit is a service report. Consecutive visits of the same machine
+    give one inter-failure interval in days and, when the running hours
+    grew, one in running hours; MTBF is the mean interval. A visit within
+    `repeat_days` of the machine's previous visit is a repeat.
+
+    Args:
+        model: Model name (returned as _id)
+        histories: [{"days": [days since 1970], "hours": [running hours or None],
+            "categories": [fault category]}], one per machine
+        repeat_days: Repeat-visit window
+
+    Returns:
+        Dict with "_id", "machines", "reports", "intervals", "mtbf_days",
+        "mtbf_hours" (None without intervals), "repeats", "repeat_rate",
+        "repeat_days" and "top_faults" ([{"category", "count"}])
+    """
+    import numpy as np
+
+    lengths = np.array([len(history["days"]) for history in histories], dtype=np.int64)
+    machine = np.repeat(np.arange(len(histories)), lengths)
+    days = np.array([day for history in histories for day in history["days"]], dtype=np.int64)
+    hours = np.array([np.nan if value is None else value for history in histories for value in history["hours"]],
+                     dtype=np.float64)
+    categories = np.array([category for history in histories for category in history["categories"]], dtype=object)
+
+    # Visits of each machine in time order; neighbours on the same machine give the intervals
+    order = np.lexsort((days, machine))
+    machine, days, hours = machine[order], days[order], hours[order]
+    same_machine = machine[1:] == machine[:-1]
+    day_gaps = np.diff(days)[same_machine]
+    hour_gaps = np.diff(hours)[same_machine]
+    hour_gaps = hour_gaps[np.isfinite(hour_gaps) & (hour_gaps > 0)]
+    repeats = int((day_gaps <= repeat_days).sum())
+
+    ranked = []
+    if categories.size:
+        names, counts = np.unique(categories, return_counts=True)
+        ranked = sorted(zip(names.tolist(), counts.tolist()), key=lambda item: (-item[1], item[0]))
+    reports = int(lengths.sum())
+    return {
+        "_id": model,
+        "machines": len(histories),
+        "reports": reports,
+        "intervals": int(day_gaps.size),
+        "mtbf_days": float(day_gaps.mean()) if day_gaps.size else None,
+        "mtbf_hours": float(hour_gaps.mean()) if hour_gaps.size else None,
+        "repeats": repeats,
+        "repeat_rate": repeats / reports if reports else None,
+        "repeat_days": repeat_days,
+        "top_faults": [{"category": name, "count": count} for name, count in ranked[:TOP_FAULTS]],
+    }
+
+
+def load_reliability():
+    """Per-model results of the last reliability run, most reports first."""
+    return list(db.reliability.find({}).sort([("reports", -1), ("_id", 1)]))
@@ -0,0 +1,187 @@
+# Workflow context shared between app processes
+#
+# The workflow context (WORKFLOW_KEYS: current page, customer, MRN and SR
+# codes, ...) is checkpointed to a shared store at the end of every rerun
+# that changed it, keyed by a session token kept in the page URL
+# (?session=...). When a browser reconnects to another process behind the
+# load balancer, its first rerun there restores the context from the store,
+# so any process can serve any session. Form contents are not part of it:
+# they are autosaved (CRM entry, service report) or kept as drafts (MRN),
+# and the pages reload them from the database.
+#
+# SESSION_STORE picks the store: "mongo" (default; the sessions collection,
+# expired by a TTL index) or "sqlite:///path/sessions.db" for processes on
+# one host without a shared MongoDB (e.g. the embedded backend).
+import os
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+from utils import metrics
+
+SESSION_STORE = os.environ.get("SESSION_STORE", "mongo")
+
+# Hours a session is kept after its last change
+SESSION_TTL_HOURS = int(os.environ.get("SESSION_TTL_HOURS", "72"))
+
+# URL query parameter holding the session token
+TOKEN_PARAM = "session"
+
+# Session state keys checkpointed to the store (JSON/BSON-serializable values only)
+WORKFLOW_KEYS = (
+    "page",
+    "customer_id",
+    "view_customer_id",
+    "customer_view_mode",
+    "mrn_code",
+    "sr_code",
+    "search_page",
+    "sr_pending_reports",
+)
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _dumps(value):
+    from bson import json_util
+    return json_util.dumps(value, json_options=json_util.RELAXED_JSON_OPTIONS, sort_keys=True)
+
+
+def _loads(text):
+    from bson import json_util
+    return json_util.loads(text)
+
+
+class MongoStore:
+    """Sessions in the sessions collection: {_id: token, state: JSON text, updated_at}."""
+
+    def __init__(self):
+        from database.connection import db
+
+        self.collection = db.sessions
+        self.collection.create_index("updated_at", expireAfterSeconds=SESSION_TTL_HOURS * 3600)
+
+    def load(self, token):
+        import datetime
+
+        cutoff = datetime.datetime.now() - datetime.timedelta(hours=SESSION_TTL_HOURS)
+        row = self.collection.find_one({"_id": token, "updated_at": {"$gte": cutoff}}, {"state": 1})
+        return row["state"] if row else None
+
+    def save(self, token, state):
+        import datetime
+
+        self.collection.update_one({"_id": token},
+                                   {"$set": {"state": state, "updated_at": datetime.datetime.now()}},
+                                   upsert=True)
+
+
+class SQLiteStore:
+    """Sessions in a SQLite file shared by the processes of one host (WAL mode)."""
+
+    def __init__(self, path):
+        import sqlite3
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Script threads differ between reruns, so one connection is shared under a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS sessions "
+                                 "(token TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        # No TTL index here; expired sessions are dropped when a process opens the store
+        self._connection.execute("DELETE FROM sessions WHERE updated_at < ?",
+                                 (time.time() - SESSION_TTL_HOURS * 3600,))
+
+    def load(self, token):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT state FROM sessions WHERE token = ? AND updated_at >= ?",
+                (token, time.time() - SESSION_TTL_HOURS * 3600)).fetchone()
+        return row[0] if row else None
+
+    def save(self, token, state):
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO sessions (token, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(token) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (token, state, time.time()))
+
+
+def get_store():
+    """The process-wide session store selected by SESSION_STORE."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SESSION_STORE.startswith("sqlite://"):
+                _store = SQLiteStore(SESSION_STORE[len("sqlite://"):])
+            elif SESSION_STORE == "mongo":
+                _store = MongoStore()
+            else:
+                raise ValueError(f"Unknown SESSION_STORE: {SESSION_STORE!r}")
+        return _store
+
+
+def _snapshot():
+    """The workflow context of this session, serialized."""
+    return _dumps({key: st.session_state[key] for key in WORKFLOW_KEYS if key in st.session_state})
+
+
+def restore():
+    """Resume the session named in the URL on its first rerun in this process.
+
+    A browser without a token gets a new one in its URL. Call before
+    init_session_state(), which then only fills in what was not restored.
+    """
+    if "session_token" in st.session_state:
+        return
+    token = st.query_params.get(TOKEN_PARAM)
+    state = None
+    if token:
+        try:
+            state = get_store().load(token)
+        except Exception:
+            # Without the store the session starts over on this process
+            metrics.session_checkpoint_failures.inc()
+    if state is None:
+        if not token:
+            token = uuid.uuid4().hex
+            st.query_params[TOKEN_PARAM] = token
+        st.session_state.session_checkpoint = None
+    else:
+        for key, value in _loads(state).items():
+            if key in WORKFLOW_KEYS:
+                st.session_state[key] = value
+        st.session_state.session_checkpoint = state
+        metrics.session_restores.inc()
+    st.session_state.session_token = token
+
+
+def checkpoint():
+    """Write the workflow context to the store if this rerun changed it."""
+    token = st.session_state.get("session_token")
+    if not token:
+        return
+    state = _snapshot()
+    if st.session_state.get("session_checkpoint") is None:
+        # A new session's first context is the defaults any process starts
+        # with, so it is not written (a first paint does not touch the store)
+        st.session_state.session_checkpoint = state
+        return
+    if state == st.session_state.session_checkpoint:
+        return
+    try:
+        get_store().save(token, state)
+    except Exception:
+        # The store being down must not break the page; the next rerun retries
+        metrics.session_checkpoint_failures.inc()
+        return
+    st.session_state.session_checkpoint = state
+    metrics.session_checkpoints.inc()
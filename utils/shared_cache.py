@@ -0,0 +1,212 @@
+# Two-level cache shared between the app processes of one host
+#
+# L1 is a per-process LRU of live objects, so a repeated read is a dict
+# lookup. L2 is a SQLite file in WAL mode (SHARED_CACHE_PATH) holding the
+# pickled values, so a value computed by one worker process is a file read
+# away for the others. Both levels are bounded by a byte budget (the pickled
+# size) and evict least recently used entries.
+#
+# Entries are stored with the version of the data they were computed from
+# and only returned while the caller passes the same version. Versions are
+# either data versions the caller already has (rollups.data_version()) or
+# write versions: counters in the same file that the write paths bump
+# (bump("customers")), so a write on any process invalidates what every
+# process cached from the old data. Writers on other hosts do not bump them;
+# L2 assumes the processes of one host are the only writers.
+#
+# L2 is off when SHARED_CACHE_PATH is empty and on the embedded backend,
+# whose data is private to each process. L1 values are shared objects:
+# callers must copy before mutating them.
+import collections
+import os
+import pickle
+import threading
+import time
+
+from utils import metrics
+
+SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH", os.path.join(".cache", "shared_cache.db"))
+
+# Byte budgets of the shared file and of each process's L1
+SHARED_CACHE_BYTES = int(os.environ.get("SHARED_CACHE_BYTES", str(256 << 20)))
+LOCAL_CACHE_BYTES = int(os.environ.get("LOCAL_CACHE_BYTES", str(64 << 20)))
+
+# Write version of the customers collection
+CUSTOMERS = "customers"
+
+# Seconds between access-time updates of one L2 entry (reads would otherwise all write)
+TOUCH_SECONDS = 30.0
+
+_lock = threading.Lock()
+_local = collections.OrderedDict()     # "namespace/key" -> (version, value, size)
+_local_bytes = 0
+_local_versions = {}                   # write versions while L2 is off
+_l2 = None
+_l2_checked = False
+
+
+class SharedStore:
+    """The L2 file: pickled entries with their version, and the write versions."""
+
+    def __init__(self, path, budget):
+        import sqlite3
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # A cache loses nothing it cannot recompute if the last commits are lost
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, version TEXT NOT NULL, "
+                                 "value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        self._touched = {}
+
+    def get(self, key, version):
+        """The pickled value stored under `key` for `version`, or None."""
+        with self._lock:
+            row = self._connection.execute("SELECT version, value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] != version:
+                return None
+            now = time.time()
+            if now - self._touched.get(key, 0) > TOUCH_SECONDS:
+                self._touched[key] = now
+                self._connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return row[1]
+
+    def put(self, key, version, blob):
+        """Store a pickled value, evicting least recently used entries over the budget."""
+        if len(blob) > self.budget:
+            return
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "INSERT INTO entries (key, version, value, size, accessed) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET version = excluded.version, value = excluded.value, "
+                    "size = excluded.size, accessed = excluded.accessed",
+                    (key, version, blob, len(blob), time.time()))
+                total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.budget:
+                    evicted = []
+                    for old_key, size in self._connection.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                        if total <= self.budget:
+                            break
+                        evicted.append((old_key,))
+                        total -= size
+                    self._connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def version(self, name):
+        with self._lock:
+            row = self._connection.execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, name):
+        with self._lock:
+            self._connection.execute("INSERT INTO versions (name, version) VALUES (?, 1) "
+                                     "ON CONFLICT(name) DO UPDATE SET version = version + 1", (name,))
+
+
+def _shared():
+    """The L2 store, or None when it is off."""
+    global _l2, _l2_checked
+    if not _l2_checked:
+        with _lock:
+            if not _l2_checked:
+                if SHARED_CACHE_PATH:
+                    from database.connection import get_client
+                    # The embedded backend's data is private to each process
+                    if not get_client().__class__.__module__.startswith("mongomock"):
+                        _l2 = SharedStore(SHARED_CACHE_PATH, SHARED_CACHE_BYTES)
+                _l2_checked = True
+    return _l2
+
+
+def version(name):
+    """Current write version of a data set (e.g. "customers")."""
+    store = _shared()
+    if store is None:
+        return _local_versions.get(name, 0)
+    return store.version(name)
+
+
+def bump(name):
+    """Invalidate every entry computed from a data set; call after writing to it."""
+    store = _shared()
+    if store is None:
+        with _lock:
+            _local_versions[name] = _local_versions.get(name, 0) + 1
+    else:
+        store.bump(name)
+
+
+def _remember(full_key, version, value, size):
+    global _local_bytes
+    with _lock:
+        previous = _local.pop(full_key, None)
+        if previous is not None:
+            _local_bytes -= previous[2]
+        if size > LOCAL_CACHE_BYTES:
+            return
+        _local[full_key] = (version, value, size)
+        _local_bytes += size
+        while _local_bytes > LOCAL_CACHE_BYTES:
+            _, (_, _, evicted) = _local.popitem(last=False)
+            _local_bytes -= evicted
+
+
+def get_or_compute(namespace, key, compute, version=None, local=True):
+    """A cached value, computed and stored on a miss.
+
+    Args:
+        namespace: Kind of value (also the metrics label), e.g. "dashboard"
+        key: String identifying the value within the namespace
+        compute: Called without arguments on a miss; its result must pickle
+        version: Version of the data the value depends on (anything with a
+            stable repr); entries stored for another version are misses
+        local: Also keep the value in this process's L1 (off for values the
+            caller copies into its own structures anyway)
+
+    Returns:
+        The value; from L1 it is the cached object itself, so do not mutate it
+    """
+    full_key = f"{namespace}/{key}"
+    version = repr(version)
+    if local:
+        with _lock:
+            entry = _local.get(full_key)
+            if entry is not None and entry[0] == version:
+                _local.move_to_end(full_key)
+                metrics.cache_requests.inc(cache=namespace, result="hit")
+                return entry[1]
+
+    store = _shared()
+    blob = store.get(full_key, version) if store is not None else None
+    if blob is not None:
+        value = pickle.loads(blob)
+        metrics.cache_requests.inc(cache=namespace, result="shared_hit")
+    else:
+        value = compute()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if store is not None:
+            store.put(full_key, version, blob)
+        metrics.cache_requests.inc(cache=namespace, result="miss")
+    if local:
+        _remember(full_key, version, value, len(blob))
+    return value
+
+
+def local_bytes():
+    """Bytes (pickled size) held in this process's L1."""
+    return _local_bytes
+
+
+metrics.local_cache_bytes.set_function(local_bytes)